@@ -14,6 +14,55 @@ class Agent:
         4. Try Reasoning Engine (Graph-RAG)
         5. Fallback (if Gemini fails)
         """
+        # 1-3. Enrichment queue, templates, commands
+        routed = self._pre_route(user_input, user_id=user_id, context=context)
+        if routed:
+            return routed
+
+        # 4. Try Reasoning Engine (Graph-RAG)
+        try:
+            from logic.reasoning_engine import ReasoningEngine
+            engine = ReasoningEngine()
+            
+            result = engine.process_query(self._enrich_query(user_input, context), history=history, image=image)
+            
+            # Result is now a dict { "text": "...", "widget": { ... } }
+            return self._to_payload(result)
+                
+        except Exception as e:
+            print(f"Gemini Unavailable ({e}).")
+            return self._unavailable_payload(e)
+
+    def stream_input(self, user_input, user_id=None, image=None, context=None, history=None):
+        """
+        Streaming counterpart of process_input.
+        Yields (event, data) tuples from the ReasoningEngine and finishes with
+        ("final", payload) where payload has the same shape process_input returns.
+        """
+        routed = self._pre_route(user_input, user_id=user_id, context=context)
+        if routed:
+            yield "final", routed
+            return
+
+        try:
+            from logic.reasoning_engine import ReasoningEngine
+            engine = ReasoningEngine()
+            
+            result = {"text": "", "widget": None}
+            for event, data in engine.stream_query(self._enrich_query(user_input, context), history=history, image=image):
+                if event == "widget":
+                    result["widget"] = data
+                elif event == "done":
+                    result["text"] = data["text"] or "I'm not sure."
+                else:
+                    yield event, data
+            
+            yield "final", self._to_payload(result)
+        except Exception as e:
+            print(f"Gemini Unavailable ({e}).")
+            yield "final", self._unavailable_payload(e)
+
+    def _pre_route(self, user_input, user_id=None, context=None):
         user_input_lower = user_input.lower()
 
         # 1. Check enrichment queue (conversational tagging)
@@ -30,40 +79,35 @@ class Agent:
         if self._is_command(user_input_lower):
             return self._handle_backfill_request(user_input_lower)
 
-        # 4. Try Reasoning Engine (Graph-RAG)
-        try:
-            from logic.reasoning_engine import ReasoningEngine
-            engine = ReasoningEngine()
-            
-            # Include context in the query if present
-            if context:
-                enriched_query = f"[Context: {context.get('summary') or context.get('content_text')}] {user_input}"
-                result = engine.process_query(enriched_query, history=history, image=image)
-            else:
-                result = engine.process_query(user_input, history=history, image=image)
-            
-            # Result is now a dict { "text": "...", "widget": { ... } }
-            response_payload = {
-                "type": "chat",
-                "content": result.get("text", "I'm not sure.")
+        return None
+
+    def _enrich_query(self, user_input, context):
+        # Include context in the query if present
+        if context:
+            return f"[Context: {context.get('summary') or context.get('content_text')}] {user_input}"
+        return user_input
+
+    def _to_payload(self, result):
+        response_payload = {
+            "type": "chat",
+            "content": result.get("text", "I'm not sure.")
+        }
+        
+        # Attach widget if present and not 'none'
+        widget = result.get("widget")
+        if widget and widget.get("type") != "none":
+            response_payload["widget"] = {
+                "type": widget["type"],
+                "data": widget["data"]
             }
             
-            # Attach widget if present and not 'none'
-            widget = result.get("widget")
-            if widget and widget.get("type") != "none":
-                response_payload["widget"] = {
-                    "type": widget["type"],
-                    "data": widget["data"]
-                }
-                
-            return response_payload
-                
-        except Exception as e:
-            print(f"Gemini Unavailable ({e}).")
-            return {
-                "type": "chat",
-                "content": f"⚠️ **Gemini Unavailable**\n\nI couldn't connect to the AI brain (Error: {e}).\n\nPlease check your API key or try again later."
-            }
+        return response_payload
+
+    def _unavailable_payload(self, e):
+        return {
+            "type": "chat",
+            "content": f"⚠️ **Gemini Unavailable**\n\nI couldn't connect to the AI brain (Error: {e}).\n\nPlease check your API key or try again later."
+        }
 
     def _is_command(self, text):
         """Check if input is a command."""
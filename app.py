@@ -4,10 +4,10 @@ import os
 import json
 from logic.data_store import save_plaid_token, load_plaid_token, save_json, load_json
 from integrations.plaid_api import fetch_transactions
-from logic.graph_db import GraphManager
+from logic.graph_db import get_graph_manager
 from logic.schema import create_constraints
 from logic.ingestion import sync_calendar_to_graph, sync_transactions_to_graph, run_enrichment
-from logic.sql_engine import init_db, upsert_transaction, upsert_event, get_unsynced_data, mark_as_synced
+from logic.sql_engine import init_db, upsert_transaction, upsert_event, get_unsynced_data
 
 
 
@@ -84,7 +84,7 @@ if 'plaid_access_token' not in st.session_state:
 
 # Initialize Graph Manager
 if 'graph_manager' not in st.session_state:
-    st.session_state.graph_manager = GraphManager()
+    st.session_state.graph_manager = get_graph_manager()
 
 # Initialize Agent
 if "agent" not in st.session_state:
@@ -256,17 +256,11 @@ with st.sidebar:
                 # 2. Load Local Data (from SQLite)
                 local_txns, local_events = get_unsynced_data()
                 
-                # 3. Sync
-                e_count = sync_calendar_to_graph(gm, local_events)
-                t_count = sync_transactions_to_graph(gm, local_txns)
+                # 3. Sync (marks the written rows as synced)
+                e_count = sync_calendar_to_graph(gm, local_events)["rows"]
+                t_count = sync_transactions_to_graph(gm, local_txns)["rows"]
                 
-                # 4. Mark as Synced
-                if local_events:
-                    mark_as_synced("master_events", "event_id", [e['event_id'] for e in local_events])
-                if local_txns:
-                    mark_as_synced("master_transactions", "txn_id", [t['txn_id'] for t in local_txns])
-                
-                # 5. Enrich (Link Context)
+                # 4. Enrich (Link Context)
                 links_count = run_enrichment(gm)
                 
                 st.toast(f"Synced {e_count} Events, {t_count} Txns & Created {links_count} Links! 🚀")
@@ -36,14 +36,78 @@ class ChatResponse(BaseModel):
     data: Optional[Dict[str, Any]] = None
     thread_id: Optional[str] = None
 
+@app.on_event("startup")
+def start_graph_queue():
+    from logic.graph_queue import start_worker
+    start_worker()
+
+@app.on_event("startup")
+def apply_graph_schema():
+    from logic.graph_db import get_graph_manager
+    from logic.schema import ensure_constraints
+    gm = get_graph_manager()
+    if gm.verify_connection():
+        ensure_constraints(gm)
+
+@app.on_event("shutdown")
+def close_graph_driver():
+    from logic.graph_db import close_driver
+    close_driver()
+
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "system": "ContextOS v3.0"}
+    from logic.graph_db import get_graph_health
+    from logic.graph_queue import queue_stats
+    return {"status": "ok", "system": "ContextOS v3.0", "graph": get_graph_health(), "graph_queue": queue_stats()}
+
+async def _read_chat_request(http_request: Request):
+    """
+    /api/chat accepts either JSON (ChatRequest, image as a base64 data URL) or
+    multipart/form-data: message, thread_id, context (JSON string) and image (file part).
+    Returns (ChatRequest, image source) where the image source is the upload's file
+    object, the base64 string, or None.
+    """
+    import json
+    content_type = http_request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await http_request.form()
+        context = form.get("context")
+        request = ChatRequest(
+            message=form.get("message") or "",
+            thread_id=form.get("thread_id") or None,
+            context=json.loads(context) if context else None
+        )
+        upload = form.get("image")
+        return request, (upload.file if hasattr(upload, "file") else None)
+    
+    request = ChatRequest(**(await http_request.json()))
+    return request, request.image
+
+def _prepare_chat_image(source):
+    from logic.image_pipeline import prepare_image, ImageTooLargeError, InvalidImageError
+    if not source:
+        return None
+    try:
+        return prepare_image(source)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/api/chat", response_model=ChatResponse)
-def chat_endpoint(request: ChatRequest, current_user: dict = Depends(get_current_user)):
+async def chat_endpoint(http_request: Request, current_user: dict = Depends(get_current_user)):
+    from fastapi.concurrency import run_in_threadpool
+    try:
+        request, image_source = await _read_chat_request(http_request)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid chat request: {e}")
+    
+    # Decoding / downscaling and the agent itself are blocking; keep them off the event loop
+    image = await run_in_threadpool(_prepare_chat_image, image_source)
+    return await run_in_threadpool(_handle_chat, request, image, current_user['user_id'])
+
+def _handle_chat(request: ChatRequest, image, user_id):
     try:
-        user_id = current_user['user_id']
         from logic.sql_engine import save_message, get_thread_messages, create_thread
         
         # 1. Get or create thread
@@ -65,7 +129,7 @@ def chat_endpoint(request: ChatRequest, current_user: dict = Depends(get_current
         save_message(thread_id, 'user', request.message)
         
         # 4. Process
-        response = agent.process_input(request.message, user_id=user_id, image=request.image, context=context, history=history)
+        response = agent.process_input(request.message, user_id=user_id, image=image, context=context, history=history)
         
         # 5. Normalize response
         if isinstance(response, str):
@@ -84,6 +148,55 @@ def chat_endpoint(request: ChatRequest, current_user: dict = Depends(get_current
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse(event, data):
+    import json
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/api/chat/stream")
+def chat_stream_endpoint(request: ChatRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events version of /api/chat.
+    Streams status events (classified intent, tool running/done), answer tokens,
+    then a final event with the same payload /api/chat returns.
+    """
+    from fastapi.responses import StreamingResponse
+    from logic.sql_engine import save_message, get_thread_messages, create_thread
+    
+    user_id = current_user['user_id']
+    image = _prepare_chat_image(request.image)
+    
+    thread_id = request.thread_id
+    if not thread_id:
+        thread_id = create_thread(user_id)
+    
+    db_history = get_thread_messages(thread_id)
+    history = [{"role": m['role'], "content": m['content']} for m in db_history]
+    
+    save_message(thread_id, 'user', request.message)
+    
+    def event_stream():
+        yield _sse("thread", {"thread_id": thread_id})
+        final = None
+        try:
+            for event, data in agent.stream_input(request.message, user_id=user_id, image=image, context=request.context, history=history):
+                if event == "final":
+                    final = {**data, "thread_id": thread_id}
+                    data = final
+                yield _sse(event, data)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            if final:
+                save_message(thread_id, 'assistant', final.get('content', ''))
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 class CloseThreadRequest(BaseModel):
     thread_id: str
 
@@ -99,7 +212,7 @@ def close_thread_endpoint(req: CloseThreadRequest, background_tasks: BackgroundT
     return {"status": "closing", "message": "Thread summarization started."}
 
 @app.post("/api/sync")
-def sync_endpoint(current_user: dict = Depends(get_current_user)):
+def sync_endpoint(background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)):
     try:
         user_id = current_user['user_id']
         # 1. Sync Plaid
@@ -121,27 +234,35 @@ def sync_endpoint(current_user: dict = Depends(get_current_user)):
         except Exception as e:
             print(f"Auto-enrichment error: {e}")
         
+        # Fold the new rows into the stress -> spending results
+        from logic.causal_engine import run_causal_analysis
+        background_tasks.add_task(run_causal_analysis, [user_id])
+
         # 4. Sync to Graph
-        from logic.graph_db import GraphManager
-        from logic.ingestion import sync_calendar_to_graph, sync_transactions_to_graph, run_enrichment
+        from logic.graph_db import get_graph_manager
+        from logic.ingestion import sync_calendar_to_graph, sync_transactions_to_graph
+        from logic.sql_engine import get_unsynced_data
+        
+        from logic.schema import ensure_constraints
         
-        gm = GraphManager()
+        gm = get_graph_manager()
         if gm.verify_connection():
-            # Sync Events
-            if isinstance(events, list):
-                sync_calendar_to_graph(gm, events)
-            
-            # Sync Transactions
-            if isinstance(txns, list):
-                sync_transactions_to_graph(gm, txns)
+            ensure_constraints(gm)
+            # Everything not yet in the graph: this sync's rows plus any an earlier sync failed to write
+            unsynced_txns, unsynced_events = get_unsynced_data()
+            graph_sync = {
+                "events": sync_calendar_to_graph(gm, unsynced_events),
+                "transactions": sync_transactions_to_graph(gm, unsynced_txns)
+            }
                 
-            # Run Enrichment
-            links_count = run_enrichment(gm)
+            # Day links are written with each node, so only this sync's delta is linked
+            links_count = sum(r["relationships_created"] for r in graph_sync.values())
             
             return {
                 "status": "success", 
                 "transactions_synced": len(txns) if isinstance(txns, list) else 0,
                 "events_synced": len(events) if isinstance(events, list) else 0,
+                "graph_sync": graph_sync,
                 "enrichment_links": links_count,
                 "auto_tagged": auto_tagged,
                 "needs_review": needs_review
@@ -220,8 +341,6 @@ def get_context_rail(background_tasks: BackgroundTasks, current_user: dict = Dep
 # --- Admin Endpoints ---
 
 from logic.sql_engine import get_logs, clear_logs
-from scripts.causal_analysis import analyze_stress_spending
-
 @app.get("/api/logs")
 def logs_endpoint(limit: int = 50, current_user: dict = Depends(get_current_user)):
     try:
@@ -240,11 +359,69 @@ def clear_logs_endpoint(current_user: dict = Depends(get_current_user)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/admin/llm-metrics")
+def llm_metrics_endpoint(hours: int = 24, current_user: dict = Depends(get_current_user)):
+    try:
+        from logic.telemetry import get_llm_metrics_summary
+        from logic.llm_cache import CACHE_STATS
+        summary = get_llm_metrics_summary(hours)
+        summary["cache"] = CACHE_STATS
+        return summary
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/graph-metrics")
+def graph_metrics_endpoint(hours: int = 24, slow_limit: int = 50, current_user: dict = Depends(get_current_user)):
+    try:
+        from logic.graph_db import GRAPH_BACKEND
+        from logic.graph_telemetry import get_graph_metrics_summary
+        from logic.query_cache import QUERY_CACHE_STATS
+        summary = get_graph_metrics_summary(hours, slow_limit)
+        summary["backend"] = GRAPH_BACKEND
+        summary["cache"] = QUERY_CACHE_STATS
+        return summary
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/graph-schema")
+def graph_schema_endpoint(current_user: dict = Depends(get_current_user)):
+    try:
+        from logic.graph_db import get_graph_manager
+        from logic.schema import schema_drift
+        gm = get_graph_manager()
+        if gm.backend != "neo4j" or not gm.driver:
+            return {"backend": gm.backend, "ok": True, "missing": [], "unexpected": [], "not_online": []}
+        return dict(schema_drift(gm), backend=gm.backend)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/llm/cache")
+def llm_cache_stats_endpoint(current_user: dict = Depends(get_current_user)):
+    from logic.llm_cache import CACHE_STATS
+    return CACHE_STATS
+
+@app.post("/api/llm/cache/clear")
+def llm_cache_clear_endpoint(current_user: dict = Depends(get_current_user)):
+    try:
+        from logic.llm_cache import clear
+        clear()
+        return {"status": "success", "message": "LLM cache cleared"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/analysis/causal")
-def causal_analysis_endpoint():
+def causal_analysis_endpoint(background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)):
+    """
+    Returns the stored results instantly and schedules an incremental run
+    (only data added since the last run is joined).
+    """
     try:
-        result = analyze_stress_spending()
-        return {"status": "success", "result": result}
+        from logic.causal_engine import get_causal_results, describe_results, run_causal_analysis
+        user_id = current_user['user_id']
+        results = get_causal_results(user_id)
+        background_tasks.add_task(run_causal_analysis, [user_id])
+        message = describe_results(results) if results else "No analysis yet. Running now; check back shortly."
+        return {"status": "success", "result": message, "results": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -339,10 +516,7 @@ class ContextSubmitRequest(BaseModel):
 @app.post("/api/context/submit")
 def submit_context_endpoint(req: ContextSubmitRequest):
     try:
-        from logic.context_notes import add_note_to_node
-        from logic.graph_db import GraphManager
-        
-        graph = GraphManager()
+        from logic.graph_queue import enqueue_note
         
         # Convert form data to a formatted note
         note_lines = []
@@ -355,10 +529,10 @@ def submit_context_endpoint(req: ContextSubmitRequest):
         # Determine Neo4j node type
         node_type = "Event" if req.contextType == "event" else "Entry"
         
-        # Save to Neo4j
-        result = add_note_to_node(graph, node_type, req.contextId, note_text)
+        # Queued; written to the graph by the write-behind worker
+        item_id = enqueue_note(node_type, req.contextId, note_text)
         
-        return {"status": "success", "message": result}
+        return {"status": "queued", "id": item_id, "message": f"Note queued for {node_type}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -370,8 +544,8 @@ class GraphAnalyzeRequest(BaseModel):
 @app.post("/api/graph/analyze")
 def graph_analyze_endpoint(req: GraphAnalyzeRequest, current_user: dict = Depends(get_current_user)):
     try:
-        from logic.graph_db import GraphManager
-        gm = GraphManager()
+        from logic.graph_db import get_graph_manager
+        gm = get_graph_manager()
         suggestions = gm.find_similar_nodes(req.text)
         return {"suggestions": suggestions}
     except Exception as e:
@@ -384,21 +558,28 @@ class GraphSaveRequest(BaseModel):
 @app.post("/api/graph/save")
 def graph_save_endpoint(req: GraphSaveRequest, current_user: dict = Depends(get_current_user)):
     try:
-        from logic.graph_db import GraphManager
-        gm = GraphManager()
-        success = gm.create_thought(req.text, req.links)
-        return {"status": "success" if success else "error"}
+        from logic.graph_queue import enqueue_thought
+        item_id = enqueue_thought(req.text, req.links, user_id=current_user['user_id'])
+        return {"status": "queued", "id": item_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/graph/queue/{item_id}")
+def graph_queue_status_endpoint(item_id: str, current_user: dict = Depends(get_current_user)):
+    from logic.graph_queue import get_item
+    item = get_item(item_id, current_user['user_id'])
+    if not item:
+        raise HTTPException(status_code=404, detail="Unknown graph write")
+    return item
+
 class GraphArchiveRequest(BaseModel):
     text: str
 
 @app.post("/api/graph/archive")
 def graph_archive_endpoint(req: GraphArchiveRequest, current_user: dict = Depends(get_current_user)):
     try:
-        from logic.graph_db import GraphManager
-        gm = GraphManager()
+        from logic.graph_db import get_graph_manager
+        gm = get_graph_manager()
         success = gm.create_archive(req.text)
         return {"status": "success" if success else "error"}
     except Exception as e:
@@ -1,4 +1,4 @@
-from logic.graph_db import GraphManager
+from logic.graph_db import get_graph_manager
 import os
 
 def check_graph():
@@ -6,7 +6,7 @@ def check_graph():
     # Don't print password
     print(f"User: {os.getenv('NEO4J_USERNAME')}")
     
-    gm = GraphManager()
+    gm = get_graph_manager()
     if gm.verify_connection():
         print("Connection Successful!")
     else:
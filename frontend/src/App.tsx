@@ -7,6 +7,7 @@ import AdminPanel from './components/AdminPanel'
 import OnboardingWizard from './components/Onboarding/OnboardingWizard'
 import Login from './components/Login'
 import { detectTemplateType, generateTemplate } from './utils/templates'
+import { postEventStream } from './utils/sse'
 import LinkSuggester from './components/LinkSuggester'
 import Logo from './components/Logo'
 import { Settings, Camera, Save, Archive, Check } from 'lucide-react'
@@ -130,15 +131,8 @@ function App() {
   const sendMessageWithText = async (text: string) => {
     if (!text.trim() && !selectedImage) return;
 
-    // Convert image to base64 if present
-    let imageBase64 = null;
-    if (selectedImage) {
-      imageBase64 = await new Promise((resolve) => {
-        const reader = new FileReader();
-        reader.onloadend = () => resolve(reader.result);
-        reader.readAsDataURL(selectedImage);
-      });
-    }
+    // Images go up as a multipart file part (the server downscales them)
+    const imageFile = selectedImage;
 
     const userMsg: Message = { role: 'user', content: text };
     // We don't display the image in the chat bubbles yet, but we could.
@@ -155,32 +149,61 @@ function App() {
     setSelectedImage(null);
     setImagePreview(null);
 
-    try {
-      const res = await axios.post('/api/chat', {
-        message: text,
-        image: imageBase64,
-        thread_id: threadId,
-        context: activeContext
-      });
-
-      // Update thread ID
-      if (res.data.thread_id) {
-        setThreadId(res.data.thread_id);
-      }
-
+    const toAssistantMessage = (data: any): Message => {
       // Check for special actions
-      if (res.data.type === 'action_backfill') {
-        axios.post('/api/action/backfill', { days: res.data.days || 365 })
+      if (data.type === 'action_backfill') {
+        axios.post('/api/action/backfill', { days: data.days || 365 })
           .catch(err => console.error("Backfill trigger failed", err));
       }
 
-      const assistantMsg: Message = {
+      return {
         role: 'assistant',
-        content: res.data.content,
-        widget: res.data.type !== 'chat' && res.data.type !== 'action_backfill' ? { type: res.data.type, data: res.data.data || res.data } : undefined
+        content: data.content,
+        widget: data.type !== 'chat' && data.type !== 'action_backfill' ? { type: data.type, data: data.data || data } : undefined
       };
+    };
+
+    try {
+      if (!imageFile) {
+        // Stream tokens into a placeholder message as they arrive
+        let streamed = '';
+        let started = false;
+        await postEventStream('/api/chat/stream', {
+          message: text,
+          thread_id: threadId,
+          context: activeContext
+        }, (event, data) => {
+          if (event === 'thread') {
+            setThreadId(data.thread_id);
+          } else if (event === 'token') {
+            streamed += data.text;
+            const partial: Message = { role: 'assistant', content: streamed };
+            setMessages(prev => started ? [...prev.slice(0, -1), partial] : [...prev, partial]);
+            started = true;
+          } else if (event === 'final') {
+            const finalMsg = toAssistantMessage(data);
+            setMessages(prev => started ? [...prev.slice(0, -1), finalMsg] : [...prev, finalMsg]);
+            started = true;
+          } else if (event === 'error') {
+            throw new Error(data.detail);
+          }
+        }, user?.credential);
+        return;
+      }
+
+      const form = new FormData();
+      form.append('message', text);
+      form.append('image', imageFile);
+      if (threadId) form.append('thread_id', threadId);
+      if (activeContext) form.append('context', JSON.stringify(activeContext));
+      const res = await axios.post('/api/chat', form);
+
+      // Update thread ID
+      if (res.data.thread_id) {
+        setThreadId(res.data.thread_id);
+      }
 
-      setMessages(prev => [...prev, assistantMsg]);
+      setMessages(prev => [...prev, toAssistantMessage(res.data)]);
     } catch (error) {
       console.error(error);
       setMessages(prev => [...prev, { role: 'assistant', content: 'Error connecting to brain.' }]);
@@ -9,7 +9,9 @@ interface AdminPanelProps {
 }
 
 const AdminPanel: React.FC<AdminPanelProps> = ({ isOpen, onClose }) => {
-    const [activeTab, setActiveTab] = useState<'logs' | 'curator'>('logs');
+    const [activeTab, setActiveTab] = useState<'logs' | 'curator' | 'metrics'>('logs');
+    const [llmMetrics, setLlmMetrics] = useState<any>(null);
+    const [graphMetrics, setGraphMetrics] = useState<any>(null);
     const [logs, setLogs] = useState<any[]>([]);
     const [reviewItems, setReviewItems] = useState<any[]>([]);
     const [loading, setLoading] = useState(false);
@@ -49,6 +51,18 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ isOpen, onClose }) => {
         }
     };
 
+    // --- Metrics Logic ---
+    const fetchMetrics = async () => {
+        try {
+            const res = await axios.get('/api/admin/llm-metrics', { params: { hours: 24 } });
+            setLlmMetrics(res.data);
+            const graphRes = await axios.get('/api/admin/graph-metrics', { params: { hours: 24 } });
+            setGraphMetrics(graphRes.data);
+        } catch (e) {
+            console.error("Failed to fetch metrics", e);
+        }
+    };
+
     // --- Curator Logic ---
     const fetchReviewItems = async () => {
         try {
@@ -148,6 +162,7 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ isOpen, onClose }) => {
         if (isOpen) {
             fetchLogs();
             fetchReviewItems();
+            fetchMetrics();
         }
     }, [isOpen]);
 
@@ -225,10 +240,180 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ isOpen, onClose }) => {
                     >
                         Curator (Review Queue)
                     </button>
+                    <button
+                        onClick={() => { setActiveTab('metrics'); fetchMetrics(); }}
+                        style={{
+                            padding: '10px 20px',
+                            background: 'none',
+                            border: 'none',
+                            borderBottom: activeTab === 'metrics' ? '2px solid var(--text-color)' : 'none',
+                            color: 'var(--text-color)',
+                            fontWeight: activeTab === 'metrics' ? '700' : '400',
+                            cursor: 'pointer',
+                            fontFamily: 'inherit',
+                            textTransform: 'uppercase'
+                        }}
+                    >
+                        Metrics
+                    </button>
                 </div>
 
                 {
-                    activeTab === 'logs' ? (
+                    activeTab === 'metrics' ? (
+                        <>
+                            <div style={{ display: 'flex', gap: '10px', marginBottom: '20px', alignItems: 'center' }}>
+                                <button onClick={fetchMetrics} style={{ padding: '10px 16px', border: '1px solid var(--border-color)', background: 'var(--bg-color)', cursor: 'pointer', fontFamily: 'inherit' }}>🔄 Refresh</button>
+                                {llmMetrics && (
+                                    <span style={{ fontSize: '13px' }}>
+                                        Last {llmMetrics.window_hours}h: <b>{llmMetrics.calls}</b> LLM calls • est. <b>${llmMetrics.est_cost_usd}</b>
+                                    </span>
+                                )}
+                                {graphMetrics && (
+                                    <span style={{ fontSize: '13px' }}>
+                                        • <b>{graphMetrics.calls}</b> graph queries in the last {graphMetrics.window_hours}h across {graphMetrics.workers} worker(s) ({graphMetrics.backend})
+                                    </span>
+                                )}
+                            </div>
+
+                            {/* Per-Stage Rollup (includes repair / escalation calls) */}
+                            <div style={{ marginBottom: '20px', border: '1px solid var(--border-color)', borderRadius: '0' }}>
+                                <table style={{ width: '100%', borderCollapse: 'collapse', fontSize: '12px', fontFamily: 'inherit' }}>
+                                    <thead style={{ background: '#f5f5f5', borderBottom: '1px solid var(--border-color)' }}>
+                                        <tr>
+                                            <th style={{ padding: '8px', textAlign: 'left' }}>Stage</th>
+                                            <th style={{ padding: '8px', textAlign: 'left' }}>Models</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Calls</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Repairs</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Escalations</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>p50 ms</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>p95 ms</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Est. $</th>
+                                        </tr>
+                                    </thead>
+                                    <tbody>
+                                        {(llmMetrics?.by_stage || []).map((row: any) => (
+                                            <tr key={row.stage} style={{ borderBottom: '1px solid #eee' }}>
+                                                <td style={{ padding: '8px' }}>{row.stage}</td>
+                                                <td style={{ padding: '8px' }}>{row.models.join(', ')}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.calls}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.repairs}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.escalations}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.p50_ms ?? '-'}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.p95_ms ?? '-'}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.est_cost_usd}</td>
+                                            </tr>
+                                        ))}
+                                    </tbody>
+                                </table>
+                            </div>
+
+                            {/* LLM Calls by Call Site */}
+                            <div style={{ flex: 1, overflowY: 'auto', border: '1px solid var(--border-color)', borderRadius: '0' }}>
+                                <table style={{ width: '100%', borderCollapse: 'collapse', fontSize: '12px', fontFamily: 'inherit' }}>
+                                    <thead style={{ background: '#f5f5f5', position: 'sticky', top: 0, borderBottom: '1px solid var(--border-color)' }}>
+                                        <tr>
+                                            <th style={{ padding: '8px', textAlign: 'left' }}>Call Site</th>
+                                            <th style={{ padding: '8px', textAlign: 'left' }}>Model</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Calls</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Cache Hits</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Errors</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Parse (fixed/failed)</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>p50 ms</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>p95 ms</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Total ms</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Tokens (in/out)</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Est. $</th>
+                                        </tr>
+                                    </thead>
+                                    <tbody>
+                                        {(llmMetrics?.by_call_site || []).map((row: any) => (
+                                            <tr key={`${row.call_site}-${row.model}`} style={{ borderBottom: '1px solid #eee' }}>
+                                                <td style={{ padding: '8px' }}>{row.call_site}</td>
+                                                <td style={{ padding: '8px' }}>{row.model}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.calls}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.cache_hits}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right', color: row.errors ? 'red' : 'black' }} title={JSON.stringify(row.error_classes)}>{row.errors}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right', color: row.parse_failures ? 'red' : 'black' }}>{row.structured_calls ? `${row.parse_repaired}/${row.parse_failures}` : '-'}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.p50_ms ?? '-'}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.p95_ms ?? '-'}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.total_ms}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.prompt_tokens} / {row.response_tokens}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.est_cost_usd}</td>
+                                            </tr>
+                                        ))}
+                                    </tbody>
+                                </table>
+                            </div>
+
+                            {/* Graph Queries by Call Site (last 24h, all workers) */}
+                            <div style={{ marginTop: '20px', border: '1px solid var(--border-color)', borderRadius: '0' }}>
+                                <table style={{ width: '100%', borderCollapse: 'collapse', fontSize: '12px', fontFamily: 'inherit' }}>
+                                    <thead style={{ background: '#f5f5f5', borderBottom: '1px solid var(--border-color)' }}>
+                                        <tr>
+                                            <th style={{ padding: '8px', textAlign: 'left' }}>Graph Query</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Calls</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Errors</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Slow</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Rows</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Writes (nodes/rels/props)</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Avg db hits</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>p50 ms</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>p95 ms</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Max ms</th>
+                                            <th style={{ padding: '8px', textAlign: 'right' }}>Total ms</th>
+                                        </tr>
+                                    </thead>
+                                    <tbody>
+                                        {(graphMetrics?.by_call_site || []).map((row: any) => (
+                                            <tr key={row.call_site} style={{ borderBottom: '1px solid #eee' }}>
+                                                <td style={{ padding: '8px' }}>{row.call_site}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.calls}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right', color: row.errors ? 'red' : 'black' }}>{row.errors}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right', color: row.slow ? 'red' : 'black' }}>{row.slow}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.rows}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.nodes_created} / {row.relationships_created} / {row.properties_set}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }} title={`${row.profiled} profiled`}>{row.avg_db_hits ?? '-'}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.p50_ms ?? '-'}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.p95_ms ?? '-'}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.max_ms}</td>
+                                                <td style={{ padding: '8px', textAlign: 'right' }}>{row.total_ms}</td>
+                                            </tr>
+                                        ))}
+                                    </tbody>
+                                </table>
+                            </div>
+
+                            {/* Slow Graph Queries (parameters redacted) */}
+                            {(graphMetrics?.slow_queries || []).length > 0 && (
+                                <div style={{ marginTop: '20px', border: '1px solid var(--border-color)', borderRadius: '0' }}>
+                                    <table style={{ width: '100%', borderCollapse: 'collapse', fontSize: '12px', fontFamily: 'inherit' }}>
+                                        <thead style={{ background: '#f5f5f5', borderBottom: '1px solid var(--border-color)' }}>
+                                            <tr>
+                                                <th style={{ padding: '8px', textAlign: 'left' }}>Time</th>
+                                                <th style={{ padding: '8px', textAlign: 'left' }}>Slow Query (&ge; {graphMetrics.slow_threshold_ms} ms)</th>
+                                                <th style={{ padding: '8px', textAlign: 'right' }}>ms</th>
+                                                <th style={{ padding: '8px', textAlign: 'right' }}>Rows</th>
+                                                <th style={{ padding: '8px', textAlign: 'right' }}>db hits</th>
+                                            </tr>
+                                        </thead>
+                                        <tbody>
+                                            {graphMetrics.slow_queries.map((row: any, i: number) => (
+                                                <tr key={i} style={{ borderBottom: '1px solid #eee' }}>
+                                                    <td style={{ padding: '8px', whiteSpace: 'nowrap' }}>{new Date(row.created_at * 1000).toLocaleString()}</td>
+                                                    <td style={{ padding: '8px' }} title={`${row.query}\n\nParams: ${JSON.stringify(row.params)}`}>
+                                                        {row.call_site}{row.error_class && <span style={{ color: 'red' }}> ({row.error_class})</span>}
+                                                    </td>
+                                                    <td style={{ padding: '8px', textAlign: 'right' }}>{Math.round(row.latency_ms)}</td>
+                                                    <td style={{ padding: '8px', textAlign: 'right' }}>{row.rows}</td>
+                                                    <td style={{ padding: '8px', textAlign: 'right' }}>{row.db_hits ?? '-'}</td>
+                                                </tr>
+                                            ))}
+                                        </tbody>
+                                    </table>
+                                </div>
+                            )}
+                        </>
+                    ) : activeTab === 'logs' ? (
                         <>
                             {/* Auth Section */}
                             <div style={{ marginBottom: '20px', padding: '16px', border: '1px solid var(--border-color)', borderRadius: '0' }}>
@@ -0,0 +1,236 @@
+"""
+Incremental stress -> spending analysis over SQLite.
+
+A stress event is a calendar event whose summary contains one of
+CAUSAL_STRESS_KEYWORDS. A match is a transaction dated within a lag window
+(CAUSAL_LAG_HOURS, hours after the event ends). Times are integer Unix seconds
+from SQLite's strftime('%s'). Transactions only carry a posting date, so they
+count from midnight UTC.
+
+For each user, a run only joins what arrived or changed since the previous
+run: watermarks in `causal_state` over the tables' `change_seq`, a counter set
+on insert and bumped when a row's user, date/end time or summary changes (see
+init_db). New stress events are joined against the
+transactions inside their windows. New transactions are joined against the
+stress events that could precede them. The join is a sorted window join in
+NumPy: searchsorted over the transaction times gives each event's slice.
+Matches accumulate in `causal_matches`. Per-window totals are rewritten to
+`causal_results`, which the API reads.
+
+Changing the keywords or lag windows drops a user's matches; they are
+recomputed on the next run. An edit to an analyzed row (e.g. a rescheduled
+event) drops that row's matches in the same statement and gives it a new
+change_seq, so the next run rejoins it.
+"""
+import os
+import json
+import datetime
+import threading
+
+import numpy as np
+
+from logic.sql_engine import get_connection, log_event
+
+CAUSAL_STRESS_KEYWORDS = [
+    k.strip().lower() for k in os.getenv("CAUSAL_STRESS_KEYWORDS", "deadline,meeting,pitch,urgent").split(",") if k.strip()
+]
+CAUSAL_LAG_HOURS = sorted({float(h) for h in os.getenv("CAUSAL_LAG_HOURS", "4,24").split(",") if h.strip()})
+
+EVENT_TS = "CAST(strftime('%s', end_iso) AS INTEGER)"
+TXN_TS = "CAST(strftime('%s', date_posted) AS INTEGER)"
+
+_run_lock = threading.Lock()
+
+# --- Window join ---
+
+def window_join(event_ts, txn_ts, lag_seconds):
+    """
+    All pairs (i, j) with event_ts[i] <= txn_ts[j] <= event_ts[i] + lag_seconds.
+    `txn_ts` must be sorted. Returns (event indexes, transaction indexes).
+    """
+    lo = np.searchsorted(txn_ts, event_ts, side="left")
+    hi = np.searchsorted(txn_ts, event_ts + lag_seconds, side="right")
+    counts = hi - lo
+    events = np.repeat(np.arange(len(event_ts)), counts)
+    # Flat position k of event i maps to lo[i] + (k - first position of i)
+    txns = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    return events, txns
+
+# --- Loading ---
+
+def _day(ts, days=0):
+    return (datetime.datetime.fromtimestamp(ts, datetime.timezone.utc) + datetime.timedelta(days=days)).strftime("%Y-%m-%d")
+
+def _stress_events(conn, user, keywords, where, params):
+    """[(change_seq, event_id, end ts)] of the user's events matching `keywords`."""
+    like = " OR ".join(["lower(summary) LIKE ?"] * len(keywords)) or "0"
+    rows = conn.execute(f"""
+        SELECT change_seq, event_id, {EVENT_TS} FROM master_events
+        WHERE user_id IS ? AND end_iso IS NOT NULL AND ({like}) AND {where}
+    """, [user or None] + [f"%{k}%" for k in keywords] + params).fetchall()
+    return [r for r in rows if r[2] is not None]
+
+def _transactions(conn, user, where, params):
+    """[(change_seq, txn_id, posted ts)] of the user's transactions."""
+    rows = conn.execute(f"""
+        SELECT change_seq, txn_id, {TXN_TS} FROM master_transactions
+        WHERE user_id IS ? AND date_posted IS NOT NULL AND {where}
+    """, [user or None] + params).fetchall()
+    return [r for r in rows if r[2] is not None]
+
+def _as_arrays(rows):
+    if not rows:
+        return np.zeros(0, dtype=np.int64), [], np.zeros(0, dtype=np.int64)
+    seqs, ids, ts = zip(*rows)
+    return np.array(seqs, dtype=np.int64), list(ids), np.array(ts, dtype=np.int64)
+
+# --- Per user ---
+
+def _config(keywords, lags):
+    return json.dumps({"keywords": sorted(keywords), "lag_hours": lags})
+
+def _analyze_user(conn, user, keywords, lags, restart):
+    """Joins the user's new data and rewrites their results. Returns {new_matches, events, transactions}."""
+    config = _config(keywords, lags)
+    state = conn.execute(
+        "SELECT config, event_seq, txn_seq FROM causal_state WHERE user_id = ?", (user,)
+    ).fetchone()
+    if restart or not state or state[0] != config:
+        conn.execute("DELETE FROM causal_matches WHERE user_id = ?", (user,))
+        event_wm, txn_wm = 0, 0
+    else:
+        event_wm, txn_wm = state[1] or 0, state[2] or 0
+
+    # Snapshot the sequences; rows written during the run wait for the next one
+    seqs = dict(conn.execute("SELECT table_name, seq FROM change_sequence"))
+    event_max, txn_max = seqs.get("master_events", 0), seqs.get("master_transactions", 0)
+    max_lag = int(max(lags) * 3600)
+
+    new_events = _stress_events(conn, user, keywords, "change_seq > ? AND change_seq <= ?", [event_wm, event_max])
+    new_txns = _transactions(conn, user, "change_seq > ? AND change_seq <= ?", [txn_wm, txn_max])
+
+    # Already-analyzed rows that can pair with the new ones
+    old_txns, old_events = [], []
+    if new_events and txn_wm:
+        ends = [e[2] for e in new_events]
+        old_txns = _transactions(
+            conn, user, "change_seq <= ? AND date_posted >= ? AND date_posted < ?",
+            [txn_wm, _day(min(ends)), _day(max(ends) + max_lag, days=1)]
+        )
+    if new_txns and event_wm:
+        posted = [t[2] for t in new_txns]
+        old_events = _stress_events(
+            conn, user, keywords, f"change_seq <= ? AND {EVENT_TS} BETWEEN ? AND ?",
+            [event_wm, min(posted) - max_lag, max(posted)]
+        )
+
+    event_seqs, event_ids, event_ts = _as_arrays(new_events + old_events)
+    txn_seqs, txn_ids, txn_ts = _as_arrays(new_txns + old_txns)
+    order = np.argsort(txn_ts, kind="stable")
+    txn_seqs, txn_ts = txn_seqs[order], txn_ts[order]
+    txn_ids = [txn_ids[j] for j in order]
+
+    new_matches = 0
+    for lag in lags:
+        ev, tx = window_join(event_ts, txn_ts, int(lag * 3600))
+        # Old event x old transaction pairs are already stored
+        fresh = (event_seqs[ev] > event_wm) | (txn_seqs[tx] > txn_wm)
+        pairs = [(user, lag, event_ids[i], txn_ids[j]) for i, j in zip(ev[fresh].tolist(), tx[fresh].tolist())]
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO causal_matches (user_id, lag_hours, event_id, txn_id) VALUES (?, ?, ?, ?)", pairs
+        )
+        new_matches += conn.total_changes - before
+
+    _write_results(conn, user, lags)
+    conn.execute("""
+        INSERT INTO causal_state (user_id, config, event_seq, txn_seq, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            config = excluded.config,
+            event_seq = excluded.event_seq,
+            txn_seq = excluded.txn_seq,
+            updated_at = excluded.updated_at
+    """, (user, config, event_max, txn_max, datetime.datetime.now().isoformat()))
+    return {"new_matches": new_matches, "events": len(new_events), "transactions": len(new_txns)}
+
+def _write_results(conn, user, lags):
+    """Recomputes per-window totals from the stored matches (current amounts and categories)."""
+    now = datetime.datetime.now().isoformat()
+    conn.execute("DELETE FROM causal_results WHERE user_id = ?", (user,))
+    for lag in lags:
+        events = conn.execute(
+            "SELECT COUNT(DISTINCT event_id) FROM causal_matches WHERE user_id = ? AND lag_hours = ?", (user, lag)
+        ).fetchone()[0]
+        rows = conn.execute("""
+            SELECT coalesce(t.category, 'Uncategorized'), COUNT(*), SUM(t.amount)
+            FROM master_transactions t
+            WHERE t.txn_id IN (SELECT txn_id FROM causal_matches WHERE user_id = ? AND lag_hours = ?)
+            GROUP BY 1
+        """, (user, lag)).fetchall()
+        categories = {cat: round(total or 0.0, 2) for cat, _, total in rows}
+        conn.execute("""
+            INSERT INTO causal_results (user_id, lag_hours, events, transactions, total_spent, top_category, categories, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            user, lag, events, sum(r[1] for r in rows), round(sum(categories.values()), 2),
+            max(categories, key=categories.get) if categories else None, json.dumps(categories), now
+        ))
+
+# --- Entry points ---
+
+def run_causal_analysis(user_ids=None, restart=False, keywords=None, lag_hours=None):
+    """
+    Incremental run for `user_ids` (default: every user with events).
+    Returns {user_id: {new_matches, events, transactions}}.
+    """
+    keywords = [k.lower() for k in (keywords or CAUSAL_STRESS_KEYWORDS)]
+    lags = sorted({float(h) for h in (lag_hours or CAUSAL_LAG_HOURS)})
+
+    with _run_lock:
+        conn = get_connection()
+        try:
+            if user_ids is None:
+                user_ids = [r[0] for r in conn.execute("SELECT DISTINCT coalesce(user_id, '') FROM master_events")]
+            stats = {}
+            for user in user_ids:
+                try:
+                    stats[user or ""] = _analyze_user(conn, user or "", keywords, lags, restart)
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    log_event("Causal Engine", f"Analysis failed for user {user}: {e}", "ERROR")
+        finally:
+            conn.close()
+
+    log_event(
+        "Causal Engine",
+        f"Analyzed {len(stats)} users: {sum(s['new_matches'] for s in stats.values())} new matches",
+        "INFO",
+        metadata={"stats": stats, "keywords": keywords, "lag_hours": lags}
+    )
+    return stats
+
+def get_causal_results(user_id):
+    """Stored per-window results for one user: [{lag_hours, events, transactions, total_spent, top_category, categories, updated_at}]."""
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT lag_hours, events, transactions, total_spent, top_category, categories, updated_at
+        FROM causal_results WHERE user_id = ? ORDER BY lag_hours
+    """, (user_id or "",)).fetchall()
+    conn.close()
+    keys = ("lag_hours", "events", "transactions", "total_spent", "top_category", "categories", "updated_at")
+    return [dict(zip(keys, r), categories=json.loads(r[5] or "{}")) for r in rows]
+
+def describe_results(results):
+    """One-line summary of get_causal_results() for the UI."""
+    if not results:
+        return "No analysis yet."
+    found = [r for r in results if r["transactions"]]
+    if not found:
+        return "No correlations found."
+    return " ".join(
+        f"Within {r['lag_hours']:g}h: spent ${r['total_spent']:.2f} after {r['events']} stressful events "
+        f"(top category: {r['top_category']})."
+        for r in found
+    )
@@ -1,11 +1,11 @@
-import json
-from logic.llm_engine import ask_gemini, ask_gemini_json, get_embedding
-from logic.graph_db import GraphManager
+from logic.llm_engine import ask_structured, get_embedding
+from logic.schemas import ThreadAnalysis
+from logic.graph_db import get_graph_manager
 from logic.sql_engine import get_thread_messages, update_thread_summary, log_event
 
 class ChatEngine:
     def __init__(self):
-        self.gm = GraphManager()
+        self.gm = get_graph_manager()
 
     def summarize_and_store_thread(self, thread_id):
         """
@@ -70,8 +70,8 @@ class ChatEngine:
         }}
         """
         try:
-            response = ask_gemini_json(prompt)
-            return json.loads(response)
+            analysis = ask_structured(prompt, ThreadAnalysis, call_site="thread-summary")
+            return analysis.dict()
         except Exception as e:
             log_event("ChatEngine", f"Analysis failed: {e}", level="ERROR")
             return None
@@ -80,37 +80,10 @@ class ChatEngine:
         """
         Creates nodes and relationships in Neo4j.
         """
-        # 1. Create ChatThread Node
-        embedding = get_embedding(summary)
+        # 1. Embed the summary
+        embedding = get_embedding(summary, call_site="thread-embed")
         
-        query_thread = """
-        MERGE (c:ChatThread {id: $id})
-        SET c.summary = $summary,
-            c.topic = $topic,
-            c.created_at = datetime(),
-            c.embedding = $embedding
-        """
-        self.gm.query(query_thread, {
-            "id": thread_id,
-            "summary": summary,
-            "topic": topic,
-            "embedding": embedding
-        })
-
-        # 2. Link to Entities
-        for entity in entities:
-            name = entity['name']
-            label = entity['type']
-            
-            # Sanitize label to avoid injection (allowlist)
-            if label not in ["Merchant", "Person", "Project", "Place", "Event", "Topic"]:
-                label = "Topic"
-
-            query_link = f"""
-            MATCH (c:ChatThread {{id: $id}})
-            MERGE (e:{label} {{name: $name}})
-            MERGE (c)-[:DISCUSSED]->(e)
-            """
-            self.gm.query(query_link, {"id": thread_id, "name": name})
+        # 2. Create ChatThread Node + link to Entities
+        self.gm.upsert_chat_thread(thread_id, summary, topic, embedding, entities)
 
         log_event("ChatEngine", f"Stored thread {thread_id} in graph with {len(entities)} links.", level="SUCCESS")
@@ -0,0 +1,203 @@
+"""
+Token budgets for context interpolated into prompts.
+
+Tool output (SQL rows, graph neighborhoods) goes into the respond prompt
+verbatim, so an unbounded result set makes that call slow, expensive or
+outright rejected. fit_context() shrinks it to the stage's budget:
+
+- SQL rows (JSON list of dicts): first N rows + row count + numeric aggregates
+  over the full result
+- Graph results (explore_context_graph): noisy properties stripped, start nodes
+  ranked by score, neighbors trimmed from the lowest rank (or oldest), long strings clipped
+- Anything else: clipped text
+
+Each call returns a report of what was dropped; callers keep it on the state
+(ReasoningState.context_report) and it is logged to master_logs.
+"""
+import os
+import json
+from logic.llm_engine import estimate_tokens
+from logic.sql_engine import log_event
+
+# Estimated prompt tokens allowed for context, per stage
+CONTEXT_BUDGETS = {
+    "respond": int(os.getenv("CONTEXT_BUDGET_RESPOND", "3000")),
+    "history": int(os.getenv("CONTEXT_BUDGET_HISTORY", "800")),
+    "default": int(os.getenv("CONTEXT_BUDGET_DEFAULT", "2000")),
+}
+
+# Properties that cost tokens without helping an answer
+NOISY_PROPS = {"embedding", "vector", "raw", "raw_json", "html", "access_token", "etag", "icon", "htmlLink", "iCalUID"}
+RECENCY_PROPS = ("date_posted", "start_time", "date", "created_at", "timestamp", "updated_at")
+MAX_STRING_CHARS = int(os.getenv("CONTEXT_MAX_STRING_CHARS", "400"))
+MIN_NEIGHBORS = 1
+
+def budget_for(stage):
+    return CONTEXT_BUDGETS.get(stage, CONTEXT_BUDGETS["default"])
+
+def _tokens(value):
+    return estimate_tokens(value if isinstance(value, str) else json.dumps(value, default=str))
+
+def _clip(text, max_chars):
+    if len(text) <= max_chars:
+        return text, 0
+    return text[:max_chars] + f"... [truncated {len(text) - max_chars} chars]", len(text) - max_chars
+
+# --- SQL results ---
+
+def _is_sql_rows(data):
+    return isinstance(data, list) and bool(data) and all(isinstance(r, dict) for r in data) \
+        and not any("Related" in r for r in data[:1])
+
+def _aggregates(rows):
+    stats = {}
+    for key in rows[0]:
+        values = [r.get(key) for r in rows if isinstance(r.get(key), (int, float)) and not isinstance(r.get(key), bool)]
+        if values:
+            stats[key] = {
+                "sum": round(sum(values), 2),
+                "min": min(values),
+                "max": max(values),
+                "avg": round(sum(values) / len(values), 2)
+            }
+    return stats
+
+def _fit_sql_rows(rows, budget, dropped):
+    if _tokens(rows) <= budget:
+        return rows
+
+    summary = {"row_count": len(rows), "aggregates": _aggregates(rows), "note": "", "rows": []}
+
+    def sized(n):
+        summary["note"] = f"Showing the first {n} of {len(rows)} rows; aggregates cover all rows."
+        summary["rows"] = rows[:n]
+        return _tokens(summary)
+
+    # Largest prefix of rows (already in the query's ORDER BY) that fits next to the summary
+    lo, hi = 0, len(rows)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if sized(mid) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    sized(lo)
+    dropped.append({"kind": "sql_rows", "count": len(rows) - lo})
+    return summary
+
+# --- Graph results ---
+
+def _strip_props(props, dropped_counts):
+    clean = {}
+    for key, value in (props or {}).items():
+        if key in NOISY_PROPS or key.endswith("_embedding"):
+            dropped_counts["props"] += 1
+            continue
+        if isinstance(value, str):
+            value, cut = _clip(value, MAX_STRING_CHARS)
+            if cut:
+                dropped_counts["chars"] += cut
+        clean[key] = value
+    return clean
+
+def _recency(item):
+    props = item.get("Properties") or {}
+    for key in RECENCY_PROPS:
+        if props.get(key):
+            return str(props[key])
+    return ""
+
+def _is_graph_results(data):
+    return isinstance(data, list) and bool(data) and isinstance(data[0], dict) and "Related" in data[0]
+
+def _fit_graph_results(results, budget, dropped):
+    counts = {"props": 0, "chars": 0}
+    results = sorted(results, key=lambda r: r.get("Score") or 0, reverse=True)
+    fitted = []
+    for r in results:
+        related = [dict(n, Properties=_strip_props(n.get("Properties"), counts)) for n in r.get("Related", [])]
+        # Ranked neighbors (hybrid_search) keep their order; otherwise newest first
+        if not all("Rank" in n for n in related):
+            related.sort(key=_recency, reverse=True)
+        fitted.append({**r, "Content": _strip_props(r.get("Content"), counts), "Related": related})
+
+    if counts["props"]:
+        dropped.append({"kind": "noisy_props", "count": counts["props"]})
+    if counts["chars"]:
+        dropped.append({"kind": "clipped_chars", "count": counts["chars"]})
+
+    # Trim the lowest-ranked (or oldest) neighbors round-robin, then the lowest-scored start nodes
+    pruned = 0
+    while _tokens(fitted) > budget and any(len(r["Related"]) > MIN_NEIGHBORS for r in fitted):
+        for r in fitted:
+            if len(r["Related"]) > MIN_NEIGHBORS:
+                r["Related"].pop()
+                pruned += 1
+    if pruned:
+        dropped.append({"kind": "graph_neighbors", "count": pruned})
+
+    removed = 0
+    while len(fitted) > 1 and _tokens(fitted) > budget:
+        fitted.pop()
+        removed += 1
+    if removed:
+        dropped.append({"kind": "graph_start_nodes", "count": removed})
+    return fitted
+
+# --- Public API ---
+
+def fit_context(context, stage="respond", budget=None):
+    """
+    Shrinks `context` (tool output: JSON string, list/dict or text) to the stage's
+    token budget. Returns (text, report) where text is ready to interpolate into a
+    prompt and report is {"stage", "budget", "tokens_before", "tokens_after", "dropped"}.
+    """
+    budget = budget or budget_for(stage)
+    text = context if isinstance(context, str) else json.dumps(context, default=str)
+    report = {"stage": stage, "budget": budget, "tokens_before": estimate_tokens(text or ""), "dropped": []}
+
+    if context is None:
+        report["tokens_after"] = 0
+        return "", report
+
+    data = context
+    if isinstance(context, str):
+        try:
+            data = json.loads(context)
+        except ValueError:
+            data = None
+
+    if _is_graph_results(data):
+        text = json.dumps(_fit_graph_results(data, budget, report["dropped"]), default=str)
+    elif _is_sql_rows(data):
+        text = json.dumps(_fit_sql_rows(data, budget, report["dropped"]), default=str)
+
+    # Last resort for anything still over budget
+    if estimate_tokens(text) > budget:
+        text, cut = _clip(text, budget * 4)
+        report["dropped"].append({"kind": "clipped_chars", "count": cut})
+
+    report["tokens_after"] = estimate_tokens(text)
+    if report["dropped"]:
+        log_event(
+            "ContextBudget",
+            f"[{stage}] context {report['tokens_before']} -> {report['tokens_after']} tokens (budget {budget})",
+            metadata=report
+        )
+    return text, report
+
+def fit_history(history, stage="history", budget=None, max_messages=5):
+    """
+    Most recent messages (up to max_messages) that fit the budget, oldest first.
+    Long individual messages are clipped.
+    """
+    budget = budget or budget_for(stage)
+    kept, used = [], 0
+    for msg in reversed((history or [])[-max_messages:]):
+        content, _ = _clip(str(msg.get("content", "")), MAX_STRING_CHARS * 2)
+        cost = estimate_tokens(content) + 2
+        if kept and used + cost > budget:
+            break
+        kept.append({**msg, "content": content})
+        used += cost
+    return list(reversed(kept))
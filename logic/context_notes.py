@@ -1,5 +1,5 @@
 """
-Helper functions for adding context notes to Neo4j nodes.
+Helper functions for adding context notes to graph nodes.
 """
 
 def add_note_to_node(graph_manager, node_type, node_id, note):
@@ -16,17 +16,10 @@ def add_note_to_node(graph_manager, node_type, node_id, note):
         Success message or error
     """
     if not graph_manager.verify_connection():
-        return "Neo4j is not connected"
-    
-    query = f"""
-    MATCH (n:{node_type} {{id: $id}})
-    SET n.note = $note
-    RETURN n
-    """
+        return "Graph DB is not connected"
     
     try:
-        result = graph_manager.query(query, {'id': node_id, 'note': note})
-        if result:
+        if graph_manager.set_node_note(node_type, node_id, note):
             return f"Note added to {node_type}"
         else:
             return f"{node_type} not found"
@@ -48,15 +41,7 @@ def get_note_from_node(graph_manager, node_type, node_id):
     if not graph_manager.verify_connection():
         return None
     
-    query = f"""
-    MATCH (n:{node_type} {{id: $id}})
-    RETURN n.note as note
-    """
-    
     try:
-        result = graph_manager.query(query, {'id': node_id})
-        if result and len(result) > 0:
-            return result[0].get('note')
-        return None
+        return graph_manager.get_node_note(node_type, node_id)
     except Exception:
         return None
@@ -0,0 +1,152 @@
+"""
+Bulk embedding backfill for graph nodes.
+
+Walks every label in EMBEDDING_TARGETS by keyset pagination over n.id
+(only nodes whose embedding is still NULL), embeds each page in batched
+requests spread over a small thread pool, and writes the vectors back with
+one UNWIND per page. After every page the cursor is checkpointed in
+`embedding_backfill_state`, so an interrupted run resumes where it stopped
+instead of re-embedding from the start. A label's checkpoint row is removed
+once the label is done.
+
+Concurrency stays bounded by the LLM client's own slots and rate limiter;
+EMBED_BACKFILL_CONCURRENCY only controls how many batches are in flight.
+"""
+import os
+import time
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from logic.graph_db import EMBEDDING_TARGETS
+from logic.llm_engine import get_embeddings
+from logic.sql_engine import get_connection, log_event
+
+EMBED_BACKFILL_BATCH_SIZE = int(os.getenv("EMBED_BACKFILL_BATCH_SIZE", "50"))
+EMBED_BACKFILL_CONCURRENCY = int(os.getenv("EMBED_BACKFILL_CONCURRENCY", "4"))
+MAX_TEXT_CHARS = 8000  # Keeps each text well under the embedding model's input limit
+
+# --- Checkpoints ---
+
+def _load_checkpoint(label):
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT last_id, processed, failed FROM embedding_backfill_state WHERE label = ?", (label,)
+    ).fetchone()
+    conn.close()
+    if not row:
+        return {"last_id": "", "processed": 0, "failed": 0}
+    return {"last_id": row[0] or "", "processed": row[1] or 0, "failed": row[2] or 0}
+
+def _save_checkpoint(label, state):
+    now = datetime.datetime.now().isoformat()
+    conn = get_connection()
+    conn.execute("""
+        INSERT INTO embedding_backfill_state (label, last_id, processed, failed, started_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(label) DO UPDATE SET
+            last_id = excluded.last_id,
+            processed = excluded.processed,
+            failed = excluded.failed,
+            updated_at = excluded.updated_at
+    """, (label, state["last_id"], state["processed"], state["failed"], now, now))
+    conn.commit()
+    conn.close()
+
+def clear_checkpoint(label=None):
+    """Forgets saved progress for one label (or all), so the next run starts from the first id."""
+    conn = get_connection()
+    if label:
+        conn.execute("DELETE FROM embedding_backfill_state WHERE label = ?", (label,))
+    else:
+        conn.execute("DELETE FROM embedding_backfill_state")
+    conn.commit()
+    conn.close()
+
+# --- Backfill ---
+
+def _embed_batch(batch):
+    texts = [str(r["text"])[:MAX_TEXT_CHARS] for r in batch]
+    vectors = get_embeddings(texts, call_site="embedding-backfill")
+    return [
+        {"id": r["id"], "embedding": v}
+        for r, v in zip(batch, vectors) if v
+    ]
+
+def backfill_label(gm, label, batch_size=None, concurrency=None):
+    """Embeds every node of `label` missing an embedding. Returns per-label stats."""
+    batch_size = batch_size or EMBED_BACKFILL_BATCH_SIZE
+    concurrency = concurrency or EMBED_BACKFILL_CONCURRENCY
+    page_size = batch_size * concurrency * 2
+
+    state = _load_checkpoint(label)
+    if state["last_id"]:
+        print(f"   ↪️  {label}: resuming after id {state['last_id']} ({state['processed']} done)")
+
+    resumed_from = state["processed"]
+    skipped = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            page = gm.fetch_missing_embeddings(label, state["last_id"], page_size)
+            if not page:
+                break
+
+            # Nodes without text can't be embedded; step over them
+            todo = [r for r in page if r.get("text")]
+            skipped += len(page) - len(todo)
+
+            batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+            rows = [row for result in pool.map(_embed_batch, batches) for row in result]
+            if rows:
+                gm.set_embeddings(label, rows)
+
+            state["processed"] += len(rows)
+            state["failed"] += len(todo) - len(rows)
+            state["last_id"] = page[-1]["id"]
+            _save_checkpoint(label, state)
+
+            elapsed = time.perf_counter() - start
+            print(f"   {label}: {state['processed']} embedded, {state['failed']} failed "
+                  f"({(state['processed'] - resumed_from) / max(elapsed, 1e-6):.1f}/s)")
+
+            if len(page) < page_size:
+                break
+
+    stats = {
+        "label": label,
+        "processed": state["processed"],
+        "failed": state["failed"],
+        "skipped_no_text": skipped,
+        "seconds": round(time.perf_counter() - start, 1),
+    }
+    # Failed nodes still have a NULL embedding, so the next run picks them up again
+    clear_checkpoint(label)
+    return stats
+
+def run_backfill(gm, labels=None, batch_size=None, concurrency=None, restart=False):
+    """
+    Backfills embeddings for `labels` (default: all of EMBEDDING_TARGETS).
+    restart=True drops saved checkpoints first.
+    """
+    if not gm.verify_connection():
+        return []
+
+    labels = labels or list(EMBEDDING_TARGETS)
+    unknown = [l for l in labels if l not in EMBEDDING_TARGETS]
+    if unknown:
+        raise ValueError(f"No embedding target for labels: {unknown}")
+
+    results = []
+    for label in labels:
+        if restart:
+            clear_checkpoint(label)
+        print(f"🧠 Backfilling {label} embeddings...")
+        results.append(backfill_label(gm, label, batch_size, concurrency))
+
+    log_event(
+        "EmbeddingBackfill",
+        f"Embedded {sum(r['processed'] for r in results)} nodes "
+        f"({sum(r['failed'] for r in results)} failed) across {len(results)} labels",
+        metadata={"labels": results}
+    )
+    return results
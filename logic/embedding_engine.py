@@ -1,67 +1,24 @@
-import google.generativeai as genai
+import re
+import json
 import numpy as np
 import sqlite3
-import os
-
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+from logic.vector_store import get_store
+from logic.llm_engine import get_embedding, get_embeddings
+from logic.sql_engine import get_connection
 
 def generate_embedding(text):
-    """Generate embedding for text using Gemini."""
-    try:
-        result = genai.embed_content(
-            model="models/text-embedding-004",
-            content=text,
-            task_type="retrieval_document"
-        )
-        return np.array(result['embedding'], dtype=np.float32)
-    except Exception as e:
-        print(f"Embedding error: {e}")
+    """Generate embedding for text using Gemini (through the shared rate-limited client)."""
+    embedding = get_embedding(text, call_site="merchant-embed")
+    if embedding is None:
         return None
+    return np.array(embedding, dtype=np.float32)
 
-def find_similar_transactions(merchant_name, limit=5):
-    """Find similar transactions using cosine similarity."""
-    query_embedding = generate_embedding(merchant_name)
-    
-    if query_embedding is None:
-        return []
-    
-    conn = sqlite3.connect("context_os.db")
-    conn.row_factory = sqlite3.Row
-    
-    # Get all transactions with embeddings and categories
-    rows = conn.execute("""
-        SELECT merchant_name, category, embedding 
-        FROM master_transactions 
-        WHERE embedding IS NOT NULL 
-        AND category IS NOT NULL 
-        AND enrichment_status = 'COMPLETE'
-    """).fetchall()
-    
-    conn.close()
-    
-    if not rows:
-        return []
-    
-    similarities = []
-    for row in rows:
-        try:
-            emb = np.frombuffer(row['embedding'], dtype=np.float32)
-            similarity = np.dot(query_embedding, emb) / (
-                np.linalg.norm(query_embedding) * np.linalg.norm(emb)
-            )
-            similarities.append({
-                "merchant_name": row['merchant_name'],
-                "category": row['category'],
-                "similarity": float(similarity)
-            })
-        except Exception as e:
-            print(f"Similarity calculation error: {e}")
-            continue
-    
-    # Sort by similarity
-    similarities.sort(key=lambda x: x['similarity'], reverse=True)
-    return similarities[:limit]
+def generate_embeddings(texts):
+    """Batch variant of generate_embedding: one request per call. Entries are None on failure."""
+    return [
+        np.array(e, dtype=np.float32) if e is not None else None
+        for e in get_embeddings(texts, call_site="merchant-embed")
+    ]
 
 def store_embedding(txn_id, merchant_name):
     """Generate and store embedding for a transaction."""
@@ -70,7 +27,7 @@ def store_embedding(txn_id, merchant_name):
     if embedding is None:
         return False
     
-    conn = sqlite3.connect("context_os.db")
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
@@ -79,9 +36,334 @@ def store_embedding(txn_id, merchant_name):
             (embedding.tobytes(), txn_id)
         )
         conn.commit()
+        
+        # Shared mmap index; update_merchant_profile reads vectors back from it
+        get_store("transactions").upsert(txn_id, embedding)
         return True
     except Exception as e:
         print(f"Store embedding error: {e}")
         return False
     finally:
         conn.close()
+
+def store_embeddings(items):
+    """
+    Batch variant of store_embedding for [(txn_id, merchant_name)]: embeds each
+    distinct merchant once, then writes BLOBs and store rows in one go.
+    Returns {txn_id: embedding} for the transactions that got one.
+    """
+    names = list(dict.fromkeys(name for _, name in items if name))
+    if not names:
+        return {}
+    by_name = dict(zip(names, generate_embeddings(names)))
+    embeddings = {txn_id: by_name[name] for txn_id, name in items if by_name.get(name) is not None}
+    if not embeddings:
+        return {}
+
+    conn = get_connection()
+    try:
+        conn.executemany(
+            "UPDATE master_transactions SET embedding = ? WHERE txn_id = ?",
+            [(e.tobytes(), txn_id) for txn_id, e in embeddings.items()]
+        )
+        conn.commit()
+        get_store("transactions").upsert_many(list(embeddings.items()))
+    except Exception as e:
+        print(f"Store embeddings error: {e}")
+    finally:
+        conn.close()
+    return embeddings
+
+# --- Merchant Profiles ---
+
+def canonical_merchant(merchant_name):
+    """
+    Normalizes a merchant string to a stable key.
+    "UBER *TRIP 8812" / "Uber Trip" -> "uber trip"
+    """
+    if not merchant_name:
+        return ""
+    name = merchant_name.lower()
+    name = re.sub(r"\b\w*\d\w*\b", " ", name)   # store / reference numbers
+    name = re.sub(r"[^a-z&' ]+", " ", name)
+    return " ".join(name.split())
+
+def _read_profile(cursor, user_id, key):
+    """(centroid, embedding_count, category_votes) of a profile, or None."""
+    row = cursor.execute(
+        "SELECT centroid, embedding_count, category_votes FROM merchant_profiles WHERE user_id IS ? AND merchant_key = ?",
+        (user_id, key)
+    ).fetchone()
+    if not row:
+        return None
+    centroid = np.frombuffer(row[0], dtype=np.float32) if row[0] else None
+    return centroid, row[1] or 0, json.loads(row[2]) if row[2] else {}
+
+def _write_profile(cursor, user_id, key, name, centroid, count, votes, exists):
+    blob = centroid.astype(np.float32).tobytes() if centroid is not None else None
+    # UPDATE, then INSERT: ON CONFLICT never fires for a NULL user_id
+    if exists:
+        cursor.execute("""
+            UPDATE merchant_profiles
+            SET centroid = ?, embedding_count = ?, category_votes = ?, updated_at = datetime('now')
+            WHERE user_id IS ? AND merchant_key = ?
+        """, (blob, count, json.dumps(votes), user_id, key))
+    else:
+        cursor.execute("""
+            INSERT INTO merchant_profiles (user_id, merchant_key, display_name, centroid, embedding_count, category_votes, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+        """, (user_id, key, name, blob, count, json.dumps(votes)))
+
+def _retract_vote(cursor, user_id, key, category, embedding):
+    """Takes one transaction's vote (and its share of the centroid) back out of a profile."""
+    profile = _read_profile(cursor, user_id, key)
+    if profile is None:
+        return
+    centroid, count, votes = profile
+    if votes.get(category):
+        votes[category] -= 1
+        if not votes[category]:
+            del votes[category]
+    if embedding is not None and centroid is not None and count:
+        if count <= 1:
+            centroid, count = None, 0
+        else:
+            centroid = (centroid * count - np.frombuffer(embedding, dtype=np.float32)) / (count - 1)
+            count -= 1
+
+    if not votes and not count:
+        cursor.execute("DELETE FROM merchant_profiles WHERE user_id IS ? AND merchant_key = ?", (user_id, key))
+    else:
+        _write_profile(cursor, user_id, key, None, centroid, count, votes, exists=True)
+
+def update_merchant_profile(user_id, merchant_name, category, txn_id=None):
+    """
+    Folds a categorized transaction into its merchant profile:
+    running-mean centroid plus one category vote. With `txn_id` the contribution
+    is recorded in merchant_profile_votes, so categorizing the same transaction
+    again moves its vote instead of adding one (see drop_merchant_votes).
+    The read-modify-write runs in one IMMEDIATE transaction so concurrent votes
+    for a merchant are not lost.
+    """
+    key = canonical_merchant(merchant_name)
+    if not key or not category:
+        return False
+
+    embedding = get_store("transactions").get(txn_id) if txn_id else None
+    if embedding is None:
+        embedding = generate_embedding(merchant_name)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        previous = cursor.execute(
+            "SELECT user_id, merchant_key, category, embedding FROM merchant_profile_votes WHERE txn_id = ?", (txn_id,)
+        ).fetchone() if txn_id else None
+
+        if previous and previous[:2] == (user_id, key):
+            # Already counted for this merchant: only the category vote can move
+            if previous[2] != category:
+                profile = _read_profile(cursor, user_id, key)
+                centroid, count, votes = profile or (None, 0, {})
+                if votes.get(previous[2]):
+                    votes[previous[2]] -= 1
+                    if not votes[previous[2]]:
+                        del votes[previous[2]]
+                votes[category] = votes.get(category, 0) + 1
+                _write_profile(cursor, user_id, key, merchant_name, centroid, count, votes, exists=profile is not None)
+                cursor.execute("UPDATE merchant_profile_votes SET category = ? WHERE txn_id = ?", (category, txn_id))
+            conn.commit()
+            return True
+        if previous:
+            _retract_vote(cursor, *previous)
+
+        profile = _read_profile(cursor, user_id, key)
+        centroid, count, votes = profile or (None, 0, {})
+
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            if centroid is None or count == 0:
+                centroid, count = embedding, 1
+            else:
+                centroid = (centroid * count + embedding) / (count + 1)
+                count += 1
+
+        votes[category] = votes.get(category, 0) + 1
+        _write_profile(cursor, user_id, key, merchant_name, centroid, count, votes, exists=profile is not None)
+        if txn_id:
+            cursor.execute("""
+                INSERT OR REPLACE INTO merchant_profile_votes (txn_id, user_id, merchant_key, category, embedding)
+                VALUES (?, ?, ?, ?, ?)
+            """, (txn_id, user_id, key, category, embedding.tobytes() if embedding is not None else None))
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"Merchant profile update error: {e}")
+        return False
+    finally:
+        conn.close()
+
+def drop_merchant_votes(txn_ids, conn=None):
+    """
+    Takes the recorded votes of these transactions back out of their merchant
+    profiles (deleted transactions, or ones whose merchant changed).
+    With `conn` it runs inside the caller's transaction and leaves the commit to it.
+    """
+    if not txn_ids:
+        return 0
+    own = conn is None
+    if own:
+        conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        if own:
+            cursor.execute("BEGIN IMMEDIATE")
+        dropped = 0
+        for i in range(0, len(txn_ids), 500):
+            chunk = list(txn_ids[i:i + 500])
+            placeholders = ','.join(['?'] * len(chunk))
+            for vote in cursor.execute(
+                f"SELECT user_id, merchant_key, category, embedding FROM merchant_profile_votes WHERE txn_id IN ({placeholders})", chunk
+            ).fetchall():
+                _retract_vote(cursor, *vote)
+                dropped += 1
+            cursor.execute(f"DELETE FROM merchant_profile_votes WHERE txn_id IN ({placeholders})", chunk)
+        if own:
+            conn.commit()
+        return dropped
+    except Exception:
+        if own:
+            conn.rollback()
+        raise
+    finally:
+        if own:
+            conn.close()
+
+def rebuild_merchant_profiles(user_id):
+    """
+    Rebuilds a user's merchant profiles and votes from their categorized
+    transactions (one-time backfill). Reads and replaces in one IMMEDIATE
+    transaction so concurrent update_merchant_profile calls are not lost.
+    """
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("""
+            SELECT txn_id, merchant_name, category, embedding
+            FROM master_transactions
+            WHERE user_id IS ? AND category IS NOT NULL AND enrichment_status = 'COMPLETE'
+        """, (user_id,)).fetchall()
+
+        profiles, votes = {}, []
+        for row in rows:
+            key = canonical_merchant(row['merchant_name'])
+            if not key:
+                continue
+            p = profiles.setdefault(key, {"name": row['merchant_name'], "sum": None, "count": 0, "votes": {}})
+            if row['embedding']:
+                emb = np.frombuffer(row['embedding'], dtype=np.float32)
+                p["sum"] = emb.copy() if p["sum"] is None else p["sum"] + emb
+                p["count"] += 1
+            p["votes"][row['category']] = p["votes"].get(row['category'], 0) + 1
+            votes.append((row['txn_id'], user_id, key, row['category'], row['embedding'] or None))
+
+        # Replace the user's profiles wholesale (INSERT OR REPLACE can't match NULL user_ids)
+        conn.execute("DELETE FROM merchant_profiles WHERE user_id IS ?", (user_id,))
+        conn.execute("DELETE FROM merchant_profile_votes WHERE user_id IS ?", (user_id,))
+        conn.executemany("""
+            INSERT INTO merchant_profiles (user_id, merchant_key, display_name, centroid, embedding_count, category_votes, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+        """, [
+            (
+                user_id,
+                key,
+                p["name"],
+                (p["sum"] / p["count"]).astype(np.float32).tobytes() if p["count"] else None,
+                p["count"],
+                json.dumps(p["votes"])
+            )
+            for key, p in profiles.items()
+        ])
+        conn.executemany("""
+            INSERT OR REPLACE INTO merchant_profile_votes (txn_id, user_id, merchant_key, category, embedding)
+            VALUES (?, ?, ?, ?, ?)
+        """, votes)
+        conn.commit()
+        return len(profiles)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _load_merchant_profiles(user_id):
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT merchant_key, display_name, centroid, category_votes
+        FROM merchant_profiles
+        WHERE user_id IS ? AND centroid IS NOT NULL
+    """, (user_id,)).fetchall()
+    conn.close()
+    return rows
+
+def load_merchant_profiles(user_id):
+    """
+    A user's merchant profiles as (rows, centroid matrix), seeding them on first
+    use. Load once and pass to find_similar_merchants for many lookups.
+    """
+    rows = _load_merchant_profiles(user_id)
+    if not rows and rebuild_merchant_profiles(user_id):
+        rows = _load_merchant_profiles(user_id)
+    if not rows:
+        return [], None
+    return rows, np.vstack([np.frombuffer(r[2], dtype=np.float32) for r in rows])
+
+def find_similar_merchants(user_id, merchant_name, limit=3, embedding=None, profiles=None):
+    """
+    Nearest merchant profiles for a merchant string.
+    `embedding` (the merchant's vector) and `profiles` (from load_merchant_profiles)
+    skip the embedding request and the profile load when the caller has them.
+    Returns one entry per merchant with its category distribution, e.g.
+    {"merchant": "Uber", "similarity": 0.93, "votes": 14, "categories": {"Transport": 0.93, "Food": 0.07}}
+    """
+    rows, matrix = profiles if profiles is not None else load_merchant_profiles(user_id)
+    if not rows:
+        return []
+
+    query_embedding = embedding if embedding is not None else generate_embedding(merchant_name)
+    if query_embedding is None:
+        return []
+
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_embedding)
+    norms[norms == 0] = 1.0
+    scores = (matrix @ query_embedding) / norms
+
+    top = np.argsort(-scores)[:limit]
+    results = []
+    for i in top:
+        votes = json.loads(rows[i][3]) if rows[i][3] else {}
+        total = sum(votes.values()) or 1
+        results.append({
+            "merchant": rows[i][1],
+            "similarity": round(float(scores[i]), 4),
+            "votes": total,
+            "categories": {c: round(n / total, 2) for c, n in sorted(votes.items(), key=lambda x: -x[1])}
+        })
+    return results
+
+def aggregate_category_votes(similar_merchants):
+    """
+    Similarity-weighted category distribution across merchant profiles.
+    """
+    weights = {}
+    for m in similar_merchants:
+        for category, share in m["categories"].items():
+            weights[category] = weights.get(category, 0.0) + share * max(m["similarity"], 0.0)
+    total = sum(weights.values())
+    if not total:
+        return {}
+    return {c: round(w / total, 2) for c, w in sorted(weights.items(), key=lambda x: -x[1])}
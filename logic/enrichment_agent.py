@@ -1,14 +1,50 @@
+import os
 import json
 from langgraph.graph import StateGraph, END
-from logic.schemas import EnrichmentState, TransactionModel, EnrichmentStatus
+from logic.schemas import EnrichmentState, TransactionModel, EnrichmentStatus, CategorizationResult, CategorizationBatch
 from logic.sql_engine import (
     get_pending_enrichment,
     update_enrichment_status,
     log_event,
-    get_rules
+    get_rules,
+    get_transaction
 )
-from logic.embedding_engine import find_similar_transactions, store_embedding
-from logic.llm_engine import ask_gemini_json
+from logic.embedding_engine import (
+    store_embedding,
+    store_embeddings,
+    load_merchant_profiles,
+    find_similar_merchants,
+    aggregate_category_votes,
+    update_merchant_profile,
+    drop_merchant_votes
+)
+from logic.llm_engine import ask_structured, estimate_tokens
+
+# Transactions per categorization prompt (<= 1 disables batching)
+ENRICHMENT_BATCH_SIZE = int(os.getenv("ENRICHMENT_BATCH_SIZE", "25"))
+# Upper bound on estimated prompt tokens per batch
+ENRICHMENT_BATCH_TOKEN_BUDGET = int(os.getenv("ENRICHMENT_BATCH_TOKEN_BUDGET", "6000"))
+# Merchant texts per embedding request
+ENRICHMENT_EMBED_BATCH_SIZE = int(os.getenv("ENRICHMENT_EMBED_BATCH_SIZE", "100"))
+
+BATCH_PROMPT_HEADER = """
+Categorize each transaction below. `similar_merchant_votes` shows how the
+user's similar merchants were categorized before.
+
+Return JSON with exactly one item per transaction:
+{
+    "items": [
+        {
+            "txn_id": "...",
+            "category": "...",
+            "confidence": 0.0-1.0 (float),
+            "is_ambiguous": boolean,
+            "clarification_question": "..." (optional),
+            "suggested_options": ["A", "B"] (optional)
+        }
+    ]
+}
+"""
 
 class EnrichmentAgent:
     def __init__(self):
@@ -45,6 +81,12 @@ class EnrichmentAgent:
     def process_pending_items(self):
         """
         Main entry point to batch process pending transactions.
+        
+        Merchants are embedded ENRICHMENT_EMBED_BATCH_SIZE at a time and each
+        user's merchant profiles are loaded once per run. Rule matches are
+        committed directly. The rest are categorized ENRICHMENT_BATCH_SIZE at a
+        time in one prompt; ambiguous, low-confidence or missing items are
+        routed back through the single-item graph.
         """
         txns, events = get_pending_enrichment()
         log_event("EnrichmentAgent", f"Starting batch for {len(txns)} items.")
@@ -52,19 +94,46 @@ class EnrichmentAgent:
         auto_count = 0
         review_count = 0
         
+        rules = get_rules()
+        states = []
         for txn_data in txns:
             # Create typed TransactionModel
             txn_model = TransactionModel(
                 txn_id=txn_data['txn_id'],
+                user_id=txn_data.get('user_id'),
                 merchant_name=txn_data['merchant_name'],
                 amount=txn_data['amount'],
                 date=txn_data.get('date_posted', '')
             )
+            states.append(EnrichmentState(transaction=txn_model))
+        
+        self._prepare_contexts(states, rules)
+        
+        if ENRICHMENT_BATCH_SIZE <= 1:
+            pending = states
+        else:
+            pending = []
+            llm_queue = []
+            for state in states:
+                if state.status == EnrichmentStatus.COMPLETE:
+                    self._node_commit(state)
+                    auto_count += 1
+                else:
+                    llm_queue.append(state)
             
-            initial_state = EnrichmentState(transaction=txn_model)
+            for batch in self._chunk_for_prompt(llm_queue):
+                for state in self._categorize_batch(batch):
+                    if state.status == EnrichmentStatus.COMPLETE:
+                        self._node_commit(state)
+                        auto_count += 1
+                    else:
+                        pending.append(state)
             
+            log_event("EnrichmentAgent", f"Batch pass: {auto_count} auto-tagged, {len(pending)} routed individually.")
+        
+        for state in pending:
             # Invoke Graph
-            final_state = self.app.invoke(initial_state)
+            final_state = self.app.invoke(state)
             
             if final_state['status'] == EnrichmentStatus.COMPLETE:
                 auto_count += 1
@@ -73,24 +142,122 @@ class EnrichmentAgent:
                 
         return auto_count, review_count
 
+    # --- Batch Categorization ---
+
+    def _chunk_for_prompt(self, states):
+        """
+        Splits states into batches of at most ENRICHMENT_BATCH_SIZE items
+        whose rendered prompt stays within ENRICHMENT_BATCH_TOKEN_BUDGET.
+        """
+        batch, batch_tokens = [], estimate_tokens(BATCH_PROMPT_HEADER)
+        for state in states:
+            item_tokens = estimate_tokens(json.dumps(self._batch_item(state)))
+            if batch and (len(batch) >= ENRICHMENT_BATCH_SIZE or batch_tokens + item_tokens > ENRICHMENT_BATCH_TOKEN_BUDGET):
+                yield batch
+                batch, batch_tokens = [], estimate_tokens(BATCH_PROMPT_HEADER)
+            batch.append(state)
+            batch_tokens += item_tokens
+        if batch:
+            yield batch
+
+    def _batch_item(self, state):
+        txn = state.transaction
+        return {
+            "txn_id": txn.txn_id,
+            "merchant": txn.merchant_name,
+            "amount": txn.amount,
+            "similar_merchant_votes": aggregate_category_votes(state.similar_merchants)
+        }
+
+    def _categorize_batch(self, states):
+        """
+        One prompt for many transactions. Returns the same states with
+        status COMPLETE for confident answers and PENDING for anything that
+        needs the single-item path (ambiguous, low confidence, missing, failed).
+        """
+        items = [self._batch_item(state) for state in states]
+        prompt = f"""
+        {BATCH_PROMPT_HEADER}
+        
+        Transactions:
+        {json.dumps(items)}
+        """
+        try:
+            batch = ask_structured(prompt, CategorizationBatch, call_site="categorize-batch")
+            results = {item.txn_id: item for item in batch.items}
+        except Exception as e:
+            log_event("EnrichmentAgent", f"Batch of {len(states)} failed, routing individually: {e}", level="WARNING")
+            return states
+        
+        for state in states:
+            result = results.get(state.transaction.txn_id)
+            if result and result.category and not result.is_ambiguous and result.confidence >= 0.7:
+                state.suggested_category = result.category
+                state.confidence = result.confidence
+                state.status = EnrichmentStatus.COMPLETE
+        return states
+
     # --- Nodes ---
 
-    def _node_enrich(self, state: EnrichmentState):
+    def _prepare_context(self, state: EnrichmentState, rules=None):
+        """
+        Embeds the merchant, loads similar merchant profiles and applies user rules.
+        Sets status COMPLETE on a rule match. Idempotent per state.
+        """
+        if state.context_ready:
+            return state
         txn = state.transaction
         
-        # 1. Embeddings
+        # 1. Embeddings (one vote distribution per similar merchant, not per past transaction)
         store_embedding(txn.txn_id, txn.merchant_name)
-        similar = find_similar_transactions(txn.merchant_name)
-        state.similar_transactions = similar
+        state.similar_merchants = find_similar_merchants(txn.user_id, txn.merchant_name)
+        state.context_ready = True
         
         # 2. Rules
-        rules = get_rules()
-        for rule in rules:
+        return self._apply_rules(state, rules)
+
+    def _prepare_contexts(self, states, rules):
+        """
+        _prepare_context for many states: one embedding request per chunk of
+        merchants, reused for the profile lookup against a profile matrix
+        loaded once per user.
+        """
+        profiles = {}
+        states = [state for state in states if not state.context_ready]
+        for i in range(0, len(states), ENRICHMENT_EMBED_BATCH_SIZE):
+            chunk = states[i:i + ENRICHMENT_EMBED_BATCH_SIZE]
+            embeddings = store_embeddings([(st.transaction.txn_id, st.transaction.merchant_name) for st in chunk])
+            for state in chunk:
+                txn = state.transaction
+                embedding = embeddings.get(txn.txn_id)
+                if embedding is not None:
+                    if txn.user_id not in profiles:
+                        profiles[txn.user_id] = load_merchant_profiles(txn.user_id)
+                    state.similar_merchants = find_similar_merchants(
+                        txn.user_id, txn.merchant_name, embedding=embedding, profiles=profiles[txn.user_id]
+                    )
+                state.context_ready = True
+                self._apply_rules(state, rules)
+        return states
+
+    def _apply_rules(self, state: EnrichmentState, rules=None):
+        """Sets status COMPLETE when a user rule matches the merchant."""
+        txn = state.transaction
+        for rule in rules if rules is not None else get_rules():
             if rule['pattern'].lower() in txn.merchant_name.lower():
                 state.suggested_category = rule['category']
                 state.confidence = 1.0
                 state.status = EnrichmentStatus.COMPLETE
                 return state
+        return state
+
+    def _node_enrich(self, state: EnrichmentState):
+        txn = state.transaction
+        
+        self._prepare_context(state)
+        if state.status == EnrichmentStatus.COMPLETE:
+            return state
+        similar = state.similar_merchants
 
         # 3. LLM
         prompt = f"""
@@ -98,7 +265,8 @@ class EnrichmentAgent:
         Merchant: {txn.merchant_name}
         Amount: {txn.amount}
         
-        Similar: {json.dumps(similar[:3])}
+        Similar merchants (with past category shares): {json.dumps(similar)}
+        Category votes across similar merchants: {json.dumps(aggregate_category_votes(similar))}
         
         Return JSON using this schema:
         {{
@@ -110,14 +278,18 @@ class EnrichmentAgent:
         }}
         """
         try:
-            result = json.loads(ask_gemini_json(prompt))
-            state.suggested_category = result.get('category')
-            state.confidence = result.get('confidence', 0.0)
+            # Low-confidence answers from the small model are re-asked on the larger one
+            result = ask_structured(
+                prompt, CategorizationResult, call_site="categorize",
+                escalate_if=lambda r: r.is_ambiguous or not r.category or r.confidence < 0.7
+            )
+            state.suggested_category = result.category
+            state.confidence = result.confidence
             
-            if result.get('is_ambiguous', False) or state.confidence < 0.7:
+            if result.is_ambiguous or not result.category or state.confidence < 0.7:
                 state.status = EnrichmentStatus.NEEDS_USER
-                state.clarification_question = result.get('clarification_question')
-                state.suggested_options = result.get('suggested_options', [])
+                state.clarification_question = result.clarification_question
+                state.suggested_options = result.suggested_options
             else:
                 state.status = EnrichmentStatus.COMPLETE
                 
@@ -140,6 +312,12 @@ class EnrichmentAgent:
             "COMPLETE", 
             updates={"category": state.suggested_category}
         )
+        update_merchant_profile(
+            state.transaction.user_id,
+            state.transaction.merchant_name,
+            state.suggested_category,
+            txn_id=state.transaction.txn_id
+        )
         return state
 
     def _node_flag_user(self, state: EnrichmentState):
@@ -153,6 +331,8 @@ class EnrichmentAgent:
                 "suggested_tags": json.dumps(state.suggested_options)
             }
         )
+        # A re-curated transaction no longer counts toward its merchant until the user answers
+        drop_merchant_votes([state.transaction.txn_id])
         return state
 
     def _route_result(self, state: EnrichmentState):
@@ -167,3 +347,7 @@ class EnrichmentAgent:
             "COMPLETE", 
             updates={"category": feedback_tag}
         )
+        
+        txn = get_transaction(txn_id)
+        if txn:
+            update_merchant_profile(txn['user_id'], txn['merchant_name'], feedback_tag, txn_id=txn_id)
@@ -0,0 +1,314 @@
+"""
+Deterministic stand-in for Gemini, selected with LLM_PROVIDER=fake.
+
+FakeModel replaces genai.GenerativeModel / genai.embed_content underneath
+GeminiClient, so concurrency slots, rate limits, deadlines, retries, caching
+and telemetry all run exactly as in production. Only the provider round trip
+is simulated:
+
+- Responses are rule-based and schema-valid per call site, recognised from
+  the prompt (intent routing, respond, streamed respond + widget, single and
+  batched categorization, thread analysis).
+- Embeddings are 768-dim feature-hashed vectors: identical text gives an
+  identical vector and texts that share words / trigrams score as similar.
+- Latency and errors are sampled from configurable distributions, and
+  injected errors use the provider's exception names so _wrap_error maps
+  them onto the retryable LLMError classes.
+
+Env:
+    FAKE_LLM_LATENCY_MS          median generate latency (default 300)
+    FAKE_LLM_LATENCY_DIST        fixed | uniform | lognormal (default lognormal)
+    FAKE_LLM_LATENCY_SIGMA       lognormal sigma / uniform +- fraction (default 0.5)
+    FAKE_EMBED_LATENCY_MS        median embed latency (default 40)
+    FAKE_LLM_ERROR_RATE          probability a call fails (default 0)
+    FAKE_LLM_ERROR_KINDS         comma list of rate_limit, unavailable, timeout
+    FAKE_LLM_SEED                seed for latency / error sampling
+"""
+import os
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+from types import SimpleNamespace
+
+EMBEDDING_DIM = 768
+
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+FAKE_LLM_LATENCY_DIST = os.getenv("FAKE_LLM_LATENCY_DIST", "lognormal").lower()
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5"))
+FAKE_EMBED_LATENCY_MS = float(os.getenv("FAKE_EMBED_LATENCY_MS", "40"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_ERROR_KINDS = [k.strip() for k in os.getenv("FAKE_LLM_ERROR_KINDS", "rate_limit,unavailable").split(",") if k.strip()]
+
+_rng = random.Random(os.getenv("FAKE_LLM_SEED"))
+
+# --- Injected errors (named like google.api_core exceptions) ---
+
+class ResourceExhausted(Exception):
+    pass
+
+class ServiceUnavailable(Exception):
+    pass
+
+class DeadlineExceeded(Exception):
+    pass
+
+_ERRORS = {
+    "rate_limit": ResourceExhausted,
+    "unavailable": ServiceUnavailable,
+    "timeout": DeadlineExceeded,
+}
+
+# --- Rule tables ---
+
+CATEGORY_KEYWORDS = {
+    "Transport": ["uber", "lyft", "taxi", "transit", "presto", "parking"],
+    "Gas": ["shell", "esso", "petro", "chevron", "exxon", "gas"],
+    "Coffee": ["starbucks", "tim hortons", "coffee", "cafe", "second cup"],
+    "Dining": ["mcdonald", "restaurant", "pizza", "sushi", "burger", "doordash", "ubereats", "skip"],
+    "Groceries": ["loblaws", "metro", "sobeys", "walmart", "costco", "grocery", "market"],
+    "Subscriptions": ["netflix", "spotify", "apple", "google", "amazon prime", "disney"],
+    "Shopping": ["amazon", "best buy", "ikea", "store"],
+    "Utilities": ["hydro", "rogers", "bell", "telus", "internet", "electric"],
+    "Income": ["payroll", "deposit", "salary", "transfer in"],
+}
+
+SQL_KEYWORDS = ["spend", "spent", "spending", "cost", "money", "how much", "total", "budget", "$", "transactions"]
+GRAPH_KEYWORDS = ["who", "when", "meeting", "project", "event", "remember", "related", "context", "with"]
+
+CANNED_SQL = (
+    "SELECT category, SUM(amount) AS total FROM master_transactions "
+    "WHERE date_posted >= date('now', '-30 days') GROUP BY category ORDER BY total DESC LIMIT 10"
+)
+
+# --- Response objects (shaped like google.generativeai responses) ---
+
+def _usage(prompt, text):
+    return SimpleNamespace(
+        prompt_token_count=max(1, len(prompt) // 4),
+        candidates_token_count=max(1, len(text) // 4)
+    )
+
+class FakeResponse:
+    def __init__(self, prompt, text):
+        self.text = text
+        self.usage_metadata = _usage(prompt, text)
+
+class FakeModel:
+    """
+    Drop-in for genai.GenerativeModel (generate_content / generate_content_async)
+    plus embed_content, used as GeminiClient's backend.
+    """
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    # Latency / error injection
+
+    def _sample_latency(self, median_ms):
+        if FAKE_LLM_LATENCY_DIST == "fixed":
+            ms = median_ms
+        elif FAKE_LLM_LATENCY_DIST == "uniform":
+            ms = median_ms * _rng.uniform(1 - FAKE_LLM_LATENCY_SIGMA, 1 + FAKE_LLM_LATENCY_SIGMA)
+        else:
+            ms = median_ms * math.exp(_rng.gauss(0, FAKE_LLM_LATENCY_SIGMA))
+        return max(0.0, ms) / 1000.0
+
+    def _plan_call(self, median_ms, request_options):
+        """Returns (seconds to wait, exception to raise afterwards or None)."""
+        delay = self._sample_latency(median_ms)
+        timeout = (request_options or {}).get("timeout")
+        if timeout is not None and delay > timeout:
+            return timeout, DeadlineExceeded(f"Fake provider exceeded {timeout:.1f}s deadline")
+        if FAKE_LLM_ERROR_KINDS and _rng.random() < FAKE_LLM_ERROR_RATE:
+            kind = _rng.choice(FAKE_LLM_ERROR_KINDS)
+            return delay, _ERRORS.get(kind, ServiceUnavailable)(f"Injected fake {kind} error")
+        return delay, None
+
+    # Generation
+
+    def generate_content(self, content, generation_config=None, stream=False, request_options=None):
+        prompt = _prompt_text(content)
+        delay, error = self._plan_call(FAKE_LLM_LATENCY_MS, request_options)
+        if stream:
+            return self._stream(prompt, delay, error)
+        time.sleep(delay)
+        if error:
+            raise error
+        return FakeResponse(prompt, respond(prompt))
+
+    def _stream(self, prompt, delay, error):
+        # Time to first token ~30% of the total, remainder spread over chunks
+        time.sleep(delay * 0.3)
+        if error:
+            raise error
+        text = respond(prompt)
+        chunks = [text[i:i + 24] for i in range(0, len(text), 24)] or [""]
+        for chunk in chunks:
+            time.sleep(delay * 0.7 / len(chunks))
+            yield FakeResponse(prompt, chunk)
+
+    async def generate_content_async(self, content, generation_config=None):
+        prompt = _prompt_text(content)
+        delay, error = self._plan_call(FAKE_LLM_LATENCY_MS, None)
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return FakeResponse(prompt, respond(prompt))
+
+    # Embeddings
+
+    def embed_content(self, model=None, content="", task_type=None, title=None, request_options=None):
+        delay, error = self._plan_call(FAKE_EMBED_LATENCY_MS, request_options)
+        time.sleep(delay)
+        if error:
+            raise error
+        if isinstance(content, (list, tuple)):
+            return {"embedding": [fake_embedding(c) for c in content]}
+        return {"embedding": fake_embedding(content)}
+
+def _prompt_text(content):
+    if isinstance(content, (list, tuple)):
+        return "\n".join(c for c in content if isinstance(c, str))
+    return str(content)
+
+# --- Embeddings ---
+
+def fake_embedding(text, dim=EMBEDDING_DIM):
+    """
+    Feature-hashed unit vector over words and character trigrams.
+    Deterministic across processes (sha1, not hash()).
+    """
+    text = str(text or "").lower()
+    words = re.findall(r"[a-z0-9']+", text)
+    features = words + [text[i:i + 3] for i in range(max(0, len(text) - 2))]
+    if not features:
+        features = ["<empty>"]
+
+    vec = [0.0] * dim
+    for feature in features:
+        digest = hashlib.sha1(feature.encode("utf-8")).digest()
+        idx = int.from_bytes(digest[:4], "little") % dim
+        vec[idx] += 1.0 if digest[4] & 1 else -1.0
+
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+# --- Rule-based responses ---
+
+def respond(prompt):
+    """Picks a canned response shape from markers in the prompt."""
+    if "failed validation" in prompt:
+        return _repair(prompt)
+    if '"tool": "SQL"' in prompt:
+        return json.dumps(_classify(prompt))
+    if "<<<WIDGET>>>" in prompt:
+        answer = _answer(prompt)
+        return f"{answer['text']}\n<<<WIDGET>>>\n{json.dumps(answer['widget'])}"
+    if '"text": "The answer' in prompt:
+        return json.dumps(_answer(prompt))
+    if '"items": [' in prompt and "Transactions:" in prompt:
+        return json.dumps({"items": _categorize_batch(prompt)})
+    if "Categorize transaction:" in prompt:
+        merchant = _field(prompt, "Merchant")
+        amount = _field(prompt, "Amount")
+        votes = _json_after(prompt, "Category votes across similar merchants:") or {}
+        return json.dumps(categorize(merchant, amount, votes))
+    if "chat transcript" in prompt:
+        return json.dumps(_analyze_transcript(prompt))
+    return f"[fake] {_user_query(prompt) or prompt.strip()[:120]}"
+
+def categorize(merchant, amount=None, votes=None):
+    name = (merchant or "").lower()
+    if votes:
+        top = max(votes, key=votes.get)
+        if votes[top] >= 0.6:
+            return {"category": top, "confidence": 0.9, "is_ambiguous": False}
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        if any(k in name for k in keywords):
+            return {"category": category, "confidence": 0.85, "is_ambiguous": False}
+    # Unknown merchants exercise the NEEDS_USER path
+    return {
+        "category": "Shopping",
+        "confidence": 0.4,
+        "is_ambiguous": True,
+        "clarification_question": f"What was the purchase at {merchant or 'this merchant'}?",
+        "suggested_options": ["Shopping", "Dining", "Entertainment"]
+    }
+
+def _categorize_batch(prompt):
+    items = _json_after(prompt, "Transactions:") or []
+    results = []
+    for item in items:
+        result = categorize(item.get("merchant"), item.get("amount"), item.get("similar_merchant_votes"))
+        results.append({"txn_id": item.get("txn_id"), **result})
+    return results
+
+def _classify(prompt):
+    query = (_user_query(prompt) or "").lower()
+    if any(k in query for k in SQL_KEYWORDS):
+        return {"tool": "SQL", "argument": CANNED_SQL}
+    if any(re.search(rf"\b{re.escape(k)}\b", query) for k in GRAPH_KEYWORDS):
+        return {"tool": "GRAPH", "argument": _user_query(prompt)}
+    return {"tool": "CHAT", "argument": None}
+
+def _answer(prompt):
+    query = _user_query(prompt) or "your question"
+    context = _field(prompt, "Context") or ""
+    widget = {"type": "none", "data": {}}
+    # SQL tool output is a JSON list of row dicts; chart (label, number) pairs
+    try:
+        rows = json.loads(context)
+    except ValueError:
+        rows = None
+    if isinstance(rows, list) and rows and isinstance(rows[0], dict) and len(rows[0]) >= 2:
+        label_key, value_key = list(rows[0])[:2]
+        widget = {
+            "type": "bar_chart",
+            "data": {
+                "labels": [str(r.get(label_key)) for r in rows[:10]],
+                "values": [r.get(value_key) or 0 for r in rows[:10]]
+            }
+        }
+    text = f"[fake] Answer to \"{query}\" using {len(context)} characters of context."
+    return {"text": text, "widget": widget}
+
+def _analyze_transcript(prompt):
+    transcript = prompt.split("Transcript:", 1)[-1].split("Tasks:", 1)[0].strip()
+    first_line = transcript.splitlines()[0] if transcript else ""
+    names = []
+    for name in re.findall(r"\b[A-Z][a-zA-Z]{2,}\b", transcript):
+        if name not in names and name not in ("User", "Assistant", "The", "What", "How"):
+            names.append(name)
+    return {
+        "summary": f"Conversation about {first_line[:80]}".strip(),
+        "topic": names[0] if names else "General Chat",
+        "entities": [{"name": n, "type": "Topic"} for n in names[:5]]
+    }
+
+def _repair(prompt):
+    body = prompt.split("JSON:", 1)[-1].split("Return corrected JSON", 1)[0]
+    start = body.find("{")
+    return body[start:].strip() if start != -1 else "{}"
+
+# --- Prompt parsing helpers ---
+
+def _user_query(prompt):
+    match = re.search(r'User Query: "(.*)"', prompt)
+    return match.group(1) if match else None
+
+def _field(prompt, name):
+    match = re.search(rf"^\s*{name}: (.*)$", prompt, re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+def _json_after(prompt, marker):
+    if marker not in prompt:
+        return None
+    rest = prompt.split(marker, 1)[1].strip()
+    try:
+        value, _ = json.JSONDecoder().raw_decode(rest)
+        return value
+    except ValueError:
+        return None
@@ -1,6 +1,13 @@
 import os
+import sys
+import time
+import uuid
+import datetime
+import threading
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
+from logic.query_cache import cached_query
+from logic.graph_telemetry import track_query, counters_dict
 
 load_dotenv()
 
@@ -8,44 +15,416 @@ NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 
-class GraphManager:
-    def __init__(self):
-        self.driver = None
-        if NEO4J_URI and NEO4J_USERNAME and NEO4J_PASSWORD:
+# "neo4j" (default) or "local" (embedded SQLite graph, logic/local_graph.py)
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "neo4j").lower()
+
+# Connection pool (one driver per process, shared by every GraphManager)
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "10"))
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "1800"))
+NEO4J_CONNECTION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "5"))
+NEO4J_LIVENESS_CHECK_TIMEOUT = os.getenv("NEO4J_LIVENESS_CHECK_TIMEOUT")  # Seconds idle before a ping; unset = never
+
+# Health is verified at most once per TTL; failures are re-checked sooner
+NEO4J_HEALTH_TTL = float(os.getenv("NEO4J_HEALTH_TTL", "30"))
+NEO4J_HEALTH_RETRY = float(os.getenv("NEO4J_HEALTH_RETRY", "5"))
+
+_driver = None
+_driver_lock = threading.Lock()
+_driver_failed_at = None
+_health = {"ok": None, "checked_at": 0.0, "error": None}
+_health_lock = threading.Lock()
+
+# Batched writes (UNWIND $rows) - rows per transaction and retries per chunk
+GRAPH_SYNC_CHUNK_SIZE = int(os.getenv("GRAPH_SYNC_CHUNK_SIZE", "1000"))
+GRAPH_SYNC_MAX_RETRIES = int(os.getenv("GRAPH_SYNC_MAX_RETRIES", "3"))
+
+# Labels that carry an `embedding` property: text used to embed them (Cypher expression
+# and, for the local backend, the properties it reads) and their vector index
+EMBEDDING_TARGETS = {
+    "Thought": {"text": "n.content", "props": ["content"], "index": "thought_embeddings"},
+    "Event": {"text": "n.summary", "props": ["summary"], "index": "event_embeddings"},
+    "ChatThread": {"text": "coalesce(n.summary, n.topic)", "props": ["summary", "topic"], "index": "chat_embeddings"},
+    "Archive": {"text": "n.content", "props": ["content"], "index": "archive_embeddings"},
+}
+
+# Entity labels a ChatThread may be linked to (anything else becomes a Topic)
+ENTITY_LABELS = ["Merchant", "Person", "Project", "Place", "Event", "Topic"]
+
+# Labels whose nodes are keyed by `id` (Thought links may point at any of them; see id_lookup)
+ID_LABELS = ["Event", "Transaction", "Thought", "ChatThread", "Archive", "Entry"]
+
+# Node labels that accept context notes (logic/context_notes.py, graph write queue)
+NOTE_LABELS = ["Event", "Entry", "Transaction"]
+
+# Hybrid retrieval (vector seeds + traversal in one query)
+GRAPH_SEARCH_MAX_DEPTH = int(os.getenv("GRAPH_SEARCH_MAX_DEPTH", "3"))
+GRAPH_SEARCH_HOP_DECAY = float(os.getenv("GRAPH_SEARCH_HOP_DECAY", "0.7"))        # Seed score kept per extra hop
+GRAPH_SEARCH_RECENCY_DAYS = float(os.getenv("GRAPH_SEARCH_RECENCY_DAYS", "30"))   # Age at which recency halves
+GRAPH_SEARCH_WEIGHTS = {  # Neighbor rank = weighted vector score + recency + degree
+    "similarity": float(os.getenv("GRAPH_SEARCH_W_SIMILARITY", "0.6")),
+    "recency": float(os.getenv("GRAPH_SEARCH_W_RECENCY", "0.25")),
+    "degree": float(os.getenv("GRAPH_SEARCH_W_DEGREE", "0.15")),
+}
+GRAPH_SEARCH_HIDDEN_PROPS = ["embedding"]
+
+# Errors that mean the server (not the query) is the problem
+_CONNECTION_ERRORS = ("ServiceUnavailable", "SessionExpired", "AuthError")
+
+def id_lookup(var, id_var, labels=None):
+    """
+    Cypher subquery binding `var` to the node whose id is `id_var`, on any of
+    `labels` (default ID_LABELS). One index seek per label instead of the
+    all-node scan of an unlabeled MATCH (n) WHERE n.id = ...
+    """
+    branches = "\n        UNION\n".join(
+        f"        WITH {id_var}\n        MATCH ({var}:{label} {{id: {id_var}}}) RETURN {var}"
+        for label in (labels or ID_LABELS)
+    )
+    return f"CALL {{\n{branches}\n        }}"
+
+def get_driver():
+    """
+    Process-wide Neo4j driver, created on first use.
+    Returns None when Neo4j is not configured or the driver cannot be built
+    (creation is retried after NEO4J_HEALTH_RETRY seconds).
+    """
+    global _driver, _driver_failed_at
+    if _driver is not None:
+        return _driver
+    if not (NEO4J_URI and NEO4J_USERNAME and NEO4J_PASSWORD):
+        return None
+    if _driver_failed_at is not None and time.monotonic() - _driver_failed_at < NEO4J_HEALTH_RETRY:
+        return None
+
+    with _driver_lock:
+        if _driver is None:
+            config = {
+                "max_connection_pool_size": NEO4J_MAX_POOL_SIZE,
+                "connection_acquisition_timeout": NEO4J_ACQUISITION_TIMEOUT,
+                "max_connection_lifetime": NEO4J_MAX_CONNECTION_LIFETIME,
+                "connection_timeout": NEO4J_CONNECTION_TIMEOUT,
+                "keep_alive": True,
+            }
+            if NEO4J_LIVENESS_CHECK_TIMEOUT:
+                config["liveness_check_timeout"] = float(NEO4J_LIVENESS_CHECK_TIMEOUT)
             try:
-                self.driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+                _driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD), **config)
             except Exception as e:
+                _driver_failed_at = time.monotonic()
+                _set_health(False, e)
                 print(f"Failed to create Neo4j driver: {e}")
+    return _driver
+
+def close_driver():
+    """Closes the shared driver (process shutdown only)."""
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+def _set_health(ok, error=None):
+    with _health_lock:
+        _health["ok"] = ok
+        _health["checked_at"] = time.monotonic()
+        _health["error"] = str(error) if error else None
+
+def _note_failure(e):
+    """Marks the graph unhealthy when a query fails for connection reasons."""
+    if type(e).__name__ in _CONNECTION_ERRORS:
+        _set_health(False, e)
+
+def graph_health(force=False):
+    """
+    Cached connectivity check: {"ok", "age_seconds", "error"}.
+    verify_connectivity() runs only when the cached status is older than
+    NEO4J_HEALTH_TTL (NEO4J_HEALTH_RETRY after a failure) or force=True.
+    """
+    driver = get_driver()
+    if driver is None:
+        return {"ok": False, "age_seconds": None, "error": _health["error"] or "Neo4j not configured"}
+
+    age = time.monotonic() - _health["checked_at"]
+    ttl = NEO4J_HEALTH_TTL if _health["ok"] else NEO4J_HEALTH_RETRY
+    if force or _health["ok"] is None or age >= ttl:
+        try:
+            driver.verify_connectivity()
+            _set_health(True)
+        except Exception as e:
+            _set_health(False, e)
+        age = 0.0
+    return {"ok": bool(_health["ok"]), "age_seconds": round(age, 1), "error": _health["error"]}
+
+def get_graph_manager():
+    """
+    Graph backend selected by GRAPH_BACKEND: GraphManager (Neo4j) or
+    LocalGraphManager (SQLite adjacency tables). Both expose the same methods;
+    callers should use these rather than raw Cypher.
+    """
+    if GRAPH_BACKEND == "local":
+        from logic.local_graph import LocalGraphManager
+        return LocalGraphManager()
+    return GraphManager()
+
+def get_graph_health(force=False):
+    """graph_health() for the configured backend."""
+    if GRAPH_BACKEND == "local":
+        from logic.local_graph import local_graph_health
+        return local_graph_health()
+    return graph_health(force)
+
+def _run_write(tx, query, rows):
+    """(ResultSummary, first column of every returned record)."""
+    result = tx.run(query, rows=rows)
+    returned = [record[0] for record in result]
+    return result.consume(), returned
+
+def _call_site():
+    """Name of the function that called the GraphManager query method (telemetry key)."""
+    return sys._getframe(2).f_code.co_name
+
+class GraphManager:
+    backend = "neo4j"
+
+    def __init__(self):
+        # Shared pooled driver; constructing a GraphManager costs no handshake
+        self.driver = get_driver()
 
     def close(self):
-        if self.driver:
-            self.driver.close()
+        # The driver is shared across the process; see close_driver() for shutdown
+        pass
 
-    def query(self, query, parameters=None):
+    @property
+    def available(self):
+        """False without a driver; reads then return empty results that must not be cached."""
+        return self.driver is not None
+
+    def query(self, query, parameters=None, call_site=None):
         if not self.driver:
             return None
         try:
-            with self.driver.session() as session:
-                result = session.run(query, parameters)
-                return [record.data() for record in result]
+            with track_query(call_site or _call_site(), query, parameters) as rec:
+                with self.driver.session() as session:
+                    result = session.run(rec.statement, parameters)
+                    records = [record.data() for record in result]
+                    rec.rows = len(records)
+                    rec.add_summary(result.consume())
+                    return records
         except Exception as e:
+            _note_failure(e)
             print(f"Query failed: {e}")
             return None
 
-    def run_cypher(self, query, parameters=None):
+    def run_cypher(self, query, parameters=None, call_site=None):
         """
         Generic wrapper for executing read-only queries.
         Returns a list of dictionaries.
         """
         if not self.driver:
             return []
-        with self.driver.session() as session:
-            result = session.run(query, parameters)
-            return [dict(record) for record in result]
+        try:
+            with track_query(call_site or _call_site(), query, parameters) as rec:
+                with self.driver.session() as session:
+                    result = session.run(rec.statement, parameters)
+                    records = [dict(record) for record in result]
+                    rec.rows = len(records)
+                    rec.add_summary(result.consume())
+                    return records
+        except Exception as e:
+            _note_failure(e)
+            raise
+
+    def write_batches(self, query, rows, chunk_size=None, call_site=None, returned=None):
+        """
+        Runs `query` (which must start with UNWIND $rows AS row) over `rows` in chunks,
+        one managed write transaction per chunk. A failed chunk is retried with backoff
+        (on top of the driver's own transient-error retries) and then skipped.
+        If `query` RETURNs a column, its values from written chunks are appended to
+        the `returned` list. Returns a counters summary.
+        """
+        chunk_size = chunk_size or GRAPH_SYNC_CHUNK_SIZE
+        summary = {
+            "rows": 0, "chunks": 0, "failed_chunks": 0, "retries": 0,
+            "nodes_created": 0, "nodes_deleted": 0, "relationships_created": 0,
+            "relationships_deleted": 0, "properties_set": 0, "seconds": 0.0
+        }
+        if not self.driver or not rows:
+            return summary
+
+        start = time.perf_counter()
+        with track_query(call_site or _call_site(), query, {"rows": rows}) as rec, self.driver.session() as session:
+            for i in range(0, len(rows), chunk_size):
+                chunk = rows[i:i + chunk_size]
+                for attempt in range(GRAPH_SYNC_MAX_RETRIES + 1):
+                    try:
+                        result, values = session.execute_write(_run_write, rec.statement, chunk)
+                        rec.add_summary(result)
+                        counters = counters_dict(result.counters)
+                        if returned is not None:
+                            returned.extend(values)
+                    except Exception as e:
+                        _note_failure(e)
+                        if attempt >= GRAPH_SYNC_MAX_RETRIES:
+                            summary["failed_chunks"] += 1
+                            print(f"Graph write chunk {i // chunk_size} failed after {attempt + 1} attempts: {e}")
+                            break
+                        summary["retries"] += 1
+                        time.sleep(min(4.0, 0.25 * (2 ** attempt)))
+                        continue
+                    summary["rows"] += len(chunk)
+                    for key, value in counters.items():
+                        summary[key] += value
+                    break
+                summary["chunks"] += 1
+            rec.rows = summary["rows"]
+            if summary["failed_chunks"]:
+                rec.error_class = "FailedChunks"
+
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+        return summary
+
+    # Temporal context: (:Transaction)-[:ON]->(:Day)<-[:ON]-(:Event), one Day per user per date.
+    # Day.key = "<user_id>:<YYYY-MM-DD>". Written with the node itself, so only touched nodes are linked.
+    DAY_LINK = """
+        WITH n, row, row.user_id + ':' + substring(row.day, 0, 10) AS day_key
+        WHERE row.user_id IS NOT NULL AND row.day IS NOT NULL
+        CALL {
+            WITH n, day_key
+            MATCH (n)-[stale:ON]->(old:Day)
+            WHERE old.key <> day_key
+            DELETE stale
+        }
+        MERGE (d:Day {key: day_key})
+        ON CREATE SET d.user_id = row.user_id, d.date = substring(row.day, 0, 10)
+        MERGE (n)-[:ON]->(d)
+    """
+
+    EVENT_NODE = """
+        MERGE (n:Event {id: row.id})
+        SET n.summary = row.summary,
+            n.start = row.start,
+            n.end = row.end,
+            n.recurringEventId = row.recurringEventId,
+            n.user_id = row.user_id
+    """
+    EVENT_LINKS = """
+        WITH n, row {.*, day: row.start} AS row
+    """ + DAY_LINK
+
+    TRANSACTION_NODE = """
+        MERGE (n:Transaction {id: row.id})
+        SET n.amount = row.amount,
+            n.date = row.date,
+            n.category = row.category,
+            n.user_id = row.user_id
+    """
+    TRANSACTION_LINKS = """
+        WITH n, row
+        CALL {
+            WITH n, row
+            WITH n, row WHERE row.merchant IS NOT NULL
+            MERGE (m:Merchant {name: row.merchant})
+            MERGE (n)-[:PAID_TO]->(m)
+        }
+        WITH n, row {.*, day: row.date} AS row
+    """ + DAY_LINK
+
+    def upsert_events(self, rows, link=True):
+        """
+        rows: {id, summary, start, end, recurringEventId, user_id}
+        link=False writes the nodes only; link_events() adds the Day edges later.
+        """
+        query = "UNWIND $rows AS row" + self.EVENT_NODE + (self.EVENT_LINKS if link else "")
+        return self.write_batches(query, rows)
+
+    def upsert_transactions(self, rows, link=True):
+        """
+        rows: {id, amount, date, category, merchant, user_id}
+        link=False writes the nodes only; link_transactions() adds Merchant and Day edges later.
+        """
+        query = "UNWIND $rows AS row" + self.TRANSACTION_NODE + (self.TRANSACTION_LINKS if link else "")
+        return self.write_batches(query, rows)
+
+    def link_events(self, rows):
+        """Derived edges for existing Event nodes (same rows as upsert_events)."""
+        query = "UNWIND $rows AS row MATCH (n:Event {id: row.id})" + self.EVENT_LINKS
+        return self.write_batches(query, rows)
+
+    def link_transactions(self, rows):
+        """Derived edges for existing Transaction nodes (same rows as upsert_transactions)."""
+        query = "UNWIND $rows AS row MATCH (n:Transaction {id: row.id})" + self.TRANSACTION_LINKS
+        return self.write_batches(query, rows)
+
+    def delete_transactions(self, rows):
+        """rows: [{id}]. DETACH DELETEs the Transaction nodes (Plaid removals)."""
+        query = """
+        UNWIND $rows AS row
+        MATCH (n:Transaction {id: row.id})
+        DETACH DELETE n
+        """
+        return self.write_batches(query, rows)
+
+    def count_nodes(self, label):
+        result = self.run_cypher(f"MATCH (n:{label}) RETURN count(n) AS count")
+        return result[0]["count"] if result else 0
+
+    def count_relationships(self, rel_type):
+        result = self.run_cypher(f"MATCH ()-[r:{rel_type}]->() RETURN count(r) AS count")
+        return result[0]["count"] if result else 0
+
+    def link_unlinked_days(self, user_id=None, batch_size=5000):
+        """
+        Catch-up for nodes written before Day bucketing (or without a user_id at the time):
+        links Transactions / Events that have no ON edge yet, batch_size at a time.
+        Returns the number of nodes linked.
+        """
+        if not self.driver:
+            return 0
+        linked = 0
+        for label, date_prop in (("Transaction", "date"), ("Event", "start")):
+            query = f"""
+            MATCH (n:{label})
+            WHERE n.user_id IS NOT NULL AND n.{date_prop} IS NOT NULL
+              AND ($user_id IS NULL OR n.user_id = $user_id)
+              AND NOT (n)-[:ON]->(:Day)
+            WITH n LIMIT $batch
+            WITH n, n.user_id + ':' + substring(n.{date_prop}, 0, 10) AS day_key
+            MERGE (d:Day {{key: day_key}})
+            ON CREATE SET d.user_id = n.user_id, d.date = substring(n.{date_prop}, 0, 10)
+            MERGE (n)-[:ON]->(d)
+            RETURN count(n) AS linked
+            """
+            while True:
+                result = self.run_cypher(query, {"user_id": user_id, "batch": batch_size})
+                count = result[0]["linked"] if result else 0
+                linked += count
+                if count < batch_size:
+                    break
+        return linked
 
+    def delete_legacy_day_edges(self, batch_size=10000):
+        """Removes the dense Transaction-HAPPENED_ON_DAY->Event edges in batches. Returns the count."""
+        if not self.driver:
+            return 0
+        deleted = 0
+        while True:
+            result = self.run_cypher("""
+            MATCH ()-[r:HAPPENED_ON_DAY]->()
+            WITH r LIMIT $batch
+            DELETE r
+            RETURN count(r) AS deleted
+            """, {"batch": batch_size})
+            count = result[0]["deleted"] if result else 0
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+    @cached_query("spending_by_category")
     def get_spending_by_category(self, user_id):
         """
         Aggregates spending by category for a specific user.
+        Cached until the user's data generation changes (logic/query_cache.py).
         """
         query = """
         MATCH (t:Transaction)
@@ -55,9 +434,11 @@ class GraphManager:
         """
         return self.run_cypher(query, {"user_id": user_id})
 
+    @cached_query("top_merchants")
     def get_top_merchants(self, user_id):
         """
         Returns top merchants by transaction count and total spend for a specific user.
+        Cached until the user's data generation changes (logic/query_cache.py).
         """
         query = """
         MATCH (t:Transaction)-[:PAID_TO]->(m:Merchant)
@@ -68,122 +449,163 @@ class GraphManager:
         """
         return self.run_cypher(query, {"user_id": user_id})
 
+    def set_node_note(self, label, node_id, note):
+        """Sets n.note on (label {id}). Returns True if the node exists."""
+        query = f"""
+        MATCH (n:{label} {{id: $id}})
+        SET n.note = $note
+        RETURN n.id AS id
+        """
+        return bool(self.run_cypher(query, {"id": node_id, "note": note}))
+
+    def get_node_note(self, label, node_id):
+        query = f"""
+        MATCH (n:{label} {{id: $id}})
+        RETURN n.note as note
+        """
+        result = self.run_cypher(query, {"id": node_id})
+        return result[0].get("note") if result else None
+
+    def upsert_chat_thread(self, thread_id, summary, topic, embedding, entities):
+        """
+        MERGEs the ChatThread node and a DISCUSSED edge to each entity
+        ({name, type}; types outside ENTITY_LABELS become Topic).
+        """
+        self.run_cypher("""
+        MERGE (c:ChatThread {id: $id})
+        SET c.summary = $summary,
+            c.topic = $topic,
+            c.created_at = datetime(),
+            c.embedding = $embedding
+        """, {"id": thread_id, "summary": summary, "topic": topic, "embedding": embedding})
+
+        for entity in entities:
+            # Sanitize label to avoid injection (allowlist)
+            label = entity['type'] if entity.get('type') in ENTITY_LABELS else "Topic"
+            query_link = f"""
+            MATCH (c:ChatThread {{id: $id}})
+            MERGE (e:{label} {{name: $name}})
+            MERGE (c)-[:DISCUSSED]->(e)
+            """
+            self.run_cypher(query_link, {"id": thread_id, "name": entity['name']})
+
     def verify_connection(self):
+        """Cached health (see graph_health); no round trip while the status is fresh."""
         if not self.driver:
             return False
-        try:
-            self.driver.verify_connectivity()
-            return True
-        except Exception:
-            return False
+        return graph_health()["ok"]
 
     def create_vector_index(self):
         """
-        Creates a vector index on Thought, Event, and ChatThread nodes.
+        Creates a vector index per label in EMBEDDING_TARGETS (declared in logic/schema.py).
         """
         if not self.driver: return
-        
-        # Create index for Thoughts
-        query_thought = """
-        CREATE VECTOR INDEX thought_embeddings IF NOT EXISTS
-        FOR (n:Thought)
-        ON (n.embedding)
-        OPTIONS {indexConfig: {
-         `vector.dimensions`: 768,
-         `vector.similarity_function`: 'cosine'
-        }}
-        """
-        self.run_cypher(query_thought)
-        
-        # Create index for Events
-        query_event = """
-        CREATE VECTOR INDEX event_embeddings IF NOT EXISTS
-        FOR (n:Event)
-        ON (n.embedding)
-        OPTIONS {indexConfig: {
-         `vector.dimensions`: 768,
-         `vector.similarity_function`: 'cosine'
-        }}
-        """
-        self.run_cypher(query_event)
-        
-        # Create index for ChatThreads
-        query_chat = """
-        CREATE VECTOR INDEX chat_embeddings IF NOT EXISTS
-        FOR (n:ChatThread)
-        ON (n.embedding)
-        OPTIONS {indexConfig: {
-         `vector.dimensions`: 768,
-         `vector.similarity_function`: 'cosine'
-        }}
-        """
-        self.run_cypher(query_chat)
-        
+
+        from logic.schema import apply_schema
+        apply_schema(self, kinds=("vector",))
         print("Vector indexes created.")
 
     def update_embeddings(self):
         """
-        Finds nodes without embeddings, generates them via Gemini, and updates the graph.
+        Embeds every node that is missing an embedding (see logic/embedding_backfill.py).
         """
-        from logic.llm_engine import get_embedding
-        
-        # 1. Thoughts
-        thoughts = self.run_cypher("MATCH (n:Thought) WHERE n.embedding IS NULL RETURN n.id as id, n.content as text")
-        for t in thoughts:
-            emb = get_embedding(t['text'])
-            if emb:
-                self.query("MATCH (n:Thought {id: $id}) SET n.embedding = $emb", {"id": t['id'], "emb": emb})
-                
-        # 2. Events
-        events = self.run_cypher("MATCH (n:Event) WHERE n.embedding IS NULL RETURN n.id as id, n.summary as text")
-        for e in events:
-            emb = get_embedding(e['text'])
-            if emb:
-                self.query("MATCH (n:Event {id: $id}) SET n.embedding = $emb", {"id": e['id'], "emb": emb})
-                
-                
-        print(f"Updated embeddings for {len(thoughts)} Thoughts and {len(events)} Events.")
+        from logic.embedding_backfill import run_backfill
+        return run_backfill(self)
+
+    def fetch_missing_embeddings(self, label, after_id, limit):
+        """
+        Keyset page of nodes without an embedding: [{id, text}] ordered by id, ids > after_id.
+        Nodes with no text are included (text None) so the cursor moves past them.
+        """
+        text = EMBEDDING_TARGETS[label]["text"]
+        query = f"""
+        MATCH (n:{label})
+        WHERE n.embedding IS NULL AND n.id > $after
+        RETURN n.id AS id, {text} AS text
+        ORDER BY n.id
+        LIMIT $limit
+        """
+        return self.run_cypher(query, {"after": after_id or "", "limit": limit})
+
+    def set_embeddings(self, label, rows):
+        """rows: [{id, embedding}] written with UNWIND batches."""
+        EMBEDDING_TARGETS[label]  # Only known labels are interpolated
+        query = f"""
+        UNWIND $rows AS row
+        MATCH (n:{label} {{id: row.id}})
+        SET n.embedding = row.embedding
+        """
+        return self.write_batches(query, rows, chunk_size=500)
 
     def create_thought(self, content, links=None):
         """
-        Creates a Thought node and links it to existing nodes.
+        Creates a Thought node, links it to existing nodes and embeds it, synchronously.
+        The API goes through logic/graph_queue.py instead.
         """
         if not self.driver: return False
-        
-        # 1. Create Thought Node
-        query_create = """
-        CREATE (t:Thought {
-            id: randomUUID(),
-            content: $content,
-            created_at: datetime(),
-            type: 'thought'
-        })
-        RETURN t.id as id
+
+        from logic.llm_engine import get_embedding
+        summary = self.create_thoughts([{
+            "id": str(uuid.uuid4()),
+            "content": content,
+            "links": links or [],
+            "embedding": get_embedding(content, call_site="thought-embed"),
+            "created_at": datetime.datetime.now().isoformat(),
+            "user_id": None
+        }])
+        return summary["rows"] == 1
+
+    def create_thoughts(self, rows):
         """
-        result = self.query(query_create, {"content": content})
-        if not result: return False
-        
-        thought_id = result[0]['id']
-        
-        # 2. Create Links
-        if links:
-            query_link = """
-            MATCH (t:Thought {id: $thought_id})
-            MATCH (n) WHERE n.id IN $links
+        rows: {id, content, links, embedding, created_at, user_id} written with UNWIND batches.
+        MERGEs on id, so replaying a queued write is harmless. A missing embedding
+        is left for the backfill job.
+        """
+        query = """
+        UNWIND $rows AS row
+        MERGE (t:Thought {id: row.id})
+        ON CREATE SET t.created_at = datetime(row.created_at)
+        SET t.content = row.content,
+            t.type = 'thought',
+            t.user_id = row.user_id
+        FOREACH (_ IN CASE WHEN row.embedding IS NULL THEN [] ELSE [1] END |
+            SET t.embedding = row.embedding)
+        WITH t, row
+        CALL {
+            WITH t, row
+            UNWIND coalesce(row.links, []) AS link_id
+            %s
             MERGE (t)-[:RELATED_TO]->(n)
+        }
+        """ % id_lookup("n", "link_id")
+        return self.write_batches(query, rows, chunk_size=500)
+
+    def set_node_notes(self, rows):
+        """
+        rows: {label, id, note}; one UNWIND per label (labels limited to NOTE_LABELS).
+        The summary's "matched" lists the (label, id) pairs whose node exists and got the note.
+        """
+        summary, matched = None, []
+        for label in sorted({r["label"] for r in rows}):
+            if label not in NOTE_LABELS:
+                raise ValueError(f"Notes are not supported on {label} nodes")
+            query = f"""
+            UNWIND $rows AS row
+            MATCH (n:{label} {{id: row.id}})
+            SET n.note = row.note
+            RETURN row.id AS id
             """
-            self.query(query_link, {"thought_id": thought_id, "links": links})
-            
-        # 3. Generate Embedding (Async ideally, but sync for now)
-        try:
-            from logic.llm_engine import get_embedding
-            emb = get_embedding(content)
-            if emb:
-                self.query("MATCH (n:Thought {id: $id}) SET n.embedding = $emb", {"id": thought_id, "emb": emb})
-        except Exception as e:
-            print(f"Failed to generate embedding for thought: {e}")
-            
-        return True
+            ids = []
+            result = self.write_batches(query, [r for r in rows if r["label"] == label], returned=ids)
+            matched.extend((label, node_id) for node_id in ids)
+            if summary is None:
+                summary = result
+            else:
+                for key, value in result.items():
+                    summary[key] += value
+        if summary is not None:
+            summary["matched"] = matched
+        return summary
 
     def create_archive(self, content):
         """
@@ -203,6 +625,96 @@ class GraphManager:
         result = self.query(query_create, {"content": content})
         return bool(result)
 
+    def hybrid_search(self, embedding, seeds=3, depth=1, rel_types=None, per_hop_limit=5,
+                      labels=("Thought", "Event", "ChatThread")):
+        """
+        One round trip: top `seeds` nodes across the labels' vector indexes, then a
+        breadth-first expansion of up to `depth` hops from each seed (optionally only
+        through `rel_types`). Each hop keeps the best `per_hop_limit` newly reached
+        nodes and only those are expanded further, so hub nodes (Day, Merchant)
+        can't blow up the traversal.
+
+        Neighbors are ranked by the seed's vector score (decayed per hop),
+        recency of their date property and log-scaled degree; degree is only
+        counted for the kept nodes. Properties are projected without embeddings.
+        Returns [{seed, labels, score, props, related}].
+        """
+        if not self.driver: return []
+
+        # One CALL {} per hop; depth is a clamped int
+        depth = max(1, min(int(depth or 1), GRAPH_SEARCH_MAX_DEPTH))
+        hop = """
+        CALL {
+            WITH visited, frontier
+            UNWIND frontier AS f
+            WITH f.node AS src, f.rels AS rels, visited
+            MATCH (src)-[r]-(nb)
+            WHERE NOT nb IN visited
+              AND ($rel_types IS NULL OR type(r) IN $rel_types)
+            WITH nb, head(collect(rels + type(r))) AS rels
+            WITH nb, rels, toString(coalesce(nb.date_posted, nb.date, nb.start, nb.start_time, nb.created_at)) AS seen
+            WITH nb, rels,
+                 CASE WHEN seen =~ '[0-9]{4}-[0-9]{2}-[0-9]{2}.*'
+                      THEN 1.0 / (1.0 + abs(duration.inDays(date(substring(seen, 0, 10)), date()).days) / $recency_days)
+                      ELSE 0.0 END AS recency
+            ORDER BY recency DESC
+            LIMIT $per_hop
+            RETURN collect({node: nb, rels: rels, recency: recency, hops: %d}) AS reached
+        }
+        WITH seed, score, visited + [x IN reached | x.node] AS visited, related + reached AS related, reached AS frontier
+        """
+        query = """
+        CALL {
+            UNWIND $indexes AS index_name
+            CALL db.index.vector.queryNodes(index_name, $seeds, $emb)
+            YIELD node, score
+            RETURN node, score
+        }
+        WITH node AS seed, max(score) AS score
+        ORDER BY score DESC
+        LIMIT $seeds
+        WITH seed, score, [seed] AS visited, [] AS related, [{node: seed, rels: []}] AS frontier
+        """ + "".join(hop % n for n in range(1, depth + 1)) + """
+        CALL {
+            WITH related, score
+            UNWIND related AS item
+            WITH item, item.node AS nb, score * ($decay ^ (item.hops - 1)) AS similarity
+            WITH item, nb,
+                 $w.similarity * similarity + $w.recency * item.recency
+                 + $w.degree * (1.0 - 1.0 / (1.0 + log(1.0 + COUNT { (nb)--() }))) AS rank
+            ORDER BY item.hops, rank DESC
+            RETURN collect({
+                relation: item.rels,
+                labels: labels(nb),
+                hops: item.hops,
+                rank: rank,
+                props: [k IN keys(nb) WHERE NOT k IN $hidden | [k, nb[k]]]
+            }) AS ranked
+        }
+        RETURN seed.id AS seed, labels(seed) AS labels, score,
+               [k IN keys(seed) WHERE NOT k IN $hidden | [k, seed[k]]] AS props,
+               ranked AS related
+        ORDER BY score DESC
+        """
+        params = {
+            "emb": embedding,
+            "indexes": [EMBEDDING_TARGETS[l]["index"] for l in labels],
+            "seeds": seeds,
+            "rel_types": list(rel_types) if rel_types else None,
+            "per_hop": per_hop_limit,
+            "decay": GRAPH_SEARCH_HOP_DECAY,
+            "recency_days": GRAPH_SEARCH_RECENCY_DAYS,
+            "w": GRAPH_SEARCH_WEIGHTS,
+            "hidden": GRAPH_SEARCH_HIDDEN_PROPS,
+        }
+        rows = self.run_cypher(query, params)
+        for row in rows:
+            # Properties come back as [key, value] pairs so embeddings never leave the server
+            row["props"] = dict(row["props"])
+            for item in row["related"]:
+                item["props"] = dict(item["props"])
+        return rows
+
     def find_similar_nodes(self, text, limit=5):
         """
         Vector search for similar nodes (Thoughts, Events, ChatThreads).
@@ -211,7 +723,7 @@ class GraphManager:
         
         try:
             from logic.llm_engine import get_embedding
-            emb = get_embedding(text)
+            emb = get_embedding(text, call_site="graph-search")
             if not emb: return []
             
             # Search over multiple indices or just one generic if unified. 
@@ -0,0 +1,251 @@
+"""
+Durable write-behind queue for user-initiated graph writes.
+
+Capturing a thought, attaching a note or deleting transactions that Plaid
+removed is one local INSERT into `graph_write_queue`; the caller gets the
+entry id back immediately (for thoughts it is also the Thought node id). A background worker claims due
+entries in batches, embeds all thoughts of a batch in one request, writes them
+with one UNWIND per operation, marks them DONE and bumps the data generation
+of the users it wrote for, so cached graph reads (logic/query_cache.py) refresh.
+
+Failures:
+- Graph unreachable: entries go back to PENDING with backoff; attempts are
+  not consumed, so an outage of any length only delays the writes.
+- Write errors: retried with backoff up to GRAPH_QUEUE_MAX_ATTEMPTS, then FAILED.
+- Notes for a node that doesn't exist (yet): same, with "Node not found".
+- Embedding errors: the thought is written without one (embedding backfill job).
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import datetime
+import threading
+from logic.sql_engine import get_connection, log_event, bump_data_generation
+
+GRAPH_QUEUE_BATCH_SIZE = int(os.getenv("GRAPH_QUEUE_BATCH_SIZE", "100"))
+GRAPH_QUEUE_POLL_SECONDS = float(os.getenv("GRAPH_QUEUE_POLL_SECONDS", "2"))
+GRAPH_QUEUE_MAX_ATTEMPTS = int(os.getenv("GRAPH_QUEUE_MAX_ATTEMPTS", "8"))
+GRAPH_QUEUE_MAX_BACKOFF = float(os.getenv("GRAPH_QUEUE_MAX_BACKOFF", "300"))
+GRAPH_QUEUE_CLAIM_TIMEOUT = 600       # RUNNING entries older than this were orphaned by a crash
+GRAPH_QUEUE_RETENTION = 7 * 24 * 3600  # DONE entries are purged after a week
+
+OPS = ("thought", "note", "delete_transactions")
+
+_wake = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+_outages = 0
+
+# --- Producer API ---
+
+def enqueue(op, payload, user_id=None):
+    """Stores a pending graph write and returns its id."""
+    if op not in OPS:
+        raise ValueError(f"Unknown graph write op: {op}")
+    item_id = str(uuid.uuid4())
+    now = time.time()
+    conn = get_connection()
+    conn.execute("""
+        INSERT INTO graph_write_queue (id, op, payload, user_id, status, attempts, created_at, updated_at, next_attempt_at)
+        VALUES (?, ?, ?, ?, 'PENDING', 0, ?, ?, ?)
+    """, (item_id, op, json.dumps(payload), user_id, now, now, now))
+    conn.commit()
+    conn.close()
+    _wake.set()
+    return item_id
+
+def enqueue_thought(content, links=None, user_id=None):
+    return enqueue("thought", {
+        "content": content,
+        "links": links or [],
+        "created_at": datetime.datetime.now().isoformat()
+    }, user_id=user_id)
+
+def enqueue_note(label, node_id, note, user_id=None):
+    from logic.graph_db import NOTE_LABELS
+    if label not in NOTE_LABELS:
+        raise ValueError(f"Notes are not supported on {label} nodes")
+    return enqueue("note", {"label": label, "id": node_id, "note": note}, user_id=user_id)
+
+def enqueue_transaction_deletes(txn_ids, user_id=None):
+    """Transactions removed upstream (Plaid sync); their nodes are deleted by the worker."""
+    return enqueue("delete_transactions", {"ids": list(txn_ids)}, user_id=user_id)
+
+def get_item(item_id, user_id):
+    """{id, op, status, attempts, last_error, created_at, updated_at} of one of the user's entries, or None."""
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("""
+        SELECT id, op, status, attempts, last_error, created_at, updated_at
+        FROM graph_write_queue WHERE id = ? AND user_id = ?
+    """, (item_id, user_id)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def queue_stats():
+    conn = get_connection()
+    rows = conn.execute("SELECT status, COUNT(*) FROM graph_write_queue GROUP BY status").fetchall()
+    conn.close()
+    return dict(rows)
+
+# --- Worker ---
+
+def _claim(limit):
+    """Marks up to `limit` due entries RUNNING and returns them."""
+    now = time.time()
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("""
+            UPDATE graph_write_queue SET status = 'PENDING'
+            WHERE status = 'RUNNING' AND updated_at < ?
+        """, (now - GRAPH_QUEUE_CLAIM_TIMEOUT,))
+        rows = conn.execute("""
+            SELECT id, op, payload, user_id, attempts FROM graph_write_queue
+            WHERE status = 'PENDING' AND next_attempt_at <= ?
+            ORDER BY created_at
+            LIMIT ?
+        """, (now, limit)).fetchall()
+        conn.executemany(
+            "UPDATE graph_write_queue SET status = 'RUNNING', updated_at = ? WHERE id = ?",
+            [(now, r["id"]) for r in rows]
+        )
+        conn.commit()
+        return [dict(r, payload=json.loads(r["payload"])) for r in rows]
+    finally:
+        conn.close()
+
+def _finish(items, status, error=None, count_attempt=True, delay=0.0):
+    now = time.time()
+    conn = get_connection()
+    conn.executemany("""
+        UPDATE graph_write_queue
+        SET status = ?, attempts = attempts + ?, last_error = ?, updated_at = ?, next_attempt_at = ?
+        WHERE id = ?
+    """, [(status, 1 if count_attempt else 0, error, now, now + delay, item["id"]) for item in items])
+    if status == "DONE":
+        conn.execute(
+            "DELETE FROM graph_write_queue WHERE status = 'DONE' AND updated_at < ?",
+            (now - GRAPH_QUEUE_RETENTION,)
+        )
+    conn.commit()
+    conn.close()
+
+def _backoff(attempt):
+    return min(GRAPH_QUEUE_MAX_BACKOFF, 2.0 * (2 ** attempt))
+
+def _write_thoughts(gm, items):
+    texts = [i["payload"]["content"] for i in items]
+    try:
+        from logic.llm_engine import get_embeddings
+        embeddings = get_embeddings(texts, call_site="thought-embed")
+    except Exception as e:
+        print(f"Failed to embed {len(texts)} queued thoughts: {e}")
+        embeddings = [None] * len(texts)
+    rows = [
+        {
+            "id": item["id"],
+            "content": item["payload"]["content"],
+            "links": item["payload"].get("links") or [],
+            "embedding": embedding,
+            "created_at": item["payload"].get("created_at"),
+            "user_id": item["user_id"]
+        }
+        for item, embedding in zip(items, embeddings)
+    ]
+    return gm.create_thoughts(rows)
+
+def _write_notes(gm, items):
+    summary = gm.set_node_notes([item["payload"] for item in items]) or {}
+    matched = {(label, str(node_id)) for label, node_id in summary.pop("matched", [])}
+    summary["missing"] = [
+        i for i in items if (i["payload"]["label"], str(i["payload"]["id"])) not in matched
+    ]
+    return summary
+
+def _delete_transactions(gm, items):
+    return gm.delete_transactions([{"id": txn_id} for item in items for txn_id in item["payload"]["ids"]])
+
+WRITERS = {"thought": _write_thoughts, "note": _write_notes, "delete_transactions": _delete_transactions}
+
+def _retry_or_fail(op, items, error, counts):
+    """Back to PENDING with backoff, or FAILED once GRAPH_QUEUE_MAX_ATTEMPTS is reached."""
+    retry = [i for i in items if i["attempts"] + 1 < GRAPH_QUEUE_MAX_ATTEMPTS]
+    failed = [i for i in items if i["attempts"] + 1 >= GRAPH_QUEUE_MAX_ATTEMPTS]
+    for item in retry:
+        _finish([item], "PENDING", error, delay=_backoff(item["attempts"] + 1))
+    if failed:
+        _finish(failed, "FAILED", error)
+        log_event("GraphQueue", f"{len(failed)} {op} write(s) failed permanently: {error}", level="ERROR")
+    counts["retry"] += len(retry)
+    counts["failed"] += len(failed)
+
+def process_pending(gm=None, limit=None):
+    """
+    One pass over due entries. Returns {"done", "retry", "failed", "deferred"} counts.
+    """
+    global _outages
+    counts = {"done": 0, "retry": 0, "failed": 0, "deferred": 0}
+    items = _claim(limit or GRAPH_QUEUE_BATCH_SIZE)
+    if not items:
+        return counts
+
+    if gm is None:
+        from logic.graph_db import get_graph_manager
+        gm = get_graph_manager()
+
+    if not gm.verify_connection():
+        _outages += 1
+        _finish(items, "PENDING", "Graph DB unavailable", count_attempt=False, delay=_backoff(_outages))
+        counts["deferred"] = len(items)
+        return counts
+    _outages = 0
+
+    for op, writer in WRITERS.items():
+        batch = [i for i in items if i["op"] == op]
+        if not batch:
+            continue
+        try:
+            summary = writer(gm, batch)
+            if summary and summary.get("failed_chunks"):
+                raise RuntimeError(f"{summary['failed_chunks']} chunk(s) failed")
+        except Exception as e:
+            _retry_or_fail(op, batch, f"{type(e).__name__}: {e}", counts)
+            continue
+
+        # Notes whose node doesn't exist (yet, e.g. not synced) wrote nothing
+        missing = {i["id"] for i in (summary or {}).get("missing", [])}
+        if missing:
+            _retry_or_fail(op, [i for i in batch if i["id"] in missing], "Node not found", counts)
+            batch = [i for i in batch if i["id"] not in missing]
+            if not batch:
+                continue
+        _finish(batch, "DONE")
+        bump_data_generation(list({i["user_id"] for i in batch}))
+        counts["done"] += len(batch)
+
+    return counts
+
+def _run():
+    while True:
+        try:
+            counts = process_pending()
+            busy = counts["done"] + counts["retry"] + counts["failed"] >= GRAPH_QUEUE_BATCH_SIZE
+        except Exception as e:
+            print(f"Graph queue worker error: {e}")
+            busy = False
+        if not busy:
+            _wake.wait(GRAPH_QUEUE_POLL_SECONDS)
+            _wake.clear()
+
+def start_worker():
+    """Starts the background worker once per process."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="graph-write-queue", daemon=True)
+            _worker.start()
+    return _worker
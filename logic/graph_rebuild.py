@@ -0,0 +1,225 @@
+"""
+Full, resumable rebuild of the graph from SQLite (the source of truth).
+
+Phases, in order:
+    nodes:events        master_events       -> Event nodes        (parallel)
+    nodes:transactions  master_transactions -> Transaction nodes  (parallel)
+    links:events        Event -[:ON]-> Day                        (serial)
+    links:transactions  Transaction -[:PAID_TO]-> Merchant, -[:ON]-> Day (serial)
+
+Each phase streams its table in keyset order (primary key > cursor) and
+writes chunks through the graph manager's UNWIND upserts. Node phases run
+GRAPH_REBUILD_CONCURRENCY chunks at once; they touch disjoint nodes, so the
+writers never contend. Derived edges MERGE shared Merchant / Day nodes and
+run one chunk at a time.
+
+The cursor of the last chunk for which every earlier chunk has also
+finished is checkpointed in `graph_rebuild_state`; an interrupted rebuild
+resumes from there. A final validation pass compares SQLite and graph counts.
+ChatThread entity links come from the LLM, not SQLite, and are left as is.
+"""
+import os
+import time
+import datetime
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from logic.sql_engine import get_connection, log_event, mark_as_synced, bump_data_generation
+from logic.ingestion import event_rows, transaction_rows
+
+GRAPH_REBUILD_CHUNK_SIZE = int(os.getenv("GRAPH_REBUILD_CHUNK_SIZE", "2000"))
+GRAPH_REBUILD_CONCURRENCY = int(os.getenv("GRAPH_REBUILD_CONCURRENCY", "4"))
+
+# (phase, table, key column, columns, row builder, graph manager method, node phase)
+PHASES = [
+    ("nodes:events", "master_events", "event_id",
+     "event_id, summary, start_iso, end_iso, series_id, user_id", event_rows, "upsert_events", True),
+    ("nodes:transactions", "master_transactions", "txn_id",
+     "txn_id, amount, date_posted, category, merchant_name, user_id", transaction_rows, "upsert_transactions", True),
+    ("links:events", "master_events", "event_id",
+     "event_id, start_iso, user_id", event_rows, "link_events", False),
+    ("links:transactions", "master_transactions", "txn_id",
+     "txn_id, date_posted, merchant_name, user_id", transaction_rows, "link_transactions", False),
+]
+
+class RebuildError(RuntimeError):
+    pass
+
+# --- Checkpoints ---
+
+def _load_state(phase):
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT last_key, rows, status FROM graph_rebuild_state WHERE phase = ?", (phase,)
+    ).fetchone()
+    conn.close()
+    if not row:
+        return {"last_key": "", "rows": 0, "status": None}
+    return {"last_key": row[0] or "", "rows": row[1] or 0, "status": row[2]}
+
+def _save_state(phase, state):
+    now = datetime.datetime.now().isoformat()
+    conn = get_connection()
+    conn.execute("""
+        INSERT INTO graph_rebuild_state (phase, last_key, rows, status, started_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(phase) DO UPDATE SET
+            last_key = excluded.last_key,
+            rows = excluded.rows,
+            status = excluded.status,
+            updated_at = excluded.updated_at
+    """, (phase, state["last_key"], state["rows"], state["status"], now, now))
+    conn.commit()
+    conn.close()
+
+def clear_state():
+    conn = get_connection()
+    conn.execute("DELETE FROM graph_rebuild_state")
+    conn.commit()
+    conn.close()
+
+def rebuild_status():
+    """Checkpoint rows of an in-progress (or interrupted) rebuild."""
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT phase, last_key, rows, status, started_at, updated_at FROM graph_rebuild_state"
+    ).fetchall()
+    conn.close()
+    keys = ("phase", "last_key", "rows", "status", "started_at", "updated_at")
+    return [dict(zip(keys, r)) for r in rows]
+
+# --- Phases ---
+
+def _read_chunk(table, key, columns, after, limit):
+    conn = get_connection()
+    cursor = conn.execute(
+        f"SELECT {columns} FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT ?", (after, limit)
+    )
+    names = [d[0] for d in cursor.description]
+    rows = [dict(zip(names, r)) for r in cursor.fetchall()]
+    conn.close()
+    return rows
+
+def _run_phase(gm, spec, chunk_size, concurrency):
+    phase, table, key, columns, build_rows, method, node_phase = spec
+    state = _load_state(phase)
+    if state["status"] == "DONE":
+        print(f"   {phase}: already done ({state['rows']} rows)")
+        return {"phase": phase, "rows": state["rows"], "resumed": True, "seconds": 0.0}
+
+    write = getattr(gm, method)
+    if node_phase:
+        write = functools.partial(write, link=False)
+    else:
+        concurrency = 1  # Shared Merchant / Day nodes: serialize to avoid lock contention
+
+    resumed = bool(state["last_key"])
+    if resumed:
+        print(f"   ↪️  {phase}: resuming after {key} {state['last_key']} ({state['rows']} done)")
+    state["status"] = "RUNNING"
+    _save_state(phase, state)
+
+    start, done = time.perf_counter(), 0
+    in_flight = deque()  # (future, last key of chunk, keys in chunk), in keyset order
+    cursor, exhausted = state["last_key"], False
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            while not exhausted and len(in_flight) < concurrency * 2:
+                chunk = _read_chunk(table, key, columns, cursor, chunk_size)
+                if not chunk:
+                    exhausted = True
+                    break
+                cursor = chunk[-1][key]
+                rows = [r for r in build_rows(chunk) if r["id"]]
+                in_flight.append((pool.submit(write, rows), cursor, [r[key] for r in chunk]))
+            if not in_flight:
+                break
+
+            future, last_key, keys = in_flight.popleft()
+            summary = future.result()
+            if summary["failed_chunks"]:
+                for pending, _, _ in in_flight:
+                    pending.cancel()
+                state["status"] = "FAILED"
+                _save_state(phase, state)
+                raise RebuildError(f"{phase}: write failed after {key} {state['last_key']}; re-run to resume")
+
+            if node_phase:
+                mark_as_synced(table, key, keys)
+            state["last_key"] = last_key
+            state["rows"] += len(keys)
+            _save_state(phase, state)
+            done += len(keys)
+            print(f"   {phase}: {state['rows']} rows ({done / max(time.perf_counter() - start, 1e-6):.0f} rows/s)")
+
+    state["status"] = "DONE"
+    _save_state(phase, state)
+    return {"phase": phase, "rows": state["rows"], "resumed": resumed, "seconds": round(time.perf_counter() - start, 1)}
+
+# --- Validation ---
+
+VALIDATION_CHECKS = [
+    ("Event nodes", "SELECT COUNT(*) FROM master_events",
+     lambda gm: gm.count_nodes("Event")),
+    ("Transaction nodes", "SELECT COUNT(*) FROM master_transactions",
+     lambda gm: gm.count_nodes("Transaction")),
+    ("PAID_TO edges", "SELECT COUNT(*) FROM master_transactions WHERE merchant_name IS NOT NULL",
+     lambda gm: gm.count_relationships("PAID_TO")),
+    ("ON edges", """
+        SELECT (SELECT COUNT(*) FROM master_transactions WHERE user_id IS NOT NULL AND date_posted IS NOT NULL)
+             + (SELECT COUNT(*) FROM master_events WHERE user_id IS NOT NULL AND start_iso IS NOT NULL)
+     """, lambda gm: gm.count_relationships("ON")),
+]
+
+def validate(gm):
+    """
+    Compares SQLite and graph counts. The graph may legitimately hold more
+    (rows deleted from SQLite, Event entities from chat threads); fewer means
+    rows are missing. Returns [{check, sqlite, graph, ok}].
+    """
+    conn = get_connection()
+    results = []
+    for name, sql, graph_count in VALIDATION_CHECKS:
+        expected = conn.execute(sql).fetchone()[0]
+        actual = graph_count(gm)
+        results.append({"check": name, "sqlite": expected, "graph": actual, "ok": actual >= expected})
+    conn.close()
+    return results
+
+# --- Entry point ---
+
+def run_rebuild(gm, restart=False, chunk_size=None, concurrency=None):
+    """
+    Rebuilds (or resumes rebuilding) the graph from SQLite, then validates.
+    Returns {"phases": [...], "validation": [...], "ok": bool}.
+    """
+    if not gm.verify_connection():
+        raise RebuildError("Graph DB not connected")
+
+    from logic.schema import ensure_constraints
+    ensure_constraints(gm)  # MERGE on id needs the uniqueness constraints to be fast
+
+    if restart:
+        clear_state()
+
+    chunk_size = chunk_size or GRAPH_REBUILD_CHUNK_SIZE
+    concurrency = concurrency or GRAPH_REBUILD_CONCURRENCY
+    phases = []
+    for spec in PHASES:
+        print(f"🔨 {spec[0]}")
+        phases.append(_run_phase(gm, spec, chunk_size, concurrency))
+
+    bump_data_generation(None)
+    validation = validate(gm)
+    ok = all(v["ok"] for v in validation)
+    clear_state()
+
+    log_event(
+        "GraphRebuild",
+        f"Rebuilt graph: {sum(p['rows'] for p in phases)} rows across {len(phases)} phases, "
+        f"validation {'passed' if ok else 'FAILED'}",
+        level="INFO" if ok else "WARNING",
+        metadata={"phases": phases, "validation": validation}
+    )
+    return {"phases": phases, "validation": validation, "ok": ok}
@@ -0,0 +1,234 @@
+"""
+Cypher query telemetry.
+
+Every GraphManager query is timed per call site, i.e. the GraphManager
+method that issued it, and recorded in `graph_query_metrics` (with the worker
+pid) through a batched background writer, like llm_metrics. Aggregates (calls,
+errors, rows, write counters, latency percentiles, sampled db hits) are
+computed from that table, so they cover every worker and survive restarts.
+GRAPH_PROFILE_SAMPLE_RATE of the queries run under PROFILE, and their
+operator db hits are summed. Queries slower than GRAPH_SLOW_QUERY_MS also go
+to `graph_slow_queries` (through a second writer) with their parameters
+reduced to shapes. The
+admin panel reads both through get_graph_metrics_summary().
+"""
+import os
+import re
+import json
+import time
+import random
+import sqlite3
+from contextlib import contextmanager
+from logic.sql_engine import get_connection
+from logic.telemetry import percentile, BatchWriter
+
+GRAPH_PROFILE_SAMPLE_RATE = float(os.getenv("GRAPH_PROFILE_SAMPLE_RATE", "0"))   # 0..1
+GRAPH_SLOW_QUERY_MS = float(os.getenv("GRAPH_SLOW_QUERY_MS", "500"))
+GRAPH_SLOW_QUERY_KEEP = int(os.getenv("GRAPH_SLOW_QUERY_KEEP", "1000"))           # Newest rows kept
+GRAPH_METRICS_RETENTION_DAYS = float(os.getenv("GRAPH_METRICS_RETENTION_DAYS", "7"))
+MAX_QUERY_CHARS = 4000
+
+COUNTER_FIELDS = ("nodes_created", "nodes_deleted", "relationships_created", "relationships_deleted", "properties_set")
+
+# Schema commands and CALL ... IN TRANSACTIONS can't run under PROFILE
+_UNPROFILABLE = re.compile(r"^\s*(EXPLAIN|PROFILE|CREATE\s+(CONSTRAINT|INDEX|VECTOR|RANGE|TEXT)|DROP|SHOW)\b|IN\s+TRANSACTIONS", re.I)
+
+_writer = BatchWriter(
+    "graph-metrics",
+    f"""
+    INSERT INTO graph_query_metrics
+    (created_at, call_site, pid, latency_ms, rows, db_hits, {", ".join(COUNTER_FIELDS)}, error_class)
+    VALUES (?, ?, ?, ?, ?, ?, {", ".join("?" * len(COUNTER_FIELDS))}, ?)
+    """,
+    prune_sql="DELETE FROM graph_query_metrics WHERE created_at < ?",
+    retention_seconds=GRAPH_METRICS_RETENTION_DAYS * 86400
+)
+
+# Capped by count: only the newest GRAPH_SLOW_QUERY_KEEP rows are kept
+_slow_writer = BatchWriter(
+    "graph-slow-queries",
+    """
+    INSERT INTO graph_slow_queries
+    (created_at, call_site, query, params, latency_ms, rows, db_hits, counters, error_class)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    prune_sql="DELETE FROM graph_slow_queries WHERE id <= (SELECT max(id) FROM graph_slow_queries) - ?",
+    prune_params=(GRAPH_SLOW_QUERY_KEEP,)
+)
+
+
+def counters_dict(counters):
+    """Write counters of a neo4j ResultSummary as a plain dict."""
+    return {f: getattr(counters, f, 0) or 0 for f in COUNTER_FIELDS}
+
+
+def db_hits(profile):
+    """Total db hits of a PROFILE plan (ResultSummary.profile)."""
+    if not profile:
+        return 0
+    return (profile.get("dbHits") or 0) + sum(db_hits(child) for child in profile.get("children") or [])
+
+
+def redact(value):
+    """Parameter shape without values: types, dict keys and list lengths."""
+    if isinstance(value, dict):
+        return {k: redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(value[0]), f"<{len(value)} items>"] if value else []
+    if value is None:
+        return None
+    return f"<{type(value).__name__}>"
+
+
+class QueryRecord:
+    def __init__(self, call_site, query, parameters):
+        self.call_site = call_site
+        self.query = query
+        self.parameters = parameters
+        self.rows = 0
+        self.counters = dict.fromkeys(COUNTER_FIELDS, 0)
+        self.profiled = GRAPH_PROFILE_SAMPLE_RATE > 0 and random.random() < GRAPH_PROFILE_SAMPLE_RATE \
+            and not _UNPROFILABLE.search(query)
+        self.db_hits = None
+        self.error_class = None
+
+    @property
+    def statement(self):
+        """The query to send: PROFILE-prefixed when this call was sampled."""
+        return "PROFILE " + self.query if self.profiled else self.query
+
+    def add_summary(self, summary):
+        """Adds counters (and db hits, when profiled) of a neo4j ResultSummary."""
+        for key, value in counters_dict(summary.counters).items():
+            self.counters[key] += value
+        if self.profiled:
+            self.db_hits = (self.db_hits or 0) + db_hits(summary.profile)
+
+
+@contextmanager
+def track_query(call_site, query, parameters=None):
+    """
+    Times the enclosed Cypher call and records it on exit.
+
+        with track_query("get_top_merchants", query, params) as rec:
+            result = session.run(rec.statement, params)
+            records = list(result)
+            rec.rows = len(records)
+            rec.add_summary(result.consume())
+    """
+    rec = QueryRecord(call_site, query, parameters)
+    start = time.perf_counter()
+    try:
+        yield rec
+    except BaseException as e:
+        rec.error_class = type(e).__name__
+        raise
+    finally:
+        record_query(rec, (time.perf_counter() - start) * 1000)
+
+
+def record_query(rec, latency_ms):
+    _writer.add((
+        time.time(),
+        rec.call_site,
+        os.getpid(),
+        latency_ms,
+        rec.rows,
+        rec.db_hits,
+        *(rec.counters[f] for f in COUNTER_FIELDS),
+        rec.error_class
+    ))
+    if latency_ms >= GRAPH_SLOW_QUERY_MS:
+        _log_slow_query(rec, latency_ms)
+
+
+def _log_slow_query(rec, latency_ms):
+    _slow_writer.add((
+        time.time(),
+        rec.call_site,
+        rec.query.strip()[:MAX_QUERY_CHARS],
+        json.dumps(redact(rec.parameters or {})),
+        latency_ms,
+        rec.rows,
+        rec.db_hits,
+        json.dumps(rec.counters),
+        rec.error_class
+    ))
+
+
+def get_slow_queries(limit=50):
+    _slow_writer.flush()
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("""
+        SELECT created_at, call_site, query, params, latency_ms, rows, db_hits, counters, error_class
+        FROM graph_slow_queries
+        ORDER BY id DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+    conn.close()
+    return [
+        dict(r, params=json.loads(r["params"] or "{}"), counters=json.loads(r["counters"] or "{}"))
+        for r in rows
+    ]
+
+
+def get_graph_metrics_summary(hours=24, slow_limit=50):
+    """
+    Per call site aggregates over the last `hours` (all workers), plus the most recent slow queries.
+    """
+    _writer.flush()  # Include this process's buffered queries
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(f"""
+        SELECT call_site, pid, latency_ms, rows, db_hits, {", ".join(COUNTER_FIELDS)}, error_class
+        FROM graph_query_metrics
+        WHERE created_at >= ?
+    """, (time.time() - hours * 3600,)).fetchall()
+    conn.close()
+
+    stats = {}
+    for r in rows:
+        s = stats.setdefault(r["call_site"], {
+            "calls": 0, "errors": 0, "rows": 0, "slow": 0, "profiled": 0, "db_hits": 0,
+            "total_ms": 0.0, "max_ms": 0.0, "latencies": [],
+            **dict.fromkeys(COUNTER_FIELDS, 0)
+        })
+        latency = r["latency_ms"] or 0.0
+        s["calls"] += 1
+        s["rows"] += r["rows"] or 0
+        s["total_ms"] += latency
+        s["max_ms"] = max(s["max_ms"], latency)
+        s["latencies"].append(latency)
+        for key in COUNTER_FIELDS:
+            s[key] += r[key] or 0
+        if r["error_class"]:
+            s["errors"] += 1
+        if r["db_hits"] is not None:
+            s["profiled"] += 1
+            s["db_hits"] += r["db_hits"]
+        if latency >= GRAPH_SLOW_QUERY_MS:
+            s["slow"] += 1
+
+    summary = []
+    for site, s in stats.items():
+        latencies = s.pop("latencies")
+        s["call_site"] = site
+        s["p50_ms"] = percentile(latencies, 50)
+        s["p95_ms"] = percentile(latencies, 95)
+        s["total_ms"] = round(s["total_ms"], 1)
+        s["max_ms"] = round(s["max_ms"], 1)
+        s["avg_db_hits"] = round(s["db_hits"] / s["profiled"]) if s["profiled"] else None
+        summary.append(s)
+
+    summary.sort(key=lambda x: x["total_ms"], reverse=True)
+    return {
+        "window_hours": hours,
+        "calls": sum(s["calls"] for s in summary),
+        "workers": len({r["pid"] for r in rows}),
+        "slow_threshold_ms": GRAPH_SLOW_QUERY_MS,
+        "profile_sample_rate": GRAPH_PROFILE_SAMPLE_RATE,
+        "by_call_site": summary,
+        "slow_queries": get_slow_queries(slow_limit)
+    }
+
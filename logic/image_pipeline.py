@@ -0,0 +1,118 @@
+"""
+Image preprocessing for the vision path.
+
+Uploads (multipart or legacy base64-in-JSON) are streamed through a SHA-256
+hash into a spooled temp file, decoded at reduced scale where the codec
+allows it (JPEG draft mode), rotated per EXIF, downscaled to IMAGE_MAX_EDGE
+and recompressed as JPEG. The hash of the original bytes is the dedup key:
+vision results are cached per (model, prompt, image hash), so the same
+receipt uploaded twice is analyzed once.
+"""
+import os
+import io
+import base64
+import hashlib
+import tempfile
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1600"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_MEMORY = 1024 * 1024  # Larger uploads spill to disk
+
+class ImageTooLargeError(ValueError):
+    pass
+
+class InvalidImageError(ValueError):
+    pass
+
+class PreparedImage:
+    """A downscaled, recompressed image ready to send to Gemini."""
+    def __init__(self, sha256, data, width, height, original_bytes, mime_type="image/jpeg"):
+        self.sha256 = sha256
+        self.data = data
+        self.width = width
+        self.height = height
+        self.original_bytes = original_bytes
+        self.mime_type = mime_type
+
+    def as_part(self):
+        """Inline blob for generate_content (no re-encoding by the SDK)."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+def _spool(chunks):
+    """Copies byte chunks into a spooled temp file while hashing. Returns (file, sha256, size)."""
+    digest = hashlib.sha256()
+    size = 0
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    for chunk in chunks:
+        size += len(chunk)
+        if size > IMAGE_MAX_UPLOAD_BYTES:
+            spool.close()
+            raise ImageTooLargeError(f"Image exceeds {IMAGE_MAX_UPLOAD_BYTES} bytes")
+        digest.update(chunk)
+        spool.write(chunk)
+    spool.seek(0)
+    return spool, digest.hexdigest(), size
+
+def _read_chunks(fileobj):
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+def _base64_chunks(text):
+    """Decodes base64 in 4-char-aligned slices so the whole payload is never decoded at once."""
+    step = (CHUNK_SIZE // 3) * 4
+    for i in range(0, len(text), step):
+        yield base64.b64decode(text[i:i + step])
+
+def _downscale(spool, sha256, size, max_edge):
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(spool) as img:
+            # JPEG: let the decoder skip straight to a scale >= max_edge (1/2, 1/4, 1/8)
+            img.draft("RGB", (max_edge, max_edge))
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+            return PreparedImage(sha256, out.getvalue(), img.width, img.height, size)
+    except (OSError, SyntaxError) as e:
+        raise InvalidImageError(f"Could not decode image: {e}")
+    finally:
+        spool.close()
+
+def prepare_image_stream(fileobj, max_edge=None):
+    """Prepares an image from a binary file object (e.g. UploadFile.file), reading it in chunks."""
+    spool, sha256, size = _spool(_read_chunks(fileobj))
+    return _downscale(spool, sha256, size, max_edge or IMAGE_MAX_EDGE)
+
+def prepare_image_base64(image_base64, max_edge=None):
+    """Prepares an image from a base64 string or data URL (legacy JSON /api/chat payloads)."""
+    if "," in image_base64[:100]:
+        image_base64 = image_base64.split(",", 1)[1]
+    image_base64 = "".join(image_base64.split())
+    try:
+        spool, sha256, size = _spool(_base64_chunks(image_base64))
+    except (ValueError, TypeError) as e:
+        if isinstance(e, ImageTooLargeError):
+            raise
+        raise InvalidImageError(f"Invalid base64 image: {e}")
+    return _downscale(spool, sha256, size, max_edge or IMAGE_MAX_EDGE)
+
+def prepare_image(image, max_edge=None):
+    """Accepts a PreparedImage, base64 string / data URL, raw bytes or a binary file object."""
+    if image is None or isinstance(image, PreparedImage):
+        return image
+    if isinstance(image, str):
+        return prepare_image_base64(image, max_edge)
+    if isinstance(image, (bytes, bytearray)):
+        return prepare_image_stream(io.BytesIO(image), max_edge)
+    return prepare_image_stream(image, max_edge)
@@ -1,70 +1,102 @@
-from logic.graph_db import GraphManager
+import os
 from logic.enrichment import EnrichmentManager
 
-def sync_calendar_to_graph(graph_manager, events):
-    if not graph_manager.driver:
-        return 0
-    
-    count = 0
-    query = """
-    MERGE (e:Event {id: $id})
-    SET e.summary = $summary,
-        e.start = $start,
-        e.end = $end,
-        e.recurringEventId = $recurringEventId,
-        e.user_id = $user_id
-    RETURN e
-    """
-    
-    for event in events:
-        params = {
+def _bump_generations(rows, summary):
+    """Cached graph queries for the synced users are stale once rows were written."""
+    if summary["rows"]:
+        from logic.sql_engine import bump_data_generation
+        bump_data_generation(list({r["user_id"] for r in rows}))
+
+def _log_sync(kind, summary):
+    from logic.sql_engine import log_event
+    rate = summary["rows"] / summary["seconds"] if summary["seconds"] else 0
+    log_event(
+        "GraphSync",
+        f"{kind}: {summary['rows']} rows in {summary['chunks']} chunks, {summary['seconds']}s ({rate:.0f} rows/s)",
+        level="WARNING" if summary["failed_chunks"] else "INFO",
+        metadata=summary
+    )
+
+def event_rows(events, user_id=None):
+    """master_events rows / Calendar events -> graph rows for upsert_events."""
+    return [
+        {
             "id": event.get("event_id") or event.get("id"),
             "summary": event.get("summary"),
             "start": event.get("start_iso") or event.get("start"),
             "end": event.get("end_iso") or event.get("end"),
             "recurringEventId": event.get("series_id") or event.get("recurringEventId"),
-            "user_id": event.get("user_id")
+            "user_id": event.get("user_id") or user_id
         }
-        graph_manager.query(query, params)
-        count += 1
-    return count
+        for event in events
+    ]
 
-def sync_transactions_to_graph(graph_manager, transactions):
-    if not graph_manager.driver:
-        return 0
-    
-    count = 0
-    query = """
-    MERGE (t:Transaction {id: $id})
-    SET t.amount = $amount,
-        t.date = $date,
-        t.category = $category,
-        t.user_id = $user_id
-    
-    MERGE (m:Merchant {name: $merchant})
-    MERGE (t)-[:PAID_TO]->(m)
-    RETURN t
-    """
-    
-    for txn in transactions:
-        params = {
+def transaction_rows(transactions, user_id=None):
+    """master_transactions rows / Plaid transactions -> graph rows for upsert_transactions."""
+    return [
+        {
             "id": txn.get("txn_id") or txn.get("id"),
             "amount": txn.get("amount"),
             "date": txn.get("date_posted") or txn.get("date"),
             "category": txn.get("category"),
             "merchant": txn.get("merchant_name") or txn.get("merchant"),
-            "user_id": txn.get("user_id")
+            "user_id": txn.get("user_id") or user_id
         }
-        graph_manager.query(query, params)
-        count += 1
-    return count
+        for txn in transactions
+    ]
+
+def _write_and_mark(write, rows, table, id_column):
+    """
+    Writes rows one GRAPH_SYNC_CHUNK_SIZE chunk at a time and marks each chunk that was
+    fully written as synced in SQLite. Rows of a failed chunk (or rows that never reached
+    an unavailable graph) keep is_synced_to_graph = 0 and go out with the next sync.
+    Returns the combined counters summary.
+    """
+    from logic.graph_db import GRAPH_SYNC_CHUNK_SIZE
+    from logic.sql_engine import mark_as_synced
+
+    summary = None
+    for i in range(0, max(len(rows), 1), GRAPH_SYNC_CHUNK_SIZE):
+        chunk = rows[i:i + GRAPH_SYNC_CHUNK_SIZE]
+        part = write(chunk)
+        if chunk and part["rows"] == len(chunk):
+            mark_as_synced(table, id_column, [r["id"] for r in chunk])
+        summary = part if summary is None else {k: summary[k] + part[k] for k in summary}
+    summary["seconds"] = round(summary["seconds"], 3)
+    return summary
+
+def sync_calendar_to_graph(graph_manager, events, user_id=None):
+    """
+    Upserts events into the graph in UNWIND batches (GRAPH_SYNC_CHUNK_SIZE per transaction)
+    and marks the written ones synced in master_events.
+    `user_id` fills in events that don't carry their own. Returns the counters summary.
+    """
+    rows = event_rows(events, user_id)
+    summary = _write_and_mark(graph_manager.upsert_events, [r for r in rows if r["id"]], "master_events", "event_id")
+    _bump_generations(rows, summary)
+    if rows:
+        _log_sync("events", summary)
+    return summary
 
-def run_enrichment(graph_manager):
+def sync_transactions_to_graph(graph_manager, transactions, user_id=None):
+    """
+    Upserts transactions (and their PAID_TO merchants) in UNWIND batches and marks the
+    written ones synced in master_transactions.
+    `user_id` fills in transactions that don't carry their own. Returns the counters summary.
     """
-    Runs the enrichment engine to link nodes.
+    rows = transaction_rows(transactions, user_id)
+    summary = _write_and_mark(graph_manager.upsert_transactions, [r for r in rows if r["id"]], "master_transactions", "txn_id")
+    _bump_generations(rows, summary)
+    if rows:
+        _log_sync("transactions", summary)
+    return summary
+
+def run_enrichment(graph_manager, user_id=None):
+    """
+    Runs the enrichment engine to link nodes (Day-bucket catch-up for unlinked nodes).
     """
     em = EnrichmentManager(graph_manager)
-    links = em.link_temporal_context()
+    links = em.link_temporal_context(user_id=user_id)
     return links
 
 def fetch_google_calendar(user_id):
@@ -95,29 +127,74 @@ def fetch_google_calendar(user_id):
         
     return events
 
-def sync_plaid_transactions(user_id):
+# "cursor": incremental /transactions/sync (default); "window": refetch the last 30 days every sync
+PLAID_SYNC_MODE = os.getenv("PLAID_SYNC_MODE", "cursor").lower()
+
+def sync_plaid_transactions(user_id=None):
     """
     Fetches transactions from Plaid and persists them to SQLite.
+
+    In cursor mode only changes since the Item's stored cursor are fetched:
+    added / modified transactions are bulk-upserted, removed ones are deleted
+    from SQLite, the merchant vector store and (through the graph write queue)
+    the graph. The cursor is saved only after the delta is applied to SQLite,
+    so a failed sync is simply replayed. Added / modified rows are left with
+    is_synced_to_graph = 0; callers push them with get_unsynced_data(), which
+    also retries rows an earlier graph write missed.
+    Returns the added + modified transactions.
     """
-    from integrations.plaid_api import fetch_transactions
-    from logic.sql_engine import upsert_transaction
+    from integrations.plaid_api import fetch_transactions, sync_transactions, item_key
+    from logic.sql_engine import upsert_transactions, get_plaid_cursor, save_plaid_cursor, log_event
     from logic.data_store import load_plaid_token
     
     # TODO: Load token for specific user
     token = load_plaid_token()
-    if token:
+    if not token:
+        return []
+
+    if PLAID_SYNC_MODE == "window":
         txns = fetch_transactions(token)
-        for t in txns:
-            upsert_transaction(user_id, t)
+        upsert_transactions(user_id, txns)
         return txns
-    return []
+
+    key = item_key(token)
+    delta = sync_transactions(token, get_plaid_cursor(key))
+    if delta is None:
+        return []
+
+    changed = delta["added"] + delta["modified"]
+    upsert_transactions(user_id, changed)
+    remove_transactions(delta["removed"], user_id=user_id)
+    save_plaid_cursor(key, user_id, delta["next_cursor"], len(delta["added"]), len(delta["modified"]), len(delta["removed"]))
+
+    if changed or delta["removed"]:
+        log_event(
+            "PlaidSync",
+            f"{len(delta['added'])} added, {len(delta['modified'])} modified, {len(delta['removed'])} removed",
+            level="INFO"
+        )
+    return changed
+
+def remove_transactions(txn_ids, user_id=None):
+    """Deletes transactions everywhere they are stored. Returns the number of ids."""
+    if not txn_ids:
+        return 0
+    from logic.sql_engine import delete_transactions, bump_data_generation
+    from logic.vector_store import get_store
+    from logic.graph_queue import enqueue_transaction_deletes
+
+    owners = delete_transactions(txn_ids)
+    get_store("transactions").delete(txn_ids)
+    enqueue_transaction_deletes(txn_ids, user_id=user_id)
+    bump_data_generation(owners or user_id)
+    return len(txn_ids)
 
 def backfill_transactions(user_id, days=365):
     """
     Backfills transactions for the specified number of days.
     """
     from integrations.plaid_api import fetch_transactions
-    from logic.sql_engine import upsert_transaction, log_event
+    from logic.sql_engine import upsert_transactions, log_event
     from logic.data_store import load_plaid_token
     
     # TODO: Load token for specific user
@@ -127,8 +204,7 @@ def backfill_transactions(user_id, days=365):
         try:
             txns = fetch_transactions(token, days=days)
             log_event("Backfill", f"Fetched {len(txns)} transactions. Upserting...", level="INFO")
-            for t in txns:
-                upsert_transaction(user_id, t)
+            upsert_transactions(user_id, txns)
             log_event("Backfill", "Backfill complete.", level="SUCCESS")
             return len(txns)
         except Exception as e:
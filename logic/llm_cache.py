@@ -0,0 +1,128 @@
+"""
+Response cache for Gemini calls.
+
+Two tiers, both keyed by sha256(model + prompt):
+1. In-process LRU (microsecond hits, per worker).
+2. SQLite table `llm_cache` (shared across workers and restarts).
+
+TTLs are configured per call site; a TTL of 0 disables caching for that site.
+Every lookup is tagged "hit", "miss" or "bypass" in CACHE_STATS.
+"""
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from logic.sql_engine import get_connection
+
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+
+# Seconds a response stays valid, per call site
+CACHE_TTLS = {
+    "classify": 60 * 60,              # Intent routing for a given query + history
+    "respond": 5 * 60,                # Prompt embeds the fetched context, so short-lived
+    "categorize": 7 * 24 * 60 * 60,   # Same merchant + amount + neighbors
+    "categorize-batch": 7 * 24 * 60 * 60,
+    "thread-summary": 30 * 24 * 60 * 60,
+    "vision": 30 * 24 * 60 * 60,
+    "default": 60 * 60,
+}
+
+CACHE_STATS = {}
+
+_lru = OrderedDict()
+_lock = threading.Lock()
+_writes_since_purge = 0
+
+
+def make_key(model_name, prompt):
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def ttl_for(call_site, ttl=None):
+    if ttl is not None:
+        return ttl
+    return CACHE_TTLS.get(call_site, CACHE_TTLS["default"])
+
+
+def record(call_site, status):
+    with _lock:
+        site = CACHE_STATS.setdefault(call_site, {"hit": 0, "miss": 0, "bypass": 0})
+        site[status] += 1
+
+
+def get(key):
+    """Returns the cached response for `key`, or None."""
+    now = time.time()
+
+    with _lock:
+        entry = _lru.get(key)
+        if entry:
+            value, expires_at = entry
+            if expires_at > now:
+                _lru.move_to_end(key)
+                return value
+            del _lru[key]
+
+    try:
+        conn = get_connection()
+        row = conn.execute(
+            "SELECT response, expires_at FROM llm_cache WHERE cache_key = ?", (key,)
+        ).fetchone()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"LLM cache read error: {e}")
+        return None
+
+    if not row or row[1] <= now:
+        return None
+
+    _remember(key, row[0], row[1])
+    return row[0]
+
+
+def put(key, model_name, call_site, response, ttl):
+    global _writes_since_purge
+    expires_at = time.time() + ttl
+    _remember(key, response, expires_at)
+
+    try:
+        conn = get_connection()
+        conn.execute("""
+            INSERT OR REPLACE INTO llm_cache (cache_key, model, call_site, response, created_at, expires_at)
+            VALUES (?, ?, ?, ?, datetime('now'), ?)
+        """, (key, model_name, call_site, response, expires_at))
+
+        _writes_since_purge += 1
+        if _writes_since_purge >= 100:
+            conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+            _writes_since_purge = 0
+
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"LLM cache write error: {e}")
+
+
+def _remember(key, value, expires_at):
+    with _lock:
+        _lru[key] = (value, expires_at)
+        _lru.move_to_end(key)
+        while len(_lru) > CACHE_MAX_ENTRIES:
+            _lru.popitem(last=False)
+
+
+def clear():
+    """Drops both tiers."""
+    with _lock:
+        _lru.clear()
+    conn = get_connection()
+    conn.execute("DELETE FROM llm_cache")
+    conn.commit()
+    conn.close()
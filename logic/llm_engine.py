@@ -1,92 +1,724 @@
 import os
+import json
+import time
+import random
+import asyncio
+import threading
 import google.generativeai as genai
 from dotenv import load_dotenv
+from logic import llm_cache
+from logic import telemetry
 
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()  # "gemini" | "fake"
+MODEL_NAME = 'gemini-flash-latest'
+EMBEDDING_MODEL = "models/text-embedding-004"
 
-if GOOGLE_API_KEY:
+# --- Model Routing ---
+# Each call site maps to a tier; LLM_MODEL_<CALL_SITE> (e.g. LLM_MODEL_CLASSIFY,
+# LLM_MODEL_CATEGORIZE_BATCH) overrides the model for one site.
+MODEL_TIERS = {
+    "lite": os.getenv("LLM_MODEL_LITE", "gemini-flash-lite-latest"),
+    "standard": os.getenv("LLM_MODEL_STANDARD", MODEL_NAME),
+    "pro": os.getenv("LLM_MODEL_PRO", "gemini-pro-latest"),
+}
+MODEL_ROUTES = {
+    "classify": "lite",
+    "categorize": "lite",
+    "categorize-batch": "lite",
+    "thread-summary": "lite",
+    "respond": "standard",
+    "vision": "standard",
+    "default": "standard",
+}
+# Where a call goes after a parse failure or a low-confidence answer
+ESCALATION = {"lite": "standard", "standard": "pro"}
+LLM_ESCALATION_ENABLED = os.getenv("LLM_ESCALATION_ENABLED", "true").lower() == "true"
+JSON_MODE = {"response_mime_type": "application/json"}
+
+# Client limits (global per process)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "250000"))
+LLM_EMBED_REQUESTS_PER_MINUTE = int(os.getenv("LLM_EMBED_REQUESTS_PER_MINUTE", "1500"))  # Separate embedding quota
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+
+# --- Errors ---
+
+class LLMError(Exception):
+    """Base class for LLM client failures."""
+    retryable = False
+
+class LLMConfigError(LLMError):
+    """API key missing or client not configured."""
+
+class LLMRateLimitError(LLMError):
+    """Quota / 429 from the provider."""
+    retryable = True
+
+class LLMTimeoutError(LLMError):
+    """Per-call deadline exceeded (including time spent waiting for a slot)."""
+    retryable = True
+
+class LLMUnavailableError(LLMError):
+    """Transient provider failure (5xx, connection reset)."""
+    retryable = True
+
+class LLMResponseError(LLMError):
+    """Provider answered but the response is unusable (blocked, empty)."""
+
+class LLMParseError(LLMResponseError):
+    """Structured output could not be parsed / validated, even after repair."""
+
+def _wrap_error(e):
+    """Maps provider exceptions onto the LLMError hierarchy."""
+    if isinstance(e, LLMError):
+        return e
+    name = type(e).__name__
+    if name in ("ResourceExhausted", "TooManyRequests"):
+        return LLMRateLimitError(str(e))
+    if name in ("DeadlineExceeded", "TimeoutError", "ReadTimeout"):
+        return LLMTimeoutError(str(e))
+    if name in ("ServiceUnavailable", "InternalServerError", "BadGateway", "GatewayTimeout",
+                "Aborted", "ConnectionError", "RetryError"):
+        return LLMUnavailableError(str(e))
+    if name in ("BlockedPromptException", "StopCandidateException", "ValueError"):
+        # ValueError: response.text accessed on a response with no valid parts
+        return LLMResponseError(str(e))
+    return LLMError(f"{name}: {e}")
+
+# --- Rate Limiting ---
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `per_minute / 60` per second.
+    reserve() books capacity immediately and returns how long the caller must wait,
+    so concurrent callers queue fairly instead of all sleeping and retrying.
+    """
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount=1.0):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            amount = min(amount, self.capacity)
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self, amount=1.0):
+        """Returns a reservation the caller abandoned (deadline hit, no slot, cancelled)."""
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+def estimate_tokens(content):
+    """Rough token estimate (~4 characters per token) for rate limiting."""
+    if isinstance(content, (list, tuple)):
+        return sum(estimate_tokens(c) for c in content if isinstance(c, str)) + 258 * sum(1 for c in content if not isinstance(c, str))
+    return max(1, len(str(content)) // 4)
+
+# --- Client ---
+
+class GeminiClient:
+    """
+    Gemini client shared by every call site.
+    - Global concurrency limit (threading semaphore, also used by the async path)
+    - Requests-per-minute and tokens-per-minute token buckets (embeddings have their own
+      request bucket); reservations are refunded when a call gives up before sending
+    - Per-call deadline covering queueing, throttling, retries and the request itself
+    - Jittered exponential backoff on retryable errors
+    """
+    def __init__(self, model_name=MODEL_NAME, backend=None):
+        self.model_name = model_name
+        # `backend` swaps the provider (e.g. fake_llm.FakeModel); limits and retries still apply
+        self.model = backend or genai.GenerativeModel(model_name)
+        self._embed_content = getattr(backend, "embed_content", None) or genai.embed_content
+        self._slots = _llm_slots
+        self._requests = _request_bucket
+        self._tokens = _token_bucket
+        self._embed_requests = _embed_request_bucket
+
+    def _throttle_wait(self, content):
+        return max(self._requests.reserve(1), self._tokens.reserve(estimate_tokens(content) + 256))
+
+    def _refund(self, content):
+        self._requests.refund(1)
+        self._tokens.refund(estimate_tokens(content) + 256)
+
+    async def _aacquire_slot(self, timeout):
+        """Slot acquire off the event loop. A slot that arrives after the caller was cancelled is released."""
+        acquire = asyncio.ensure_future(asyncio.to_thread(self._slots.acquire, True, timeout))
+        try:
+            return await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            def release_late(future):
+                if not future.cancelled() and future.exception() is None and future.result():
+                    self._slots.release()
+            acquire.add_done_callback(release_late)
+            raise
+
+    def _backoff(self, attempt):
+        return min(8.0, 0.5 * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+    # Sync path
+
+    def generate(self, content, timeout=None, generation_config=None):
+        deadline = time.monotonic() + (timeout or LLM_TIMEOUT_SECONDS)
+        attempt = 0
+        while True:
+            wait = self._throttle_wait(content)
+            if time.monotonic() + wait >= deadline:
+                self._refund(content)
+                raise LLMTimeoutError("Rate limit wait exceeds deadline")
+            if wait:
+                time.sleep(wait)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._slots.acquire(timeout=remaining):
+                self._refund(content)
+                raise LLMTimeoutError("Timed out waiting for an LLM slot")
+            try:
+                response = self.model.generate_content(
+                    content,
+                    generation_config=generation_config,
+                    request_options={"timeout": max(1.0, deadline - time.monotonic())}
+                )
+                response.text  # Raises on blocked / empty candidates
+                return response
+            except Exception as e:
+                error = _wrap_error(e)
+            finally:
+                self._slots.release()
+
+            delay = self._backoff(attempt)
+            if not error.retryable or attempt >= LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                raise error
+            print(f"Gemini retry {attempt + 1}/{LLM_MAX_RETRIES} after {type(error).__name__}: {error}")
+            time.sleep(delay)
+            attempt += 1
+
+    def generate_stream(self, content, timeout=None, generation_config=None, record=None):
+        """
+        Yields text chunks as Gemini produces them.
+        Retries only before the first chunk; the concurrency slot is held until the stream ends.
+        `record` (telemetry CallRecord) receives usage metadata from the chunks.
+        """
+        deadline = time.monotonic() + (timeout or LLM_TIMEOUT_SECONDS)
+        attempt = 0
+        while True:
+            wait = self._throttle_wait(content)
+            if time.monotonic() + wait >= deadline:
+                self._refund(content)
+                raise LLMTimeoutError("Rate limit wait exceeds deadline")
+            if wait:
+                time.sleep(wait)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._slots.acquire(timeout=remaining):
+                self._refund(content)
+                raise LLMTimeoutError("Timed out waiting for an LLM slot")
+            started = False
+            try:
+                response = self.model.generate_content(
+                    content,
+                    generation_config=generation_config,
+                    stream=True,
+                    request_options={"timeout": max(1.0, deadline - time.monotonic())}
+                )
+                for chunk in response:
+                    if record is not None:
+                        record.set_usage(chunk)
+                    text = chunk.text
+                    if text:
+                        started = True
+                        yield text
+                return
+            except Exception as e:
+                error = _wrap_error(e)
+                if started:
+                    raise error
+            finally:
+                self._slots.release()
+
+            delay = self._backoff(attempt)
+            if not error.retryable or attempt >= LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                raise error
+            time.sleep(delay)
+            attempt += 1
+
+    def embed(self, content, task_type="retrieval_document", timeout=None):
+        deadline = time.monotonic() + (timeout or LLM_TIMEOUT_SECONDS)
+        attempt = 0
+        while True:
+            wait = self._embed_requests.reserve(1)
+            if time.monotonic() + wait >= deadline:
+                self._embed_requests.refund(1)
+                raise LLMTimeoutError("Rate limit wait exceeds deadline")
+            if wait:
+                time.sleep(wait)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._slots.acquire(timeout=remaining):
+                self._embed_requests.refund(1)
+                raise LLMTimeoutError("Timed out waiting for an LLM slot")
+            try:
+                result = self._embed_content(
+                    model=EMBEDDING_MODEL,
+                    content=content,
+                    task_type=task_type,
+                    title="ContextOS Embedding" if task_type == "retrieval_document" else None,
+                    request_options={"timeout": max(1.0, deadline - time.monotonic())}
+                )
+                return result['embedding']
+            except Exception as e:
+                error = _wrap_error(e)
+            finally:
+                self._slots.release()
+
+            delay = self._backoff(attempt)
+            if not error.retryable or attempt >= LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                raise error
+            time.sleep(delay)
+            attempt += 1
+
+    # Async path
+
+    async def agenerate(self, content, timeout=None, generation_config=None):
+        deadline = time.monotonic() + (timeout or LLM_TIMEOUT_SECONDS)
+        attempt = 0
+        while True:
+            wait = self._throttle_wait(content)
+            if time.monotonic() + wait >= deadline:
+                self._refund(content)
+                raise LLMTimeoutError("Rate limit wait exceeds deadline")
+            try:
+                if wait:
+                    await asyncio.sleep(wait)
+                remaining = deadline - time.monotonic()
+                acquired = remaining > 0 and await self._aacquire_slot(remaining)
+            except asyncio.CancelledError:
+                self._refund(content)
+                raise
+            if not acquired:
+                self._refund(content)
+                raise LLMTimeoutError("Timed out waiting for an LLM slot")
+            try:
+                response = await asyncio.wait_for(
+                    self.model.generate_content_async(content, generation_config=generation_config),
+                    timeout=max(1.0, deadline - time.monotonic())
+                )
+                response.text
+                return response
+            except asyncio.TimeoutError:
+                error = LLMTimeoutError("Gemini request exceeded deadline")
+            except Exception as e:
+                error = _wrap_error(e)
+            finally:
+                self._slots.release()
+
+            delay = self._backoff(attempt)
+            if not error.retryable or attempt >= LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                raise error
+            await asyncio.sleep(delay)
+            attempt += 1
+
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+_request_bucket = TokenBucket(LLM_REQUESTS_PER_MINUTE)
+_token_bucket = TokenBucket(LLM_TOKENS_PER_MINUTE)
+_embed_request_bucket = TokenBucket(LLM_EMBED_REQUESTS_PER_MINUTE)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _new_client(model_name):
+    if LLM_PROVIDER == "fake":
+        from logic.fake_llm import FakeModel
+        return GeminiClient(model_name, backend=FakeModel(model_name))
+    return GeminiClient(model_name)
+
+if LLM_PROVIDER == "fake":
+    client = _new_client(MODEL_NAME)
+    model = client.model
+    print("LLM_PROVIDER=fake: using the deterministic local stand-in for Gemini")
+elif GOOGLE_API_KEY:
     genai.configure(api_key=GOOGLE_API_KEY)
-    model = genai.GenerativeModel('gemini-flash-latest')
+    client = _new_client(MODEL_NAME)
+    model = client.model  # Kept for callers that use the raw model
 else:
+    client = None
     model = None
     print("Warning: GOOGLE_API_KEY not found in .env")
 
-def ask_gemini(prompt):
+if client:
+    _clients[MODEL_NAME] = client
+
+def model_for(call_site):
+    """Model name for a call site: LLM_MODEL_<SITE> env override, else its tier in MODEL_ROUTES."""
+    override = os.getenv("LLM_MODEL_" + call_site.upper().replace("-", "_"))
+    if override:
+        return override
+    return MODEL_TIERS[MODEL_ROUTES.get(call_site, MODEL_ROUTES["default"])]
+
+def escalation_for(model_name):
+    """Next larger model, or None if escalation is off or model_name is already the top tier."""
+    if not LLM_ESCALATION_ENABLED:
+        return None
+    for tier, name in MODEL_TIERS.items():
+        if name == model_name and tier in ESCALATION:
+            return MODEL_TIERS[ESCALATION[tier]]
+    return None
+
+def _require_client(model_name=MODEL_NAME):
+    """Shared client per model name (they all draw on the same slots and rate limits)."""
+    if not client:
+        raise LLMConfigError("Gemini API Key missing.")
+    llm = _clients.get(model_name)
+    if llm is None:
+        with _clients_lock:
+            llm = _clients.get(model_name)
+            if llm is None:
+                llm = _clients[model_name] = _new_client(model_name)
+    return llm
+
+def _cache_lookup(call_site, prompt, cache, ttl, rec, model_name=MODEL_NAME):
+    """
+    Returns (key, ttl, cached_text). key is None when caching is bypassed.
+    Tags the telemetry record with hit / miss / bypass.
+    """
+    ttl = llm_cache.ttl_for(call_site, ttl)
+    if not (cache and ttl > 0 and llm_cache.CACHE_ENABLED):
+        llm_cache.record(call_site, "bypass")
+        rec.cache_status = "bypass"
+        return None, ttl, None
+
+    key = llm_cache.make_key(model_name, prompt)
+    cached = llm_cache.get(key)
+    status = "hit" if cached is not None else "miss"
+    llm_cache.record(call_site, status)
+    rec.cache_status = status
+    return key, ttl, cached
+
+# --- Public API ---
+
+def ask_gemini(prompt, call_site="default", cache=True, ttl=None, timeout=None):
     """
     Sends a prompt to Gemini and returns the text response.
-    Returns None if API is not configured.
+    Raises LLMError (or a subclass) on failure instead of returning error strings.
+
+    Responses are cached by model + prompt (see logic/llm_cache.py).
+    Pass cache=False for non-deterministic uses; `ttl` overrides the call-site TTL.
     """
-    if not model:
-        return "Error: Gemini API Key missing."
-    
-    try:
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        print(f"Gemini Error: {e}")
-        return f"Error generating content: {e}"
+    model_name = model_for(call_site)
+    llm = _require_client(model_name)
+
+    with telemetry.track(call_site, model_name) as rec:
+        key, ttl, cached = _cache_lookup(call_site, prompt, cache, ttl, rec, model_name)
+        if cached is not None:
+            return cached
+
+        try:
+            response = llm.generate(prompt, timeout=timeout)
+        except LLMError as e:
+            print(f"Gemini Error [{call_site}]: {type(e).__name__}: {e}")
+            raise
+        rec.set_usage(response)
+        text = response.text
 
-def ask_gemini_json(prompt):
+        if key:
+            llm_cache.put(key, model_name, call_site, text, ttl)
+        return text
+
+async def ask_gemini_async(prompt, call_site="default", cache=True, ttl=None, timeout=None):
+    """
+    Async variant of ask_gemini for use inside event loops.
+    """
+    model_name = model_for(call_site)
+    llm = _require_client(model_name)
+
+    with telemetry.track(call_site, model_name) as rec:
+        key, ttl, cached = _cache_lookup(call_site, prompt, cache, ttl, rec, model_name)
+        if cached is not None:
+            return cached
+
+        response = await llm.agenerate(prompt, timeout=timeout)
+        rec.set_usage(response)
+        text = response.text
+
+        if key:
+            llm_cache.put(key, model_name, call_site, text, ttl)
+        return text
+
+def ask_gemini_stream(prompt, call_site="default", cache=True, ttl=None, timeout=None):
+    """
+    Streaming variant of ask_gemini: yields text chunks.
+    A cache hit is yielded as a single chunk; a completed stream is written to the cache.
+    """
+    model_name = model_for(call_site)
+    llm = _require_client(model_name)
+
+    with telemetry.track(call_site, model_name) as rec:
+        key, ttl, cached = _cache_lookup(call_site, prompt, cache, ttl, rec, model_name)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        for chunk in llm.generate_stream(prompt, timeout=timeout, record=rec):
+            chunks.append(chunk)
+            yield chunk
+
+        if key:
+            llm_cache.put(key, model_name, call_site, "".join(chunks), ttl)
+
+def _strip_json_fences(text):
+    return text.replace("```json", "").replace("```", "").strip()
+
+def ask_gemini_json(prompt, call_site="default", cache=True, ttl=None, timeout=None):
     """
-    Asks Gemini to return a JSON object. 
+    Asks Gemini to return a JSON object.
     Appends 'Return JSON only.' to the prompt.
     """
     json_prompt = f"{prompt}\n\nReturn valid JSON only. Do not use markdown code blocks."
-    response_text = ask_gemini(json_prompt)
-    
+    response_text = ask_gemini(json_prompt, call_site=call_site, cache=cache, ttl=ttl, timeout=timeout)
+
     # Clean up potential markdown formatting
-    response_text = response_text.replace("```json", "").replace("```", "").strip()
-    
-    return response_text
+    return _strip_json_fences(response_text)
+
+async def ask_gemini_json_async(prompt, call_site="default", cache=True, ttl=None, timeout=None):
+    json_prompt = f"{prompt}\n\nReturn valid JSON only. Do not use markdown code blocks."
+    response_text = await ask_gemini_async(json_prompt, call_site=call_site, cache=cache, ttl=ttl, timeout=timeout)
+    return _strip_json_fences(response_text)
+
+# --- Structured Output ---
+
+def extract_json(text):
+    """
+    Tolerant JSON extractor.
+    Skips prose and markdown fences, returns the first balanced JSON object/array.
+    A truncated tail is repaired before parsing: first by closing the open string
+    and brackets, then by cutting back to the last complete value (the last `,`,
+    opening or closing bracket outside a string) and closing the brackets open there.
+    Raises ValueError if nothing parseable is found.
+    """
+    text = _strip_json_fences(text)
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        raise ValueError("No JSON object found in response")
+    start = min(starts)
+
+    stack = []
+    cuts = []  # (end, closers): text[start:end] + closers is a complete prefix
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            cuts.append((i + 1, "".join(reversed(stack))))
+        elif ch in "}]":
+            if not stack or stack.pop() != ch:
+                raise ValueError(f"Unbalanced JSON at position {i}")
+            if not stack:
+                return json.loads(text[start:i + 1])
+            cuts.append((i + 1, "".join(reversed(stack))))
+        elif ch == ",":
+            cuts.append((i, "".join(reversed(stack))))
+
+    # Truncated output: close what is open, else drop the incomplete trailing value
+    candidate = text[start:].rstrip().rstrip(",")
+    if in_string:
+        candidate += '"'
+    try:
+        return json.loads(candidate + "".join(reversed(stack)))
+    except json.JSONDecodeError as e:
+        error = e
+    for end, closers in reversed(cuts):
+        try:
+            return json.loads(text[start:end] + closers)
+        except json.JSONDecodeError:
+            continue
+    raise error
+
+def _validate(model_cls, data):
+    if hasattr(model_cls, "model_validate"):
+        return model_cls.model_validate(data)
+    return model_cls.parse_obj(data)
 
-def get_embedding(text):
+def _json_schema(model_cls):
+    if hasattr(model_cls, "model_json_schema"):
+        return model_cls.model_json_schema()
+    return model_cls.schema()
+
+def _parse_structured(text, model_cls):
+    return _validate(model_cls, extract_json(text))
+
+def _structured_call(json_prompt, model_cls, call_site, model_name, cache, ttl, timeout, track_as=None):
+    """
+    One JSON-mode call (or cache hit) parsed into `model_cls`.
+    Returns (result, text, error, key, ttl); result is None when parsing failed.
+    Only responses that parse are cached.
+    """
+    llm = _require_client(model_name)
+    with telemetry.track(track_as or call_site, model_name) as rec:
+        key, ttl, cached = _cache_lookup(call_site, "json:" + json_prompt, cache, ttl, rec, model_name)
+        if cached is not None:
+            text = cached
+        else:
+            response = llm.generate(json_prompt, timeout=timeout, generation_config=JSON_MODE)
+            rec.set_usage(response)
+            text = response.text
+
+        try:
+            result = _parse_structured(text, model_cls)
+            rec.parse_status = "ok"
+            if key and cached is None:
+                llm_cache.put(key, model_name, call_site, text, ttl)
+            return result, text, None, key, ttl
+        except Exception as e:
+            rec.parse_status = "failed"
+            return None, text, e, key, ttl
+
+def ask_structured(prompt, model_cls, call_site="default", cache=True, ttl=None, timeout=None, escalate_if=None):
+    """
+    Asks Gemini for JSON matching `model_cls` (a pydantic model from logic/schemas.py)
+    and returns a validated instance.
+
+    - Routed to model_for(call_site) and requests JSON mode (response_mime_type=application/json)
+    - Parses with extract_json (tolerant of fences, prose and truncation)
+    - On failure, makes one targeted repair call with the validation error,
+      on the next larger model when one is configured (escalation_for)
+    - Raises LLMParseError if the repaired output is still invalid
+    - If `escalate_if(result)` is true (e.g. low confidence), re-asks once on the
+      larger model, tracked as "<call_site>-escalate"; the larger model's answer wins
+    The outcome (ok / repaired / failed) is recorded in llm_metrics.parse_status.
+    """
+    model_name = model_for(call_site)
+    bigger = escalation_for(model_name)
+    json_prompt = f"{prompt}\n\nReturn valid JSON only. Do not use markdown code blocks."
+
+    result, text, first_error, key, ttl = _structured_call(json_prompt, model_cls, call_site, model_name, cache, ttl, timeout)
+
+    if first_error is not None:
+        # One targeted repair attempt
+        repair_model = bigger or model_name
+        repair_prompt = f"""
+    The JSON below failed validation.
+    Error: {first_error}
+
+    JSON:
+    {text[:4000]}
+
+    Return corrected JSON only, matching this JSON Schema:
+    {json.dumps(_json_schema(model_cls))}
+    """
+        with telemetry.track(f"{call_site}-repair", repair_model) as rec:
+            response = _require_client(repair_model).generate(repair_prompt, timeout=timeout, generation_config=JSON_MODE)
+            rec.set_usage(response)
+            try:
+                result = _parse_structured(response.text, model_cls)
+                rec.parse_status = "repaired"
+            except Exception as e:
+                rec.parse_status = "failed"
+                raise LLMParseError(f"{call_site}: {e}") from first_error
+        if key:
+            llm_cache.put(key, model_name, call_site, response.text, ttl)
+        return result
+
+    if escalate_if and bigger and escalate_if(result):
+        try:
+            escalated, _, error, _, _ = _structured_call(
+                json_prompt, model_cls, call_site, bigger, cache, None, timeout, track_as=f"{call_site}-escalate"
+            )
+            if error is None:
+                return escalated
+        except LLMError as e:
+            print(f"Escalation to {bigger} failed [{call_site}]: {type(e).__name__}: {e}")
+    return result
+
+def get_embedding(text, call_site="embed"):
     """
     Generates a vector embedding for the given text using 'text-embedding-004'.
-    Returns a list of floats.
+    Returns a list of floats, or None on failure.
     """
-    if not GOOGLE_API_KEY:
+    if not client:
         return None
-        
+
     try:
-        result = genai.embed_content(
-            model="models/text-embedding-004",
-            content=text,
-            task_type="retrieval_document",
-            title="ContextOS Embedding"
-        )
-        return result['embedding']
-    except Exception as e:
-        print(f"Embedding Error: {e}")
+        with telemetry.track(call_site, EMBEDDING_MODEL) as rec:
+            rec.prompt_tokens = estimate_tokens(text)
+            return client.embed(text)
+    except LLMError as e:
+        print(f"Embedding Error: {type(e).__name__}: {e}")
         return None
 
-def ask_gemini_vision_json(prompt, image_base64):
+def get_embeddings(texts, call_site="embed"):
     """
-    Multimodal request: Text + Image -> JSON.
+    Batch variant of get_embedding: one request for many texts.
+    Returns a list aligned with `texts`; every entry is None if the request failed.
     """
-    if not model:
-        return "{}"
-
-    import base64
-    from io import BytesIO
-    from PIL import Image
+    texts = list(texts)
+    if not client or not texts:
+        return [None] * len(texts)
 
     try:
-        # Decode base64 to bytes
-        if "," in image_base64:
-            image_base64 = image_base64.split(",")[1]
-            
-        image_data = base64.b64decode(image_base64)
-        image = Image.open(BytesIO(image_data))
-        
-        json_prompt = f"{prompt}\n\nReturn valid JSON only. No markdown."
-        
-        response = model.generate_content([json_prompt, image])
-        
-        text = response.text
-        text = text.replace("```json", "").replace("```", "").strip()
+        with telemetry.track(call_site, EMBEDDING_MODEL) as rec:
+            rec.prompt_tokens = sum(estimate_tokens(t) for t in texts)
+            vectors = client.embed(texts)
+        return list(vectors) if len(vectors) == len(texts) else [None] * len(texts)
+    except LLMError as e:
+        print(f"Batch Embedding Error ({len(texts)} texts): {type(e).__name__}: {e}")
+        return [None] * len(texts)
+
+VISION_EXTRACTION_PROMPT = """
+Describe this image as structured data. If it is a receipt or invoice, include
+merchant, date, total, currency and line items (name, amount). Otherwise include
+the visible text and the main things shown.
+Return valid JSON only. No markdown.
+"""
+
+def ask_gemini_vision_json(image, call_site="vision", cache=True, ttl=None, timeout=None):
+    """
+    Multimodal request: Image -> JSON string, using the fixed VISION_EXTRACTION_PROMPT.
+    `image` is a PreparedImage (logic/image_pipeline.py) or a base64 string / data URL,
+    which is downscaled and recompressed first. The user's question is applied by the
+    caller to the extracted JSON, so results are cached by model and the hash of the
+    original image bytes alone: a re-uploaded receipt is not re-analyzed, whatever is asked.
+    """
+    from logic.image_pipeline import prepare_image
+
+    model_name = model_for(call_site)
+    llm = _require_client(model_name)
+    image = prepare_image(image)
+
+    with telemetry.track(call_site, model_name) as rec:
+        key, ttl, cached = _cache_lookup(call_site, f"vision:{image.sha256}", cache, ttl, rec, model_name)
+        if cached is not None:
+            return cached
+
+        response = llm.generate([VISION_EXTRACTION_PROMPT, image.as_part()], timeout=timeout, generation_config=JSON_MODE)
+        rec.set_usage(response)
+        text = _strip_json_fences(response.text)
+
+        if key:
+            llm_cache.put(key, model_name, call_site, text, ttl)
         return text
-    except Exception as e:
-        print(f"Vision Error: {e}")
-        raise e
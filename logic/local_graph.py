@@ -0,0 +1,620 @@
+"""
+Embedded graph backend: SQLite adjacency tables + the local vector store.
+
+Selected with GRAPH_BACKEND=local (see graph_db.get_graph_manager). Implements
+the same named operations as GraphManager, so single-user installs get the
+context graph, thought linking and insights without a Neo4j server. The raw
+Cypher methods (query / run_cypher / write_batches) are Neo4j-only and not
+defined here; callers check `gm.backend == "neo4j"` first.
+
+Storage (GRAPH_LOCAL_PATH):
+    graph_nodes  node_id "<label>:<key>", label, key, user_id, props (JSON)
+    graph_edges  (src, rel, dst) - one row per distinct edge, indexed both ways
+
+Nodes are keyed like the Neo4j MERGE keys: `id` for Events, Transactions,
+Thoughts, ChatThreads and Archives, `name` for entities (Merchant, Person,
+...), `key` for Day. Embeddings live in per-label VectorStores
+("graph_<label>") instead of a node property.
+"""
+import os
+import json
+import math
+import time
+import uuid
+import sqlite3
+import datetime
+import threading
+
+from logic.graph_db import (
+    EMBEDDING_TARGETS, ENTITY_LABELS, ID_LABELS, NOTE_LABELS, GRAPH_SYNC_CHUNK_SIZE,
+    GRAPH_SEARCH_MAX_DEPTH, GRAPH_SEARCH_HOP_DECAY, GRAPH_SEARCH_RECENCY_DAYS,
+    GRAPH_SEARCH_WEIGHTS, GRAPH_SEARCH_HIDDEN_PROPS
+)
+from logic.vector_store import get_store
+from logic.query_cache import cached_query
+
+GRAPH_LOCAL_PATH = os.getenv("GRAPH_LOCAL_PATH", os.path.join("data", "graph.db"))
+
+# Property a node is merged on, per label (default: id)
+NODE_KEYS = {label: "name" for label in ENTITY_LABELS if label != "Event"}
+NODE_KEYS["Day"] = "key"
+
+RECENCY_PROPS = ("date_posted", "date", "start", "start_time", "created_at")
+SQL_VARIABLE_CHUNK = 900  # Stay under SQLite's bound-parameter limit
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS graph_nodes (
+    node_id TEXT PRIMARY KEY,       -- "<label>:<key>"
+    label TEXT NOT NULL,
+    key TEXT NOT NULL,
+    user_id TEXT,
+    props TEXT NOT NULL DEFAULT '{}',
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_graph_nodes_label_key ON graph_nodes(label, key);
+CREATE INDEX IF NOT EXISTS idx_graph_nodes_label_user ON graph_nodes(label, user_id);
+CREATE TABLE IF NOT EXISTS graph_edges (
+    src TEXT NOT NULL,
+    rel TEXT NOT NULL,
+    dst TEXT NOT NULL,
+    PRIMARY KEY (src, rel, dst)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_graph_edges_dst ON graph_edges(dst, rel);
+"""
+
+def _conn():
+    """Per-thread connection to the graph file (schema created on first use)."""
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        directory = os.path.dirname(GRAPH_LOCAL_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(GRAPH_LOCAL_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                conn.executescript(SCHEMA)
+                _schema_ready = True
+    return conn
+
+def local_graph_health():
+    try:
+        _conn().execute("SELECT 1").fetchone()
+        return {"ok": True, "age_seconds": 0.0, "error": None, "backend": "local"}
+    except sqlite3.Error as e:
+        return {"ok": False, "age_seconds": 0.0, "error": str(e), "backend": "local"}
+
+def node_id(label, key):
+    return f"{label}:{key}"
+
+def _now():
+    return datetime.datetime.now().isoformat()
+
+def _chunks(items, size=SQL_VARIABLE_CHUNK):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _empty_summary():
+    return {
+        "rows": 0, "chunks": 0, "failed_chunks": 0, "retries": 0,
+        "nodes_created": 0, "nodes_deleted": 0, "relationships_created": 0,
+        "relationships_deleted": 0, "properties_set": 0, "seconds": 0.0
+    }
+
+def _parse_time(value):
+    """ISO date / datetime string -> naive UTC datetime (None if unparseable)."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+class LocalGraphManager:
+    backend = "local"
+    driver = None  # No Neo4j driver; Neo4j-only helpers (schema constraints) skip this backend
+    available = True  # The SQLite file is always there
+
+    def close(self):
+        pass
+
+    def verify_connection(self):
+        return local_graph_health()["ok"]
+
+    # --- Primitives ---
+
+    def _merge_node(self, conn, label, key, props, summary):
+        """MERGE on (label, key) then SET props (None removes a property, as in Cypher)."""
+        nid = node_id(label, key)
+        props = dict(props)
+        props[NODE_KEYS.get(label, "id")] = key
+        user_id = props.get("user_id")
+        created = conn.execute(
+            "INSERT OR IGNORE INTO graph_nodes (node_id, label, key, user_id, props, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (nid, label, key, user_id, json.dumps({k: v for k, v in props.items() if v is not None}, default=str), _now())
+        ).rowcount
+        if not created:
+            conn.execute(
+                "UPDATE graph_nodes SET props = json_patch(props, ?), user_id = coalesce(?, user_id), updated_at = ? WHERE node_id = ?",
+                (json.dumps(props, default=str), user_id, _now(), nid)
+            )
+        summary["nodes_created"] += created
+        summary["properties_set"] += len(props)
+        return nid
+
+    def _merge_edge(self, conn, src, rel, dst, summary):
+        summary["relationships_created"] += conn.execute(
+            "INSERT OR IGNORE INTO graph_edges (src, rel, dst) VALUES (?, ?, ?)", (src, rel, dst)
+        ).rowcount
+
+    def _link_day(self, conn, nid, user_id, day, summary):
+        """(n)-[:ON]->(:Day {key: "<user_id>:<YYYY-MM-DD>"}); stale ON edges are removed."""
+        if not user_id or not day:
+            return
+        date = str(day)[:10]
+        day_id = node_id("Day", f"{user_id}:{date}")
+        summary["relationships_deleted"] += conn.execute(
+            "DELETE FROM graph_edges WHERE src = ? AND rel = 'ON' AND dst <> ?", (nid, day_id)
+        ).rowcount
+        summary["nodes_created"] += conn.execute(
+            "INSERT OR IGNORE INTO graph_nodes (node_id, label, key, user_id, props, updated_at) VALUES (?, 'Day', ?, ?, ?, ?)",
+            (day_id, f"{user_id}:{date}", user_id,
+             json.dumps({"key": f"{user_id}:{date}", "user_id": user_id, "date": date}), _now())
+        ).rowcount
+        self._merge_edge(conn, nid, "ON", day_id, summary)
+
+    def _write_rows(self, rows, write_row, chunk_size=None):
+        """One transaction per chunk, like GraphManager.write_batches."""
+        chunk_size = chunk_size or GRAPH_SYNC_CHUNK_SIZE
+        summary = _empty_summary()
+        start = time.perf_counter()
+        conn = _conn()
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            try:
+                with conn:
+                    for row in chunk:
+                        write_row(conn, row, summary)
+                summary["rows"] += len(chunk)
+            except sqlite3.Error as e:
+                summary["failed_chunks"] += 1
+                print(f"Graph write chunk {i // chunk_size} failed: {e}")
+            summary["chunks"] += 1
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+        return summary
+
+    def _nodes(self, conn, node_ids):
+        """node_id -> (label, props) for the given ids."""
+        found = {}
+        for chunk in _chunks(node_ids):
+            marks = ",".join("?" * len(chunk))
+            for r in conn.execute(f"SELECT node_id, label, props FROM graph_nodes WHERE node_id IN ({marks})", chunk):
+                found[r["node_id"]] = (r["label"], json.loads(r["props"]))
+        return found
+
+    # --- Sync ---
+
+    def _event_links(self, conn, row, summary):
+        self._link_day(conn, node_id("Event", row["id"]), row.get("user_id"), row.get("start"), summary)
+
+    def _transaction_links(self, conn, row, summary):
+        nid = node_id("Transaction", row["id"])
+        if row.get("merchant") is not None:
+            merchant = self._merge_node(conn, "Merchant", row["merchant"], {}, summary)
+            self._merge_edge(conn, nid, "PAID_TO", merchant, summary)
+        self._link_day(conn, nid, row.get("user_id"), row.get("date"), summary)
+
+    def _existing(self, conn, label, rows):
+        found = self._nodes(conn, [node_id(label, r["id"]) for r in rows])
+        return [r for r in rows if node_id(label, r["id"]) in found]
+
+    def upsert_events(self, rows, link=True):
+        """rows: {id, summary, start, end, recurringEventId, user_id}"""
+        def write(conn, row, summary):
+            self._merge_node(conn, "Event", row["id"], {
+                "summary": row.get("summary"),
+                "start": row.get("start"),
+                "end": row.get("end"),
+                "recurringEventId": row.get("recurringEventId"),
+                "user_id": row.get("user_id")
+            }, summary)
+            if link:
+                self._event_links(conn, row, summary)
+        return self._write_rows(rows, write)
+
+    def upsert_transactions(self, rows, link=True):
+        """rows: {id, amount, date, category, merchant, user_id}"""
+        def write(conn, row, summary):
+            self._merge_node(conn, "Transaction", row["id"], {
+                "amount": row.get("amount"),
+                "date": row.get("date"),
+                "category": row.get("category"),
+                "user_id": row.get("user_id")
+            }, summary)
+            if link:
+                self._transaction_links(conn, row, summary)
+        return self._write_rows(rows, write)
+
+    def link_events(self, rows):
+        return self._write_rows(self._existing(_conn(), "Event", rows), self._event_links)
+
+    def link_transactions(self, rows):
+        return self._write_rows(self._existing(_conn(), "Transaction", rows), self._transaction_links)
+
+    def delete_transactions(self, rows):
+        def write(conn, row, summary):
+            nid = node_id("Transaction", row["id"])
+            summary["relationships_deleted"] += conn.execute(
+                "DELETE FROM graph_edges WHERE src = ? OR dst = ?", (nid, nid)
+            ).rowcount
+            summary["nodes_deleted"] += conn.execute("DELETE FROM graph_nodes WHERE node_id = ?", (nid,)).rowcount
+        return self._write_rows(rows, write)
+
+    def count_nodes(self, label):
+        return _conn().execute("SELECT COUNT(*) FROM graph_nodes WHERE label = ?", (label,)).fetchone()[0]
+
+    def count_relationships(self, rel_type):
+        return _conn().execute("SELECT COUNT(*) FROM graph_edges WHERE rel = ?", (rel_type,)).fetchone()[0]
+
+    def link_unlinked_days(self, user_id=None, batch_size=5000):
+        """Links Transactions / Events that have a user_id and date but no ON edge. Returns the count."""
+        conn = _conn()
+        linked = 0
+        for label, date_prop in (("Transaction", "date"), ("Event", "start")):
+            while True:
+                rows = conn.execute(f"""
+                    SELECT n.node_id, n.user_id, json_extract(n.props, '$.{date_prop}') AS day
+                    FROM graph_nodes n
+                    WHERE n.label = ? AND n.user_id IS NOT NULL
+                      AND (? IS NULL OR n.user_id = ?)
+                      AND json_extract(n.props, '$.{date_prop}') IS NOT NULL
+                      AND NOT EXISTS (SELECT 1 FROM graph_edges e WHERE e.src = n.node_id AND e.rel = 'ON')
+                    LIMIT ?
+                """, (label, user_id, user_id, batch_size)).fetchall()
+                summary = _empty_summary()
+                with conn:
+                    for r in rows:
+                        self._link_day(conn, r["node_id"], r["user_id"], r["day"], summary)
+                linked += len(rows)
+                if len(rows) < batch_size:
+                    break
+        return linked
+
+    def delete_legacy_day_edges(self, batch_size=10000):
+        conn = _conn()
+        with conn:
+            return conn.execute("DELETE FROM graph_edges WHERE rel = 'HAPPENED_ON_DAY'").rowcount
+
+    # --- Reads ---
+
+    @cached_query("spending_by_category")
+    def get_spending_by_category(self, user_id):
+        rows = _conn().execute("""
+            SELECT json_extract(props, '$.category') AS category,
+                   SUM(json_extract(props, '$.amount')) AS total
+            FROM graph_nodes
+            WHERE label = 'Transaction' AND user_id = ? AND json_extract(props, '$.amount') > 0
+            GROUP BY category
+            ORDER BY total DESC
+        """, (user_id,)).fetchall()
+        return [dict(r) for r in rows]
+
+    @cached_query("top_merchants")
+    def get_top_merchants(self, user_id):
+        rows = _conn().execute("""
+            SELECT m.key AS merchant, COUNT(*) AS count, SUM(json_extract(t.props, '$.amount')) AS total
+            FROM graph_nodes t
+            JOIN graph_edges e ON e.src = t.node_id AND e.rel = 'PAID_TO'
+            JOIN graph_nodes m ON m.node_id = e.dst AND m.label = 'Merchant'
+            WHERE t.label = 'Transaction' AND t.user_id = ?
+            GROUP BY m.key
+            ORDER BY total DESC
+            LIMIT 5
+        """, (user_id,)).fetchall()
+        return [dict(r) for r in rows]
+
+    # --- Notes / Chat Threads / Thoughts ---
+
+    def set_node_note(self, label, node_id_, note):
+        conn = _conn()
+        with conn:
+            return conn.execute(
+                "UPDATE graph_nodes SET props = json_set(props, '$.note', ?), updated_at = ? WHERE node_id = ?",
+                (note, _now(), node_id(label, node_id_))
+            ).rowcount > 0
+
+    def get_node_note(self, label, node_id_):
+        row = _conn().execute(
+            "SELECT json_extract(props, '$.note') AS note FROM graph_nodes WHERE node_id = ?",
+            (node_id(label, node_id_),)
+        ).fetchone()
+        return row["note"] if row else None
+
+    def upsert_chat_thread(self, thread_id, summary, topic, embedding, entities):
+        conn = _conn()
+        counters = _empty_summary()
+        with conn:
+            nid = self._merge_node(conn, "ChatThread", thread_id, {
+                "summary": summary,
+                "topic": topic,
+                "created_at": _now()
+            }, counters)
+            for entity in entities:
+                label = entity['type'] if entity.get('type') in ENTITY_LABELS else "Topic"
+                target = self._merge_node(conn, label, entity['name'], {"name": entity['name']}, counters)
+                self._merge_edge(conn, nid, "DISCUSSED", target, counters)
+        if embedding:
+            self._store("ChatThread").upsert(thread_id, embedding)
+
+    def _create_text_node(self, label, content):
+        key = str(uuid.uuid4())
+        conn = _conn()
+        with conn:
+            nid = self._merge_node(conn, label, key, {
+                "content": content,
+                "created_at": _now(),
+                "type": label.lower()
+            }, _empty_summary())
+        return key, nid
+
+    def create_thought(self, content, links=None):
+        from logic.llm_engine import get_embedding
+        summary = self.create_thoughts([{
+            "id": str(uuid.uuid4()),
+            "content": content,
+            "links": links or [],
+            "embedding": get_embedding(content, call_site="thought-embed"),
+            "created_at": _now(),
+            "user_id": None
+        }])
+        return summary["rows"] == 1
+
+    def create_thoughts(self, rows):
+        """rows: {id, content, links, embedding, created_at, user_id}; same contract as GraphManager."""
+
+        def write(conn, row, summary):
+            nid = self._merge_node(conn, "Thought", row["id"], {
+                "content": row["content"],
+                "type": "thought",
+                "user_id": row.get("user_id")
+            }, summary)
+            conn.execute(
+                "UPDATE graph_nodes SET props = json_set(props, '$.created_at', coalesce(json_extract(props, '$.created_at'), ?)) WHERE node_id = ?",
+                (row.get("created_at") or _now(), nid)
+            )
+            for chunk in _chunks(row.get("links") or []):
+                for r in conn.execute(
+                    f"SELECT node_id FROM graph_nodes WHERE key IN ({','.join('?' * len(chunk))}) "
+                    f"AND label IN ({','.join('?' * len(ID_LABELS))})",
+                    list(chunk) + ID_LABELS
+                ).fetchall():
+                    self._merge_edge(conn, nid, "RELATED_TO", r["node_id"], summary)
+
+        summary = self._write_rows(rows, write)
+        self._store("Thought").upsert_many((r["id"], r.get("embedding")) for r in rows)
+        return summary
+
+    def set_node_notes(self, rows):
+        """rows: {label, id, note}. The summary's "matched" lists the (label, id) pairs that exist."""
+        for label in {r["label"] for r in rows} - set(NOTE_LABELS):
+            raise ValueError(f"Notes are not supported on {label} nodes")
+
+        matched = []
+        def write(conn, row, summary):
+            updated = conn.execute(
+                "UPDATE graph_nodes SET props = json_set(props, '$.note', ?), updated_at = ? WHERE node_id = ?",
+                (row["note"], _now(), node_id(row["label"], row["id"]))
+            ).rowcount
+            summary["properties_set"] += updated
+            if updated:
+                matched.append((row["label"], row["id"]))
+        summary = self._write_rows(rows, write)
+        summary["matched"] = matched
+        return summary
+
+    def create_archive(self, content):
+        self._create_text_node("Archive", content)
+        return True
+
+    # --- Embeddings ---
+
+    def _store(self, label):
+        return get_store(f"graph_{label.lower()}")
+
+    def create_vector_index(self):
+        # Per-label VectorStores are created on first write
+        print("Vector indexes created.")
+
+    def update_embeddings(self):
+        from logic.embedding_backfill import run_backfill
+        return run_backfill(self)
+
+    def fetch_missing_embeddings(self, label, after_id, limit):
+        """Keyset page of `label` nodes with no vector in the store: [{id, text}] ordered by id."""
+        props_for_text = EMBEDDING_TARGETS[label]["props"]
+        store = self._store(label)
+        conn = _conn()
+        page, cursor = [], after_id or ""
+        while len(page) < limit:
+            rows = conn.execute(
+                "SELECT key, props FROM graph_nodes WHERE label = ? AND key > ? ORDER BY key LIMIT ?",
+                (label, cursor, limit)
+            ).fetchall()
+            if not rows:
+                break
+            missing = set(store.missing(r["key"] for r in rows))
+            for r in rows:
+                if r["key"] not in missing:
+                    continue
+                props = json.loads(r["props"])
+                text = next((props[p] for p in props_for_text if props.get(p)), None)
+                page.append({"id": r["key"], "text": text})
+                if len(page) >= limit:
+                    break
+            cursor = rows[-1]["key"]
+        return page
+
+    def set_embeddings(self, label, rows):
+        summary = _empty_summary()
+        start = time.perf_counter()
+        summary["rows"] = summary["properties_set"] = self._store(label).upsert_many(
+            (r["id"], r["embedding"]) for r in rows
+        )
+        summary["chunks"] = 1
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+        return summary
+
+    def find_similar_nodes(self, text, limit=5):
+        try:
+            from logic.llm_engine import get_embedding
+            emb = get_embedding(text, call_site="graph-search")
+            if not emb: return []
+
+            hits = []
+            for label, name_prop in (("Thought", "content"), ("Event", "summary")):
+                hits.extend((label, key, score) for key, score in self._store(label).search(emb, limit=limit))
+            hits.sort(key=lambda h: h[2], reverse=True)
+            hits = hits[:limit]
+
+            nodes = self._nodes(_conn(), [node_id(label, key) for label, key, _ in hits])
+            results = []
+            for label, key, score in hits:
+                _, props = nodes.get(node_id(label, key), (label, {}))
+                results.append({
+                    "id": key,
+                    "name": props.get("content") if label == "Thought" else props.get("summary"),
+                    "type": label,
+                    "similarity": score
+                })
+            return results
+        except Exception as e:
+            print(f"Vector search failed: {e}")
+            return []
+
+    # --- Hybrid retrieval ---
+
+    def _neighbors(self, conn, frontier, rel_types):
+        """{node_id: [(rel, neighbor_id), ...]} across both edge directions."""
+        adjacent = {}
+        rel_filter = f" AND rel IN ({','.join('?' * len(rel_types))})" if rel_types else ""
+        for chunk in _chunks(frontier, SQL_VARIABLE_CHUNK // 2):
+            marks = ",".join("?" * len(chunk))
+            args = list(chunk) + list(rel_types or []) + list(chunk) + list(rel_types or [])
+            for r in conn.execute(f"""
+                SELECT src AS node, rel, dst AS other FROM graph_edges WHERE src IN ({marks}){rel_filter}
+                UNION ALL
+                SELECT dst AS node, rel, src AS other FROM graph_edges WHERE dst IN ({marks}){rel_filter}
+            """, args):
+                adjacent.setdefault(r["node"], []).append((r["rel"], r["other"]))
+        return adjacent
+
+    def _degrees(self, conn, node_ids):
+        degrees = {}
+        for chunk in _chunks(node_ids, SQL_VARIABLE_CHUNK // 2):
+            marks = ",".join("?" * len(chunk))
+            for r in conn.execute(f"""
+                SELECT node, COUNT(*) AS degree FROM (
+                    SELECT src AS node FROM graph_edges WHERE src IN ({marks})
+                    UNION ALL
+                    SELECT dst AS node FROM graph_edges WHERE dst IN ({marks})
+                ) GROUP BY node
+            """, list(chunk) * 2):
+                degrees[r["node"]] = r["degree"]
+        return degrees
+
+    @staticmethod
+    def _recency(props, today):
+        for prop in RECENCY_PROPS:
+            if props.get(prop):
+                when = _parse_time(str(props[prop])[:10])
+                if when:
+                    return 1.0 / (1.0 + abs((today - when.date()).days) / GRAPH_SEARCH_RECENCY_DAYS)
+                break
+        return 0.0
+
+    @staticmethod
+    def _visible(props):
+        return {k: v for k, v in props.items() if k not in GRAPH_SEARCH_HIDDEN_PROPS}
+
+    def hybrid_search(self, embedding, seeds=3, depth=1, rel_types=None, per_hop_limit=5,
+                      labels=("Thought", "Event", "ChatThread")):
+        """Same contract and ranking as GraphManager.hybrid_search, evaluated in-process."""
+        depth = max(1, min(int(depth or 1), GRAPH_SEARCH_MAX_DEPTH))
+        hits = []
+        for label in labels:
+            hits.extend((node_id(label, key), score) for key, score in self._store(label).search(embedding, limit=seeds))
+        hits.sort(key=lambda h: h[1], reverse=True)
+        hits = hits[:seeds]
+        if not hits:
+            return []
+
+        conn = _conn()
+        today = datetime.date.today()
+        results = []
+        for seed, score in hits:
+            # Breadth-first, one hop at a time: the first path that reaches a node is a
+            # shortest one, and only the best per_hop_limit new nodes are expanded further
+            paths = {seed: []}
+            recency = {}
+            frontier = [seed]
+            for _ in range(depth):
+                adjacent = self._neighbors(conn, frontier, rel_types)
+                reached = {}
+                for node in frontier:
+                    for rel, other in adjacent.get(node, []):
+                        if other not in paths and other not in reached:
+                            reached[other] = paths[node] + [rel]
+                reached_nodes = self._nodes(conn, list(reached))
+                for nb in reached:
+                    recency[nb] = self._recency(reached_nodes.get(nb, (None, {}))[1], today)
+                frontier = sorted(reached, key=lambda n: recency[n], reverse=True)[:per_hop_limit]
+                for nb in frontier:
+                    paths[nb] = reached[nb]
+                if not frontier:
+                    break
+
+            kept = [n for n in paths if n != seed]
+            nodes = self._nodes(conn, kept + [seed])
+            degrees = self._degrees(conn, kept)
+            by_hop = {}
+            for nb in kept:
+                label, props = nodes.get(nb, (None, {}))
+                hops = len(paths[nb])
+                similarity = score * (GRAPH_SEARCH_HOP_DECAY ** (hops - 1))
+                rank = (GRAPH_SEARCH_WEIGHTS["similarity"] * similarity
+                        + GRAPH_SEARCH_WEIGHTS["recency"] * recency[nb]
+                        + GRAPH_SEARCH_WEIGHTS["degree"] * (1.0 - 1.0 / (1.0 + math.log(1.0 + degrees.get(nb, 0)))))
+                by_hop.setdefault(hops, []).append({
+                    "relation": paths[nb],
+                    "labels": [label] if label else [],
+                    "hops": hops,
+                    "rank": rank,
+                    "props": self._visible(props)
+                })
+
+            related = []
+            for hops in sorted(by_hop):
+                related.extend(sorted(by_hop[hops], key=lambda n: n["rank"], reverse=True))
+
+            seed_label, seed_props = nodes.get(seed, (seed.split(":", 1)[0], {}))
+            results.append({
+                "seed": seed.split(":", 1)[1],
+                "labels": [seed_label],
+                "score": score,
+                "props": self._visible(seed_props),
+                "related": related
+            })
+        return results
@@ -0,0 +1,91 @@
+"""
+Read-through cache for named graph queries (insights, dashboards).
+
+Results are keyed by (query name, backend, user, params) and stamped with the
+user's data generation (sql_engine.get_data_generation). Sync, rule
+application and curator edits bump the generation, so a cached result is
+served until new data arrives for that user and recomputed on the next read.
+GRAPH_QUERY_CACHE_TTL is a safety net for writes that bypass the bump.
+Nothing is cached while the backend is unavailable (no Neo4j driver), and a
+query that raises is not cached either, so an outage doesn't pin empty
+results for the TTL.
+
+Entries live in an in-process LRU; the generation check is a single indexed
+SQLite read, so every worker sees bumps made by the others.
+"""
+import os
+import copy
+import json
+import time
+import sqlite3
+import threading
+import functools
+from collections import OrderedDict
+from logic.sql_engine import get_data_generation
+
+GRAPH_QUERY_CACHE_ENABLED = os.getenv("GRAPH_QUERY_CACHE_ENABLED", "true").lower() == "true"
+GRAPH_QUERY_CACHE_TTL = float(os.getenv("GRAPH_QUERY_CACHE_TTL", str(60 * 60)))
+GRAPH_QUERY_CACHE_MAX_ENTRIES = int(os.getenv("GRAPH_QUERY_CACHE_MAX_ENTRIES", "256"))
+
+QUERY_CACHE_STATS = {}
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+
+def _record(name, status):
+    with _lock:
+        stats = QUERY_CACHE_STATS.setdefault(name, {"hit": 0, "miss": 0, "bypass": 0})
+        stats[status] += 1
+
+
+def cached_query(name):
+    """
+    Decorates a graph manager method `fn(self, user_id, *args, **kwargs)`.
+
+        @cached_query("spending_by_category")
+        def get_spending_by_category(self, user_id): ...
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, user_id, *args, **kwargs):
+            if not GRAPH_QUERY_CACHE_ENABLED or not getattr(self, "available", True):
+                _record(name, "bypass")
+                return fn(self, user_id, *args, **kwargs)
+
+            try:
+                generation = get_data_generation(user_id)
+            except sqlite3.Error:
+                _record(name, "bypass")
+                return fn(self, user_id, *args, **kwargs)
+
+            key = (name, getattr(self, "backend", None), user_id, json.dumps([args, kwargs], sort_keys=True, default=str))
+            now = time.time()
+            with _lock:
+                entry = _entries.get(key)
+                if entry and entry[0] == generation and entry[2] > now:
+                    _entries.move_to_end(key)
+                    result = entry[1]
+                else:
+                    result = None
+
+            if result is not None:
+                _record(name, "hit")
+                return copy.deepcopy(result)
+
+            _record(name, "miss")
+            result = fn(self, user_id, *args, **kwargs)
+            if result is not None:
+                with _lock:
+                    _entries[key] = (generation, copy.deepcopy(result), now + GRAPH_QUERY_CACHE_TTL)
+                    _entries.move_to_end(key)
+                    while len(_entries) > GRAPH_QUERY_CACHE_MAX_ENTRIES:
+                        _entries.popitem(last=False)
+            return result
+        return wrapper
+    return decorator
+
+
+def clear():
+    with _lock:
+        _entries.clear()
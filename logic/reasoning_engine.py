@@ -1,12 +1,20 @@
-import json
 from langgraph.graph import StateGraph, END
-from logic.schemas import ReasoningState, ResponseModel, WidgetModel, WidgetType
-from logic.llm_engine import ask_gemini, ask_gemini_json
+from logic.schemas import ReasoningState, ResponseModel, WidgetModel, WidgetType, IntentPlan
+from logic.llm_engine import ask_gemini, ask_gemini_stream, ask_structured, extract_json, ask_gemini_vision_json
 from logic.tools import query_metrics_sql, explore_context_graph
+from logic.context_budget import fit_context, fit_history
 from logic.sql_engine import log_event
 
+WIDGET_DELIMITER = "<<<WIDGET>>>"
+
 class ReasoningEngine:
     def __init__(self):
+        # Intent -> tool node; shared by the graph and stream_query
+        self.tool_nodes = {
+            "SQL": self._node_tool_sql,
+            "GRAPH": self._node_tool_graph,
+            "VISION": self._node_tool_vision
+        }
         self.workflow = self._build_graph()
         self.app = self.workflow.compile()
 
@@ -15,26 +23,19 @@ class ReasoningEngine:
 
         # Define Nodes
         workflow.add_node("classify", self._node_classify)
-        workflow.add_node("tool_sql", self._node_tool_sql)
-        workflow.add_node("tool_graph", self._node_tool_graph)
+        for intent, node in self.tool_nodes.items():
+            workflow.add_node(f"tool_{intent.lower()}", node)
         workflow.add_node("respond", self._node_respond)
 
         # Define Edges
         workflow.set_entry_point("classify")
         
-        workflow.add_conditional_edges(
-            "classify",
-            self._route_tool,
-            {
-                "SQL": "tool_sql",
-                "GRAPH": "tool_graph",
-                "CHAT": "respond",
-                "VISION": "respond" # In future, can have dedicated vision node
-            }
-        )
+        routes = {intent: f"tool_{intent.lower()}" for intent in self.tool_nodes}
+        routes["CHAT"] = "respond"
+        workflow.add_conditional_edges("classify", self._route_tool, routes)
         
-        workflow.add_edge("tool_sql", "respond")
-        workflow.add_edge("tool_graph", "respond")
+        for intent in self.tool_nodes:
+            workflow.add_edge(f"tool_{intent.lower()}", "respond")
         workflow.add_edge("respond", END)
 
         return workflow
@@ -45,7 +46,8 @@ class ReasoningEngine:
         """
         initial_state = ReasoningState(
             user_query=user_query,
-            messages=history if history else []
+            messages=history if history else [],
+            image=image
         )
         
         # Invoke the graph
@@ -57,12 +59,79 @@ class ReasoningEngine:
         else:
             return {"text": "Error: No response generated.", "widget": {"type": "none"}}
 
+    def stream_query(self, user_query, history=None, image=None):
+        """
+        Streaming entry point. Runs the graph's nodes in order (same classify,
+        tools and respond prompt) but yields (event, data) tuples as it goes:
+            ("status", {"stage": "classified", "intent": ...})
+            ("status", {"stage": "tool_running" | "tool_done", "tool": ...})
+            ("token", {"text": ...})            # answer text as Gemini streams it
+            ("widget", {"type": ..., "data": ...})
+            ("done", {"text": full_answer})
+        """
+        state = ReasoningState(
+            user_query=user_query,
+            messages=history if history else [],
+            image=image
+        )
+
+        state = self._node_classify(state)
+        yield "status", {"stage": "classified", "intent": state.intent}
+
+        tool = self.tool_nodes.get(state.intent)
+        if tool:
+            yield "status", {"stage": "tool_running", "tool": state.intent}
+            state = tool(state)
+            yield "status", {"stage": "tool_done", "tool": state.intent}
+
+        context, prompt = self._respond_prompt(state)
+        raw = []
+        pending = ""
+        in_widget = False
+
+        try:
+            for chunk in ask_gemini_stream(prompt, call_site="respond"):
+                raw.append(chunk)
+                if in_widget:
+                    continue
+
+                pending += chunk
+                if WIDGET_DELIMITER in pending:
+                    pending = pending.split(WIDGET_DELIMITER, 1)[0]
+                    in_widget = True
+                    safe = len(pending)
+                else:
+                    # Hold back a possible partial delimiter at the end of the buffer
+                    safe = len(pending) - (len(WIDGET_DELIMITER) - 1)
+                if safe > 0:
+                    yield "token", {"text": pending[:safe]}
+                    pending = pending[safe:]
+        except Exception as e:
+            log_event("ReasoningEngine", f"Streaming respond failed: {e}", level="ERROR")
+
+        if pending:
+            yield "token", {"text": pending}
+
+        if raw:
+            response = self._parse_response("".join(raw))
+        else:
+            response = self._fallback_response(context)
+            yield "token", {"text": response.text}
+
+        yield "widget", response.widget.dict()
+        yield "done", {"text": response.text}
+
     # --- Nodes ---
 
     def _node_classify(self, state: ReasoningState):
         query = state.user_query
         history = state.messages
         
+        # An attached image always goes through vision; no routing call needed
+        if state.image is not None:
+            state.intent = "VISION"
+            return state
+        
         # Reuse existing logic but return into State
         # (This logic is adapted from original _classify_intent but streamlined)
         
@@ -86,10 +155,11 @@ class ReasoningEngine:
         """
         
         try:
-            plan = json.loads(ask_gemini_json(prompt))
-            state.intent = plan.get("tool", "CHAT")
-            state.tool_args = plan.get("argument")
-        except:
+            plan = ask_structured(prompt, IntentPlan, call_site="classify")
+            state.intent = plan.tool
+            state.tool_args = plan.argument
+        except Exception as e:
+            log_event("ReasoningEngine", f"Classify failed, defaulting to CHAT: {e}", level="WARNING")
             state.intent = "CHAT"
             
         return state
@@ -108,48 +178,69 @@ class ReasoningEngine:
             state.context_data = f"Graph Error: {e}"
         return state
 
+    def _node_tool_vision(self, state: ReasoningState):
+        # Question-independent extraction (cached per image); respond answers the question from it
+        try:
+            state.context_data = ask_gemini_vision_json(state.image)
+        except Exception as e:
+            state.context_data = f"Vision Error: {e}"
+        return state
+
     def _node_respond(self, state: ReasoningState):
-        query = state.user_query
-        context = state.context_data
-        
+        context, prompt = self._respond_prompt(state)
+        try:
+            state.final_response = self._parse_response(ask_gemini(prompt, call_site="respond"))
+        except Exception:
+            state.final_response = self._fallback_response(context)
+        return state
+
+    # --- Respond helpers (shared with stream_query) ---
+
+    def _respond_prompt(self, state: ReasoningState):
+        """Fits the context to the respond budget. Returns (context, prompt)."""
+        context, state.context_report = fit_context(state.context_data, stage="respond")
         prompt = f"""
-        User Query: "{query}"
+        User Query: "{state.user_query}"
         Context: {context}
         
         Task: Answer the user's question using the context AND determine the best UI widget.
         
-        Return JSON validating against this schema:
+        Output format:
+        1. The answer as plain markdown text.
+        2. Then a line containing exactly {WIDGET_DELIMITER}
+        3. Then the widget as JSON (no markdown code blocks):
         {{
-            "text": "The answer...",
-            "widget": {{
-                "type": "bar_chart" | "line_chart" | "pie_chart" | "transaction_list" | "stat_card" | "none",
-                "data": {{ ... }}
-            }}
+            "type": "bar_chart" | "line_chart" | "pie_chart" | "transaction_list" | "stat_card" | "none",
+            "data": {{ ... }}
         }}
         """
-        
-        try:
-            response_json = ask_gemini_json(prompt)
-            # Validate with Pydantic
-            response_data = json.loads(response_json)
-            validated_response = ResponseModel(**response_data)
-            
-            state.final_response = validated_response
-        except Exception as e:
-            # Fallback
-            state.final_response = ResponseModel(
-                text=f"I found the data but couldn't format it perfectly. Context: {str(context)[:100]}...",
-                widget=WidgetModel(type=WidgetType.NONE)
-            )
-            
-        return state
+        return context, prompt
+
+    @staticmethod
+    def _parse_response(raw):
+        """Respond output (text, delimiter, widget JSON) -> ResponseModel; a bad widget becomes "none"."""
+        text, _, widget_json = raw.partition(WIDGET_DELIMITER)
+        widget = WidgetModel(type=WidgetType.NONE)
+        if widget_json.strip():
+            try:
+                widget = WidgetModel(**extract_json(widget_json))
+            except Exception as e:
+                log_event("ReasoningEngine", f"Invalid widget JSON, dropping widget: {e}", level="WARNING")
+        return ResponseModel(text=text.strip(), widget=widget)
+
+    @staticmethod
+    def _fallback_response(context):
+        return ResponseModel(
+            text=f"I found the data but couldn't format it perfectly. Context: {str(context)[:100]}...",
+            widget=WidgetModel(type=WidgetType.NONE)
+        )
 
     def _route_tool(self, state: ReasoningState):
         return state.intent
 
     def _format_history(self, history):
          if not history: return ""
-         relevant = history[-5:]
+         relevant = fit_history(history, max_messages=5)
          formatted = "History:\n"
          for msg in relevant:
              role = "User" if msg['role'] == 'user' else "Assistant"
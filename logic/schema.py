@@ -1,26 +1,139 @@
-from logic.graph_db import GraphManager
+"""
+Declarative Neo4j schema: every label the code MERGEs or looks up on, its key,
+the secondary property indexes and the vector indexes.
 
-def create_constraints(graph_manager):
-    """
-    Sets up uniqueness constraints to prevent duplicate data.
-    """
-    if not graph_manager.driver:
-        return "Graph DB not connected."
+apply_schema() issues idempotent CREATE ... IF NOT EXISTS statements;
+schema_drift() compares the declaration with SHOW CONSTRAINTS / SHOW INDEXES.
+ensure_constraints() does both once per process (backend startup, graph sync,
+rebuild). The local backend keys its own tables, has no raw Cypher and
+needs none of this; every entry point checks `backend` first.
+"""
+from logic.graph_db import EMBEDDING_TARGETS, ENTITY_LABELS, ID_LABELS
+from logic.sql_engine import log_event
 
-    queries = [
-        "CREATE CONSTRAINT event_id_unique IF NOT EXISTS FOR (e:Event) REQUIRE e.id IS UNIQUE",
-        "CREATE CONSTRAINT transaction_id_unique IF NOT EXISTS FOR (t:Transaction) REQUIRE t.id IS UNIQUE",
-        "CREATE CONSTRAINT merchant_name_unique IF NOT EXISTS FOR (m:Merchant) REQUIRE m.name IS UNIQUE",
-        "CREATE INDEX transaction_user_id IF NOT EXISTS FOR (t:Transaction) ON (t.user_id)",
-        "CREATE INDEX event_user_id IF NOT EXISTS FOR (e:Event) ON (e.user_id)"
-    ]
+# Label -> property it is MERGEd / matched on; one uniqueness constraint each
+NODE_KEYS = {label: "id" for label in ID_LABELS}
+NODE_KEYS.update({label: "name" for label in ENTITY_LABELS if label != "Event"})
+NODE_KEYS["Day"] = "key"
+
+# (index name, label, properties) for lookups that are not on the node key
+PROPERTY_INDEXES = [
+    ("transaction_user_id", "Transaction", ["user_id"]),
+    ("event_user_id", "Event", ["user_id"]),
+    ("day_user_date", "Day", ["user_id", "date"]),
+    ("event_name", "Event", ["name"]),  # Chat entities of type Event are MERGEd by name
+]
 
+# (index name, label) on `embedding`
+VECTOR_INDEXES = [(target["index"], label) for label, target in EMBEDDING_TARGETS.items()]
+VECTOR_DIMENSIONS = 768
+
+def constraint_name(label, prop):
+    return f"{label.lower()}_{prop}_unique"
+
+def schema_statements(kinds=None):
+    """[(kind, statement)] for kinds "constraint", "index" and "vector" (default: all)."""
+    kinds = kinds or ("constraint", "index", "vector")
+    statements = []
+    if "constraint" in kinds:
+        for label, prop in NODE_KEYS.items():
+            statements.append(("constraint",
+                f"CREATE CONSTRAINT {constraint_name(label, prop)} IF NOT EXISTS "
+                f"FOR (n:{label}) REQUIRE n.{prop} IS UNIQUE"))
+    if "index" in kinds:
+        for name, label, props in PROPERTY_INDEXES:
+            statements.append(("index",
+                f"CREATE INDEX {name} IF NOT EXISTS "
+                f"FOR (n:{label}) ON ({', '.join('n.' + p for p in props)})"))
+    if "vector" in kinds:
+        for name, label in VECTOR_INDEXES:
+            statements.append(("vector",
+                f"CREATE VECTOR INDEX {name} IF NOT EXISTS FOR (n:{label}) ON (n.embedding) "
+                f"OPTIONS {{indexConfig: {{`vector.dimensions`: {VECTOR_DIMENSIONS}, "
+                f"`vector.similarity_function`: 'cosine'}}}}"))
+    return statements
+
+def apply_schema(graph_manager, kinds=None):
+    """Runs the schema statements; returns ["Executed: ..." | "Failed: ... (error)"]."""
     results = []
-    for q in queries:
+    for _, q in schema_statements(kinds):
         try:
-            graph_manager.query(q)
+            graph_manager.run_cypher(q)
             results.append(f"Executed: {q}")
         except Exception as e:
             results.append(f"Failed: {q} ({e})")
-    
     return results
+
+def create_constraints(graph_manager):
+    """
+    Sets up uniqueness constraints, property indexes and vector indexes.
+    """
+    if graph_manager.backend != "neo4j":
+        return f"No schema to apply on the {graph_manager.backend} backend."
+    if not graph_manager.driver:
+        return "Graph DB not connected."
+    return apply_schema(graph_manager)
+
+def schema_drift(graph_manager):
+    """
+    Compares the declared schema with the database. Matches on (kind, label,
+    properties) rather than name, so an equivalent constraint created under
+    another name is not drift. Returns {ok, missing, unexpected, not_online}.
+    """
+    declared = {("constraint", label, (prop,)): constraint_name(label, prop) for label, prop in NODE_KEYS.items()}
+    declared.update({("index", label, tuple(props)): name for name, label, props in PROPERTY_INDEXES})
+    declared.update({("vector", label, ("embedding",)): name for name, label in VECTOR_INDEXES})
+
+    actual = {}
+    for c in graph_manager.run_cypher(
+        "SHOW CONSTRAINTS YIELD name, type, labelsOrTypes, properties"
+    ):
+        if "UNIQUENESS" in c["type"] and c["labelsOrTypes"]:
+            actual[("constraint", c["labelsOrTypes"][0], tuple(c["properties"]))] = (c["name"], "ONLINE")
+    for i in graph_manager.run_cypher(
+        "SHOW INDEXES YIELD name, type, labelsOrTypes, properties, state, owningConstraint"
+    ):
+        if i["type"] == "LOOKUP" or i["owningConstraint"] or not i["labelsOrTypes"]:
+            continue
+        kind = "vector" if i["type"] == "VECTOR" else "index" if i["type"] == "RANGE" else i["type"].lower()
+        actual[(kind, i["labelsOrTypes"][0], tuple(i["properties"]))] = (i["name"], i["state"])
+
+    def describe(sig, name):
+        return {"kind": sig[0], "label": sig[1], "properties": list(sig[2]), "name": name}
+
+    missing = [describe(sig, name) for sig, name in declared.items() if sig not in actual]
+    unexpected = [describe(sig, name) for sig, (name, _) in actual.items() if sig not in declared]
+    not_online = [
+        dict(describe(sig, name), state=state)
+        for sig, (name, state) in actual.items() if sig in declared and state != "ONLINE"
+    ]
+    return {"ok": not missing and not not_online, "missing": missing, "unexpected": unexpected, "not_online": not_online}
+
+_constraints_applied = False
+
+def ensure_constraints(graph_manager):
+    """
+    apply_schema() until it succeeds once in this process, then logs any drift.
+    Returns the drift report (or None).
+    """
+    global _constraints_applied
+    if _constraints_applied or graph_manager.backend != "neo4j" or not graph_manager.driver:
+        return None
+    failed = [r for r in apply_schema(graph_manager) if r.startswith("Failed")]
+    # A dropped connection or duplicate data blocking a constraint: retry on the next sync / rebuild
+    _constraints_applied = not failed
+
+    try:
+        drift = schema_drift(graph_manager)
+    except Exception as e:
+        print(f"Graph schema drift check failed: {e}")
+        return None
+    if failed or not drift["ok"] or drift["unexpected"]:
+        log_event(
+            "GraphSchema",
+            f"Schema drift: {len(drift['missing'])} missing, {len(drift['not_online'])} not online, "
+            f"{len(drift['unexpected'])} undeclared, {len(failed)} statements failed",
+            level="WARNING",
+            metadata=dict(drift, failed=failed)
+        )
+    return drift
@@ -24,6 +24,10 @@ class ResponseModel(BaseModel):
     text: str
     widget: WidgetModel
 
+class IntentPlan(BaseModel):
+    tool: Literal["SQL", "GRAPH", "CHAT"] = "CHAT"
+    argument: Optional[Any] = None
+
 # --- Reasoning Engine State ---
 
 class ReasoningState(BaseModel):
@@ -32,6 +36,8 @@ class ReasoningState(BaseModel):
     intent: Optional[Literal["SQL", "GRAPH", "CHAT", "VISION"]] = None
     tool_args: Optional[Any] = None
     context_data: Optional[Any] = None
+    image: Optional[Any] = None # PreparedImage (logic/image_pipeline.py) when the user attached one
+    context_report: Optional[Dict[str, Any]] = None # What the context budget dropped (logic/context_budget.py)
     final_response: Optional[ResponseModel] = None
 
 # --- Enrichment Agent State ---
@@ -43,14 +49,28 @@ class EnrichmentStatus(str, Enum):
 
 class TransactionModel(BaseModel):
     txn_id: str
+    user_id: Optional[str] = None
     merchant_name: str
     amount: float
     date: str
     current_category: Optional[str] = None
     
+class CategorizationResult(BaseModel):
+    txn_id: Optional[str] = None
+    category: Optional[str] = None
+    confidence: float = 0.0
+    is_ambiguous: bool = False
+    clarification_question: Optional[str] = None
+    suggested_options: List[str] = Field(default_factory=list)
+
+class CategorizationBatch(BaseModel):
+    items: List[CategorizationResult] = Field(default_factory=list)
+
 class EnrichmentState(BaseModel):
     transaction: TransactionModel
     similar_transactions: List[Dict] = Field(default_factory=list)
+    similar_merchants: List[Dict] = Field(default_factory=list)
+    context_ready: bool = False
     rules_context: str = ""
     suggested_category: Optional[str] = None
     confidence: float = 0.0
@@ -58,6 +78,17 @@ class EnrichmentState(BaseModel):
     clarification_question: Optional[str] = None
     suggested_options: List[str] = Field(default_factory=list)
 
+# --- Chat Thread Analysis ---
+
+class ThreadEntity(BaseModel):
+    name: str
+    type: str = "Topic"
+
+class ThreadAnalysis(BaseModel):
+    summary: str = ""
+    topic: str = "General Chat"
+    entities: List[ThreadEntity] = Field(default_factory=list)
+
 # --- Onboarding Agent State ---
 
 class SpendingRule(BaseModel):
@@ -3,7 +3,7 @@ import json
 import os
 from datetime import datetime
 
-DB_NAME = "context_os.db"
+DB_NAME = os.getenv("DB_NAME", "context_os.db")
 
 def get_connection():
     return sqlite3.connect(DB_NAME)
@@ -153,6 +153,202 @@ def init_db():
     except sqlite3.OperationalError:
         pass
 
+    # Merchant Profiles (one centroid + category votes per user/merchant)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS merchant_profiles (
+            user_id TEXT,
+            merchant_key TEXT,          -- Canonical merchant ("uber trip 123" -> "uber trip")
+            display_name TEXT,
+            centroid BLOB,              -- float32 mean embedding
+            embedding_count INTEGER DEFAULT 0,
+            category_votes JSON,        -- {"Transport": 12, "Food": 1}
+            updated_at TEXT,
+            PRIMARY KEY (user_id, merchant_key)
+        )
+    ''')
+    # Each transaction's contribution to a profile, so it can be moved or taken back.
+    # Profiles built before votes were tracked are dropped and rebuilt on next load.
+    votes_tracked = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'merchant_profile_votes'"
+    ).fetchone()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS merchant_profile_votes (
+            txn_id TEXT PRIMARY KEY,
+            user_id TEXT,
+            merchant_key TEXT,
+            category TEXT,
+            embedding BLOB              -- Vector folded into the centroid (NULL if none)
+        )
+    ''')
+    if not votes_tracked:
+        cursor.execute("DELETE FROM merchant_profiles")
+
+    # LLM Response Cache (see logic/llm_cache.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key TEXT PRIMARY KEY,   -- sha256(model + prompt)
+            model TEXT,
+            call_site TEXT,
+            response TEXT,
+            created_at TEXT,
+            expires_at REAL              -- Unix timestamp
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_expiry ON llm_cache(expires_at);")
+
+    # LLM Call Telemetry (see logic/telemetry.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL,            -- Unix timestamp
+            call_site TEXT,             -- "classify", "respond", "categorize", ...
+            model TEXT,
+            prompt_tokens INTEGER,
+            response_tokens INTEGER,
+            latency_ms REAL,
+            cache_status TEXT,          -- "hit" | "miss" | "bypass"
+            error_class TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_metrics_time ON llm_metrics(created_at);")
+
+    try:
+        cursor.execute("ALTER TABLE llm_metrics ADD COLUMN parse_status TEXT")
+    except sqlite3.OperationalError:
+        pass
+
+    # Plaid /transactions/sync cursors, one per Item (see logic/ingestion.sync_plaid_transactions)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS plaid_sync_cursors (
+            item_key TEXT PRIMARY KEY,  -- Hash of the Item's access token
+            user_id TEXT,
+            cursor TEXT,                -- next_cursor of the last fully applied sync
+            last_added INTEGER,         -- Delta sizes of that sync
+            last_modified INTEGER,
+            last_removed INTEGER,
+            updated_at TEXT
+        )
+    ''')
+
+    # Cypher queries over GRAPH_SLOW_QUERY_MS (see logic/graph_telemetry.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS graph_slow_queries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL,            -- Unix timestamp
+            call_site TEXT,             -- GraphManager method that issued the query
+            query TEXT,
+            params JSON,                -- Parameter shapes only (values redacted)
+            latency_ms REAL,
+            rows INTEGER,
+            db_hits INTEGER,            -- Only when the call was PROFILE-sampled
+            counters JSON,
+            error_class TEXT
+        )
+    ''')
+
+    # Every Cypher query, for aggregates across workers and restarts (see logic/graph_telemetry.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS graph_query_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL,            -- Unix timestamp
+            call_site TEXT,
+            pid INTEGER,                -- Worker process that ran the query
+            latency_ms REAL,
+            rows INTEGER,
+            db_hits INTEGER,            -- Only when the call was PROFILE-sampled
+            nodes_created INTEGER,
+            nodes_deleted INTEGER,
+            relationships_created INTEGER,
+            relationships_deleted INTEGER,
+            properties_set INTEGER,
+            error_class TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_graph_query_metrics_time ON graph_query_metrics(created_at);")
+
+    # Per-user data generation (bumped on sync / rules / curator edits; see logic/query_cache.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_generations (
+            user_id TEXT PRIMARY KEY,   -- '*' = changes not tied to one user
+            generation INTEGER DEFAULT 0,
+            updated_at TEXT
+        )
+    ''')
+
+    # Write-behind queue for graph writes (see logic/graph_queue.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS graph_write_queue (
+            id TEXT PRIMARY KEY,        -- Returned to the client; Thought node id for "thought"
+            op TEXT NOT NULL,           -- "thought" | "note" | "delete_transactions"
+            payload TEXT NOT NULL,      -- JSON
+            user_id TEXT,
+            status TEXT DEFAULT 'PENDING',  -- PENDING | RUNNING | DONE | FAILED
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            created_at REAL,            -- Unix timestamps
+            updated_at REAL,
+            next_attempt_at REAL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_graph_queue_due ON graph_write_queue(status, next_attempt_at);")
+
+    # Full graph rebuild checkpoints (one row per phase while a rebuild is in progress)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS graph_rebuild_state (
+            phase TEXT PRIMARY KEY,     -- "nodes:events", "links:transactions", ...
+            last_key TEXT,              -- Keyset cursor: every row up to here is written
+            rows INTEGER DEFAULT 0,
+            status TEXT,                -- RUNNING | DONE | FAILED
+            started_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+
+    # Causal stress-spending analysis (see logic/causal_engine.py); user_id '' = rows without a user
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS causal_state (
+            user_id TEXT PRIMARY KEY,
+            config TEXT,                -- Keywords + lag windows the matches were computed with
+            event_seq INTEGER DEFAULT 0,    -- Watermarks: master_events / master_transactions change_seq analyzed
+            txn_seq INTEGER DEFAULT 0,
+            updated_at TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS causal_matches (
+            user_id TEXT,
+            lag_hours REAL,
+            event_id TEXT,
+            txn_id TEXT,
+            PRIMARY KEY (user_id, lag_hours, event_id, txn_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS causal_results (
+            user_id TEXT,
+            lag_hours REAL,
+            events INTEGER,             -- Stress events followed by spending
+            transactions INTEGER,       -- Distinct transactions inside a window
+            total_spent REAL,
+            top_category TEXT,
+            categories JSON,            -- {category: amount}
+            updated_at TEXT,
+            PRIMARY KEY (user_id, lag_hours)
+        )
+    ''')
+
+    # Graph embedding backfill checkpoints (one row per label while a pass is in progress)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS embedding_backfill_state (
+            label TEXT PRIMARY KEY,
+            last_id TEXT,               -- Keyset cursor: last node id fully processed
+            processed INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            started_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+
     # Chat Threads Tables
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS chat_threads (
@@ -199,6 +395,53 @@ def init_db():
         except sqlite3.OperationalError:
             pass # Column likely exists
 
+    # --- MIGRATION: Change sequence for incremental readers (causal engine) ---
+    # rowids are reused once the newest row is deleted and don't move on ON CONFLICT
+    # updates. change_seq comes from a counter that only grows: set on insert, bumped
+    # when a column the causal join reads changes (which also drops the row's stale
+    # causal_matches). Existing rows start at their rowid.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_sequence (
+            table_name TEXT PRIMARY KEY,
+            seq INTEGER
+        )
+    ''')
+
+    change_tracked = {
+        # table: (id column, columns the causal join reads)
+        'master_transactions': ('txn_id', ['user_id', 'date_posted']),
+        'master_events': ('event_id', ['user_id', 'summary', 'end_iso']),
+    }
+    for table, (id_col, watched) in change_tracked.items():
+        try:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN change_seq INTEGER")
+            cursor.execute(f"UPDATE {table} SET change_seq = rowid")
+        except sqlite3.OperationalError:
+            pass # Column likely exists
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_change_seq ON {table}(change_seq);")
+        cursor.execute(
+            f"INSERT OR IGNORE INTO change_sequence (table_name, seq) SELECT ?, coalesce(max(change_seq), 0) FROM {table}",
+            (table,)
+        )
+
+        bump = f"""
+                UPDATE change_sequence SET seq = seq + 1 WHERE table_name = '{table}';
+                UPDATE {table} SET change_seq = (SELECT seq FROM change_sequence WHERE table_name = '{table}')
+                WHERE rowid = NEW.rowid;"""
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_seq_insert AFTER INSERT ON {table}
+            BEGIN{bump}
+            END
+        """)
+        changed = " OR ".join(f"NEW.{c} IS NOT OLD.{c}" for c in watched)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_seq_update AFTER UPDATE OF {', '.join(watched)} ON {table}
+            WHEN {changed}
+            BEGIN{bump}
+                DELETE FROM causal_matches WHERE {id_col} = NEW.{id_col};
+            END
+        """)
+
     # --- MIGRATION: Add user_tokens table (if not exists) ---
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS user_tokens (
@@ -217,56 +460,139 @@ def init_db():
     conn.commit()
     conn.close()
 
-def upsert_transaction(user_id, txn):
+def _transaction_row(user_id, txn, rules):
+    txn_id = txn.get('id') or txn.get('transaction_id')
+    merchant = txn.get('merchant') or txn.get('merchant_name') or txn.get('name')
+    amount = txn.get('amount')
+    category = txn.get('category', ['Uncategorized'])
+    date = txn.get('date') or txn.get('date_posted')
+
+    final_category = category
+    if isinstance(final_category, list):
+        final_category = final_category[0]
+
+    for pattern, rule_category in rules:
+        if pattern.lower() in (merchant or "").lower():
+            final_category = rule_category
+            break
+
+    return (txn_id, user_id, merchant, amount, final_category, date, json.dumps(txn))
+
+def upsert_transactions(user_id, txns):
     """
-    Idempotent insert for Plaid transactions.
+    Idempotent bulk insert for Plaid transactions (one statement, one commit).
+    Modified transactions (e.g. pending -> posted) also update date and merchant.
+    Rows whose date or merchant changed lose what was derived from the old
+    values: their stored embedding, vector-store entry and merchant-profile
+    vote are dropped and they go back to PENDING for the curator. A date change also drops their causal
+    matches (change_seq trigger, see init_db) so the next causal run rejoins them.
+    Returns the number of rows written.
     """
+    if not txns:
+        return 0
     conn = get_connection()
-    cursor = conn.cursor()
-    
     try:
-        # Extract fields safely
-        txn_id = txn.get('id') or txn.get('transaction_id')
-        merchant = txn.get('merchant') or txn.get('merchant_name') or txn.get('name')
-        amount = txn.get('amount')
-        category = txn.get('category', ['Uncategorized'])
-        date = txn.get('date') or txn.get('date_posted')
-        
-        # Check for User Rules
-        rules = cursor.execute("SELECT pattern, category FROM user_rules WHERE user_id = ?", (user_id,)).fetchall()
-        
-        final_category = category
-        if isinstance(final_category, list):
-            final_category = final_category[0]
-            
-        for pattern, rule_category in rules:
-            if pattern.lower() in merchant.lower():
-                final_category = rule_category
-                break
-        
-        cursor.execute("""
-            INSERT INTO master_transactions 
+        rules = conn.execute("SELECT pattern, category FROM user_rules WHERE user_id = ?", (user_id,)).fetchall()
+        rows = [_transaction_row(user_id, t, rules) for t in txns]
+
+        incoming = {r[0]: (r[2], r[5]) for r in rows}
+        ids = list(incoming)
+        changed = []
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ','.join(['?'] * len(chunk))
+            changed.extend(
+                txn_id for txn_id, merchant, date in conn.execute(
+                    f"SELECT txn_id, merchant_name, date_posted FROM master_transactions WHERE txn_id IN ({placeholders})", chunk
+                ) if (merchant, date) != incoming[txn_id]
+            )
+
+        conn.executemany("""
+            INSERT INTO master_transactions
             (txn_id, user_id, merchant_name, amount, category, date_posted, raw_payload, enrichment_status)
             VALUES (?, ?, ?, ?, ?, ?, ?, 'PENDING')
             ON CONFLICT(txn_id) DO UPDATE SET
+                merchant_name=excluded.merchant_name,
                 amount=excluded.amount,
                 category=excluded.category,
-                raw_payload=excluded.raw_payload;
-        """, (
-            txn_id, 
-            user_id,
-            merchant, 
-            amount, 
-            final_category, 
-            date, 
-            json.dumps(txn)
-        ))
+                date_posted=excluded.date_posted,
+                raw_payload=excluded.raw_payload,
+                is_synced_to_graph=0;
+        """, rows)
+        if changed:
+            from logic.embedding_engine import drop_merchant_votes
+            conn.executemany("""
+                UPDATE master_transactions
+                SET enrichment_status = 'PENDING', clarification_question = NULL, embedding = NULL
+                WHERE txn_id = ?
+            """, [(txn_id,) for txn_id in changed])
+            drop_merchant_votes(changed, conn=conn)
         conn.commit()
+    finally:
+        conn.close()
+
+    if changed:
+        from logic.vector_store import get_store
+        get_store("transactions").delete(changed)
+    return len(rows)
+
+def upsert_transaction(user_id, txn):
+    """
+    Idempotent insert for Plaid transactions.
+    """
+    try:
+        upsert_transactions(user_id, [txn])
     except Exception as e:
         print(f"Error upserting transaction {txn.get('id')}: {e}")
+
+def delete_transactions(txn_ids):
+    """
+    Bulk delete (Plaid removed transactions), including their causal matches and
+    merchant-profile votes. Returns the user_ids that owned them.
+    """
+    if not txn_ids:
+        return []
+    from logic.embedding_engine import drop_merchant_votes
+    conn = get_connection()
+    try:
+        user_ids = set()
+        for i in range(0, len(txn_ids), 500):
+            chunk = list(txn_ids[i:i + 500])
+            placeholders = ','.join(['?'] * len(chunk))
+            user_ids.update(r[0] for r in conn.execute(
+                f"SELECT DISTINCT user_id FROM master_transactions WHERE txn_id IN ({placeholders})", chunk
+            ))
+            conn.execute(f"DELETE FROM master_transactions WHERE txn_id IN ({placeholders})", chunk)
+            conn.execute(f"DELETE FROM causal_matches WHERE txn_id IN ({placeholders})", chunk)
+        drop_merchant_votes(txn_ids, conn=conn)
+        conn.commit()
+        return list(user_ids)
     finally:
         conn.close()
 
+def get_plaid_cursor(item_key):
+    """Saved /transactions/sync cursor for an Item (None = never synced)."""
+    conn = get_connection()
+    row = conn.execute("SELECT cursor FROM plaid_sync_cursors WHERE item_key = ?", (item_key,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def save_plaid_cursor(item_key, user_id, cursor, added=0, modified=0, removed=0):
+    conn = get_connection()
+    conn.execute("""
+        INSERT INTO plaid_sync_cursors (item_key, user_id, cursor, last_added, last_modified, last_removed, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(item_key) DO UPDATE SET
+            user_id = excluded.user_id,
+            cursor = excluded.cursor,
+            last_added = excluded.last_added,
+            last_modified = excluded.last_modified,
+            last_removed = excluded.last_removed,
+            updated_at = excluded.updated_at
+    """, (item_key, user_id, cursor, added, modified, removed, datetime.now().isoformat()))
+    conn.commit()
+    conn.close()
+
 def upsert_event(user_id, event):
     """
     Idempotent insert for Google Calendar events.
@@ -283,7 +609,8 @@ def upsert_event(user_id, event):
                 summary=excluded.summary,
                 start_iso=excluded.start_iso,
                 end_iso=excluded.end_iso,
-                description=excluded.description;
+                description=excluded.description,
+                is_synced_to_graph=0;
         """, (
             event.get('id'),
             user_id,
@@ -350,7 +677,7 @@ def get_pending_enrichment():
     conn.row_factory = sqlite3.Row
     
     txns = conn.execute("""
-        SELECT txn_id, merchant_name, amount, category, date_posted,
+        SELECT txn_id, user_id, merchant_name, amount, category, date_posted,
                enrichment_status, clarification_question, suggested_tags,
                is_synced_to_graph, raw_payload
         FROM master_transactions 
@@ -382,9 +709,53 @@ def get_needs_user_review(user_id):
     conn.close()
     return [dict(t) for t in txns]
 
+# --- Data Generations ---
+
+ALL_USERS = "*"
+
+def bump_data_generation(user_ids=None, conn=None):
+    """
+    Marks a user's data as changed so cached graph query results are recomputed.
+    `user_ids`: one id, a list, or None for a change that may touch every user.
+    Pass `conn` to bump inside the caller's transaction (the caller commits).
+    """
+    if user_ids is None or isinstance(user_ids, str):
+        user_ids = [user_ids]
+    user_ids = {u if u else ALL_USERS for u in user_ids}
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        conn.executemany("""
+            INSERT INTO data_generations (user_id, generation, updated_at)
+            VALUES (?, 1, datetime('now'))
+            ON CONFLICT(user_id) DO UPDATE SET
+                generation = generation + 1,
+                updated_at = excluded.updated_at
+        """, [(u,) for u in user_ids])
+        if own_conn:
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"Data generation bump failed: {e}")
+    finally:
+        if own_conn:
+            conn.close()
+
+def get_data_generation(user_id):
+    """(user generation, all-users generation); part of every cached graph query key."""
+    conn = get_connection()
+    rows = dict(conn.execute(
+        "SELECT user_id, generation FROM data_generations WHERE user_id IN (?, ?)",
+        (user_id or ALL_USERS, ALL_USERS)
+    ).fetchall())
+    conn.close()
+    return rows.get(user_id or ALL_USERS, 0), rows.get(ALL_USERS, 0)
+
 def update_enrichment_status(table, id_col, item_id, status, updates=None):
     """
     Updates the enrichment status and other fields (e.g. category, question).
+    A category change bumps the owner's data generation.
     """
     conn = get_connection()
     cursor = conn.cursor()
@@ -399,6 +770,10 @@ def update_enrichment_status(table, id_col, item_id, status, updates=None):
     if updates:
         for col, val in updates.items():
             cursor.execute(f"UPDATE {table} SET {col} = ? WHERE {id_col} = ?", (val, item_id))
+
+        if "category" in updates and table == "master_transactions":
+            row = cursor.execute(f"SELECT user_id FROM {table} WHERE {id_col} = ?", (item_id,)).fetchone()
+            bump_data_generation(row[0] if row else None, conn=conn)
             
     conn.commit()
     conn.close()
@@ -417,6 +792,8 @@ def reset_enrichment_status():
     
     # Reset Events
     cursor.execute("UPDATE master_events SET enrichment_status = 'PENDING', is_synced_to_graph = 0")
+
+    bump_data_generation(None, conn=conn)
     
     conn.commit()
     conn.close()
@@ -491,6 +868,8 @@ def add_rule(user_id, pattern, category, threshold=None):
             SET category = ?, enrichment_status = 'COMPLETE'
             WHERE user_id = ? AND lower(merchant_name) LIKE ? AND category != ?
         ''', (category, user_id, f"%{pattern.lower()}%", category))
+        if cursor.rowcount:
+            bump_data_generation(user_id, conn=conn)
         
         conn.commit()
         return True
@@ -556,6 +935,14 @@ def get_transactions(user_id, limit=100):
     conn.close()
     return [dict(row) for row in rows]
 
+def get_transaction(txn_id):
+    """Fetches a single transaction by id."""
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM master_transactions WHERE txn_id = ?", (txn_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
 def get_events(user_id, limit=100, start_date=None, end_date=None):
     """Fetches recent events, optionally filtering by date range."""
     conn = get_connection()
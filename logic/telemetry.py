@@ -0,0 +1,295 @@
+"""
+LLM call telemetry.
+
+Every Gemini / embedding call is recorded in `llm_metrics` with its call site,
+model, token counts, latency, cache status and error class. Records are
+buffered in memory and written in batches by a background thread (every
+LLM_METRICS_FLUSH_SECONDS, or sooner once LLM_METRICS_BATCH_SIZE are waiting),
+so the request path never touches SQLite. Rows older than
+LLM_METRICS_RETENTION_DAYS are pruned on flush. The admin panel reads rolling
+aggregates through get_llm_metrics_summary().
+"""
+import os
+import time
+import atexit
+import sqlite3
+import threading
+from contextlib import contextmanager
+from logic.sql_engine import get_connection
+
+LLM_METRICS_FLUSH_SECONDS = float(os.getenv("LLM_METRICS_FLUSH_SECONDS", "2"))
+LLM_METRICS_BATCH_SIZE = int(os.getenv("LLM_METRICS_BATCH_SIZE", "200"))
+LLM_METRICS_RETENTION_DAYS = float(os.getenv("LLM_METRICS_RETENTION_DAYS", "30"))
+
+# Estimated USD per 1M tokens (input, output). Used for relative spend only.
+MODEL_PRICES = {
+    "gemini-flash-latest": (0.30, 2.50),
+    "gemini-flash-lite-latest": (0.10, 0.40),
+    "gemini-pro-latest": (1.25, 10.00),
+    "models/text-embedding-004": (0.00, 0.00),
+}
+
+
+class CallRecord:
+    def __init__(self, call_site, model):
+        self.call_site = call_site
+        self.model = model
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.cache_status = "bypass"
+        self.error_class = None
+        self.parse_status = None    # Structured output: "ok" | "repaired" | "failed"
+
+    def set_usage(self, response):
+        """Copies token counts from a Gemini response's usage_metadata, if present."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            self.prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+            self.response_tokens = getattr(usage, "candidates_token_count", 0) or 0
+
+
+@contextmanager
+def track(call_site, model):
+    """
+    Times the enclosed LLM call and records it on exit.
+
+        with track("classify", MODEL_NAME) as rec:
+            rec.cache_status = "miss"
+            response = client.generate(prompt)
+            rec.set_usage(response)
+    """
+    rec = CallRecord(call_site, model)
+    start = time.perf_counter()
+    try:
+        yield rec
+    except BaseException as e:
+        rec.error_class = type(e).__name__
+        raise
+    finally:
+        # GeneratorExit = streaming consumer stopped early, not a provider error
+        if rec.error_class == "GeneratorExit":
+            rec.error_class = None
+        record_llm_call(rec, (time.perf_counter() - start) * 1000)
+
+
+class BatchWriter:
+    """
+    Buffers rows for one INSERT statement and writes them in batches from a
+    daemon thread (every `flush_seconds`, or sooner once `batch_size` rows are
+    waiting), then runs `prune_sql`: with `prune_params` if given, else with
+    the cutoff timestamp for `retention_seconds` (one `?`). Also flushed at exit.
+    """
+    def __init__(self, name, insert_sql, prune_sql=None, retention_seconds=None, prune_params=None,
+                 flush_seconds=2.0, batch_size=200):
+        self.name = name
+        self.insert_sql = insert_sql
+        self.prune_sql = prune_sql
+        self.retention_seconds = retention_seconds
+        self.prune_params = prune_params
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._rows = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, row):
+        with self._lock:
+            self._rows.append(row)
+            pending = len(self._rows)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-flush", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Writes buffered rows in one transaction and prunes expired ones. Returns rows written."""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        try:
+            conn = get_connection()
+            conn.executemany(self.insert_sql, rows)
+            if self.prune_sql and self.prune_params is not None:
+                conn.execute(self.prune_sql, self.prune_params)
+            elif self.prune_sql and self.retention_seconds:
+                conn.execute(self.prune_sql, (time.time() - self.retention_seconds,))
+            conn.commit()
+            conn.close()
+            return len(rows)
+        except sqlite3.Error as e:
+            print(f"{self.name} write error ({len(rows)} rows dropped): {e}")
+            return 0
+
+
+_writer = BatchWriter(
+    "llm-metrics",
+    """
+    INSERT INTO llm_metrics
+    (created_at, call_site, model, prompt_tokens, response_tokens, latency_ms, cache_status, error_class, parse_status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    prune_sql="DELETE FROM llm_metrics WHERE created_at < ?",
+    retention_seconds=LLM_METRICS_RETENTION_DAYS * 86400,
+    flush_seconds=LLM_METRICS_FLUSH_SECONDS,
+    batch_size=LLM_METRICS_BATCH_SIZE
+)
+
+
+def record_llm_call(rec, latency_ms):
+    """Queues one llm_metrics row; the writer thread stores it."""
+    _writer.add((
+        time.time(),
+        rec.call_site,
+        rec.model,
+        rec.prompt_tokens,
+        rec.response_tokens,
+        latency_ms,
+        rec.cache_status,
+        rec.error_class,
+        rec.parse_status
+    ))
+
+
+def flush():
+    """Writes this process's buffered llm_metrics rows now."""
+    return _writer.flush()
+
+
+def estimate_cost(model, prompt_tokens, response_tokens):
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + response_tokens * price_out) / 1_000_000
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return round(values[idx], 1)
+
+
+# Follow-up calls made on behalf of a stage (logic/llm_engine.py ask_structured)
+STAGE_SUFFIXES = ("-repair", "-escalate")
+
+
+def stage_of(call_site):
+    for suffix in STAGE_SUFFIXES:
+        if call_site and call_site.endswith(suffix):
+            return call_site[:-len(suffix)]
+    return call_site
+
+
+def _stage_rollup(rows):
+    """Per-stage totals: a stage's own calls plus its repair / escalation calls, across models."""
+    stages = {}
+    for r in rows:
+        s = stages.setdefault(stage_of(r['call_site']), {
+            "stage": stage_of(r['call_site']),
+            "calls": 0,
+            "repairs": 0,
+            "escalations": 0,
+            "latencies": [],
+            "est_cost_usd": 0.0,
+            "models": set()
+        })
+        s["calls"] += 1
+        if r['call_site'].endswith("-repair"):
+            s["repairs"] += 1
+        elif r['call_site'].endswith("-escalate"):
+            s["escalations"] += 1
+        s["models"].add(r['model'])
+        s["est_cost_usd"] += estimate_cost(r['model'], r['prompt_tokens'] or 0, r['response_tokens'] or 0)
+        if r['cache_status'] != "hit" and r['latency_ms'] is not None:
+            s["latencies"].append(r['latency_ms'])
+
+    rollup = []
+    for s in stages.values():
+        latencies = s.pop("latencies")
+        s["models"] = sorted(s["models"])
+        s["p50_ms"] = percentile(latencies, 50)
+        s["p95_ms"] = percentile(latencies, 95)
+        s["total_ms"] = round(sum(latencies), 1)
+        s["est_cost_usd"] = round(s["est_cost_usd"], 4)
+        rollup.append(s)
+    rollup.sort(key=lambda x: x["total_ms"], reverse=True)
+    return rollup
+
+
+def get_llm_metrics_summary(hours=24):
+    """
+    Rolling aggregates per (call_site, model) over the last `hours`,
+    plus a per-stage rollup (by_stage) that folds in repair / escalation calls.
+    """
+    flush()  # Include this process's buffered calls
+    since = time.time() - hours * 3600
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("""
+        SELECT call_site, model, prompt_tokens, response_tokens, latency_ms, cache_status, error_class, parse_status
+        FROM llm_metrics
+        WHERE created_at >= ?
+    """, (since,)).fetchall()
+    conn.close()
+
+    groups = {}
+    for r in rows:
+        g = groups.setdefault((r['call_site'], r['model']), {
+            "call_site": r['call_site'],
+            "model": r['model'],
+            "calls": 0,
+            "cache_hits": 0,
+            "errors": 0,
+            "structured_calls": 0,
+            "parse_repaired": 0,
+            "parse_failures": 0,
+            "prompt_tokens": 0,
+            "response_tokens": 0,
+            "latencies": [],
+            "error_classes": {}
+        })
+        g["calls"] += 1
+        g["prompt_tokens"] += r['prompt_tokens'] or 0
+        g["response_tokens"] += r['response_tokens'] or 0
+        if r['cache_status'] == "hit":
+            g["cache_hits"] += 1
+        elif r['latency_ms'] is not None:
+            # Only provider round trips count toward latency percentiles
+            g["latencies"].append(r['latency_ms'])
+        if r['parse_status']:
+            g["structured_calls"] += 1
+            if r['parse_status'] == "repaired":
+                g["parse_repaired"] += 1
+            elif r['parse_status'] == "failed":
+                g["parse_failures"] += 1
+        if r['error_class']:
+            g["errors"] += 1
+            g["error_classes"][r['error_class']] = g["error_classes"].get(r['error_class'], 0) + 1
+
+    summary = []
+    for g in groups.values():
+        latencies = g.pop("latencies")
+        g["parse_failure_rate"] = round(g["parse_failures"] / g["structured_calls"], 3) if g["structured_calls"] else None
+        g["p50_ms"] = percentile(latencies, 50)
+        g["p95_ms"] = percentile(latencies, 95)
+        g["total_ms"] = round(sum(latencies), 1)
+        g["est_cost_usd"] = round(estimate_cost(g["model"], g["prompt_tokens"], g["response_tokens"]), 4)
+        summary.append(g)
+
+    summary.sort(key=lambda x: x["total_ms"], reverse=True)
+    return {
+        "window_hours": hours,
+        "calls": sum(g["calls"] for g in summary),
+        "est_cost_usd": round(sum(g["est_cost_usd"] for g in summary), 4),
+        "by_call_site": summary,
+        "by_stage": _stage_rollup(rows)
+    }
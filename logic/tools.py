@@ -1,7 +1,7 @@
 import sqlite3
 import json
 from logic.sql_engine import get_connection
-from logic.graph_db import GraphManager
+from logic.graph_db import get_graph_manager
 from logic.llm_engine import get_embedding
 
 def query_metrics_sql(query):
@@ -25,84 +25,54 @@ def query_metrics_sql(query):
     finally:
         conn.close()
 
-def explore_context_graph(entity_query, depth=1):
+def explore_context_graph(entity_query, depth=1, rel_types=None, per_hop_limit=5, seeds=3):
     """
-    Performs a Hybrid Search (Vector + Traversal) in Neo4j.
-    1. Finds the closest node to 'entity_query' via Vector Search.
-    2. Traverses 'depth' hops to find related context.
+    Performs a Hybrid Search (Vector + Traversal) in the graph, in a single query.
+    1. Finds the closest Thought / Event / ChatThread nodes to 'entity_query' via Vector Search.
+    2. Traverses up to 'depth' hops (optionally only through 'rel_types') and keeps the
+       best 'per_hop_limit' neighbors per hop, ranked by score, recency and degree.
     """
-    gm = GraphManager()
-    if not gm.driver:
+    gm = get_graph_manager()
+    if not gm.verify_connection():
         return "Error: Graph DB not connected."
         
     # 1. Vector Search
-    embedding = get_embedding(entity_query)
+    embedding = get_embedding(entity_query, call_site="graph-search")
     if not embedding:
         return "Error: Could not generate embedding."
         
-    # Find closest Event, Thought, or ChatThread
-    vector_query = """
-    CALL db.index.vector.queryNodes('thought_embeddings', 1, $emb)
-    YIELD node AS n, score
-    RETURN n, score, labels(n) as labels
-    UNION
-    CALL db.index.vector.queryNodes('event_embeddings', 1, $emb)
-    YIELD node AS n, score
-    RETURN n, score, labels(n) as labels
-    UNION
-    CALL db.index.vector.queryNodes('chat_embeddings', 1, $emb)
-    YIELD node AS n, score
-    RETURN n, score, labels(n) as labels
-    ORDER BY score DESC
-    LIMIT 3
-    """
-    
-    # Note: We need to ensure chat_embeddings index exists. 
-    # If not, this query might fail or return partial results.
-    # For robustness, we'll wrap in try/except or assume index creation.
-    
+    # 2. Seeds + traversal in one round trip
     try:
-        start_nodes = gm.run_cypher(vector_query, {"emb": embedding})
+        hits = gm.hybrid_search(
+            embedding,
+            seeds=seeds,
+            depth=depth,
+            rel_types=rel_types,
+            per_hop_limit=per_hop_limit
+        )
     except Exception as e:
         return f"Graph Search Error: {e}"
     
-    if not start_nodes:
+    if not hits:
         return "No relevant context found in Graph."
         
-    context_results = []
-    
-    for item in start_nodes:
-        start_node = item['n']
-        start_id = start_node.get('id')
-        start_label = item['labels'][0]
-        score = item['score']
-        
-        # 2. Traversal (Get neighbors)
-        traversal_query = f"""
-        MATCH (start:{start_label} {{id: $id}})-[r]-(neighbor)
-        RETURN type(r) as relation, labels(neighbor) as target_type, neighbor
-        LIMIT 5
-        """
-        
-        neighbors = gm.run_cypher(traversal_query, {"id": start_id})
-        
-        node_data = dict(start_node)
-        # Remove embedding from output to save tokens
-        if 'embedding' in node_data:
-            del node_data['embedding']
-            
-        context_results.append({
-            "Type": start_label,
-            "Score": score,
-            "Content": node_data,
+    context_results = [
+        {
+            "Type": hit['labels'][0],
+            "Score": hit['score'],
+            "Content": hit['props'],
             "Related": [
                 {
-                    "Relation": n['relation'],
-                    "Type": n['target_type'][0],
-                    "Properties": {k:v for k,v in dict(n['neighbor']).items() if k != 'embedding'}
+                    "Relation": " > ".join(n['relation']),
+                    "Type": n['labels'][0] if n['labels'] else None,
+                    "Hops": n['hops'],
+                    "Rank": round(n['rank'], 4),
+                    "Properties": n['props']
                 }
-                for n in neighbors
+                for n in hit['related']
             ]
-        })
+        }
+        for hit in hits
+    ]
     
     return json.dumps(context_results, default=str)
@@ -0,0 +1,325 @@
+"""
+Append-only, memory-mapped vector store shared between worker processes.
+
+Layout (per store name, under VECTOR_STORE_DIR):
+    <name>.<generation>.f32    Raw float32 rows (unit-normalized), append-only.
+    <name>.<generation>.ids    Row -> id, fixed-width utf-8 (VECTOR_STORE_ID_BYTES), append-only.
+    <name>.<generation>.live   Row -> 1 (live) / 0 (superseded or deleted), one byte per row.
+    <name>.manifest.json       {dim, generation, count}
+    <name>.lock                flock() target serializing writers.
+
+Readers load the manifest and mmap only the first `count` rows of each file,
+so rows appended after the manifest was read are invisible until the next
+manifest swap. The manifest is replaced atomically (write temp + os.replace),
+which gives every reader a consistent snapshot while a writer appends. Writes
+cost O(rows written): nothing is rewritten but the small manifest.
+
+Updates append a new row, swap the manifest, then clear the live byte of the
+id's previous row (a reader can briefly see both). Deletes clear live bytes in
+place, which mapped readers see immediately. Once dead rows pass
+VECTOR_STORE_MAX_DEAD_RATIO of the segment, the write that crossed it runs
+`compact()`, which rewrites live rows into a new generation. The previous
+generation's files are kept until the next compaction, so a reader that read
+the old manifest can still map them.
+"""
+import os
+import json
+import glob
+import fcntl
+import threading
+import numpy as np
+
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", os.path.join("data", "vectors"))
+VECTOR_STORE_MAX_DEAD_RATIO = float(os.getenv("VECTOR_STORE_MAX_DEAD_RATIO", "0.3"))
+VECTOR_STORE_ID_BYTES = 128
+
+_SUFFIXES = ("f32", "ids", "live")
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class VectorStore:
+    def __init__(self, name, dim=768, base_dir=None):
+        self.name = name
+        self.dim = dim
+        self.base_dir = base_dir or VECTOR_STORE_DIR
+        self.id_dtype = np.dtype(f"S{VECTOR_STORE_ID_BYTES}")
+        os.makedirs(self.base_dir, exist_ok=True)
+
+        self.manifest_path = os.path.join(self.base_dir, f"{name}.manifest.json")
+        self.lock_path = os.path.join(self.base_dir, f"{name}.lock")
+
+        # Cached snapshot (manifest + mmaps), refreshed when the manifest changes
+        self._snapshot = None
+        self._snapshot_key = None
+        self._local_lock = threading.Lock()
+
+    # --- Paths / Manifest ---
+
+    def _path(self, generation, suffix):
+        return os.path.join(self.base_dir, f"{self.name}.{generation}.{suffix}")
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"dim": self.dim, "generation": 0, "count": 0}
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    def _writer_lock(self):
+        return _FileLock(self.lock_path)
+
+    def _encode_ids(self, ids):
+        encoded = [str(i).encode("utf-8") for i in ids]
+        if any(len(e) > VECTOR_STORE_ID_BYTES for e in encoded):
+            raise ValueError(f"Vector store ids are limited to {VECTOR_STORE_ID_BYTES} bytes")
+        return np.array(encoded, dtype=self.id_dtype)
+
+    # --- Read Path ---
+
+    def snapshot(self):
+        """
+        Returns (matrix, ids, live) for the current manifest: read-only memmaps of
+        shape (count, dim), (count,) fixed-width ids and (count,) live flags.
+        All None if empty.
+        """
+        try:
+            st = os.stat(self.manifest_path)
+            key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None, None, None
+
+        with self._local_lock:
+            if self._snapshot is not None and self._snapshot_key == key:
+                return self._snapshot
+
+            self._snapshot = self._map(self._read_manifest())
+            self._snapshot_key = key
+            return self._snapshot
+
+    def _map(self, manifest, mode="r"):
+        count, generation = manifest["count"], manifest["generation"]
+        if count <= 0:
+            return None, None, None
+        return (
+            np.memmap(self._path(generation, "f32"), dtype=np.float32, mode="r", shape=(count, manifest["dim"])),
+            np.memmap(self._path(generation, "ids"), dtype=self.id_dtype, mode="r", shape=(count,)),
+            np.memmap(self._path(generation, "live"), dtype=np.uint8, mode=mode, shape=(count,))
+        )
+
+    def _rows(self, ids, live, item_ids):
+        """Live rows holding any of `item_ids`."""
+        return np.flatnonzero(np.isin(ids, self._encode_ids(item_ids)) & (live != 0))
+
+    def __len__(self):
+        _, _, live = self.snapshot()
+        return 0 if live is None else int(np.count_nonzero(live))
+
+    def get(self, item_id):
+        matrix, ids, live = self.snapshot()
+        if matrix is None:
+            return None
+        rows = self._rows(ids, live, [item_id])
+        if not len(rows):
+            return None
+        return np.array(matrix[rows[-1]])
+
+    def missing(self, item_ids):
+        """The ids from `item_ids` that have no live vector."""
+        item_ids = [str(i) for i in item_ids]
+        _, ids, live = self.snapshot()
+        if ids is None or not item_ids:
+            return item_ids
+        present = np.isin(self._encode_ids(item_ids), ids[live != 0])
+        return [i for i, p in zip(item_ids, present) if not p]
+
+    def search(self, query, limit=5, ids=None):
+        """
+        Cosine top-k over live rows. Optionally restricted to a set of ids.
+        Returns a list of (id, score) sorted by score descending.
+        """
+        matrix, row_ids, live = self.snapshot()
+        if matrix is None:
+            return []
+
+        q = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm == 0:
+            return []
+        q = q / norm
+
+        mask = live != 0
+        if ids is not None:
+            mask &= np.isin(row_ids, self._encode_ids(ids))
+        candidates = int(np.count_nonzero(mask))
+        if not candidates:
+            return []
+
+        # Score straight off the mmap; dead rows are pushed below every live one
+        scores = matrix @ q
+        scores[~mask] = -np.inf
+
+        k = min(limit, candidates)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(row_ids[i].decode("utf-8"), float(scores[i])) for i in top]
+
+    # --- Write Path ---
+
+    def upsert(self, item_id, vector):
+        return self.upsert_many([(item_id, vector)])
+
+    def upsert_many(self, items):
+        """
+        Appends vectors to the segment and retires the ids' previous rows.
+        `items` is an iterable of (id, vector).
+        """
+        items = list(dict((str(i), v) for i, v in items if v is not None).items())
+        if not items:
+            return 0
+
+        block = np.asarray([v for _, v in items], dtype=np.float32).reshape(len(items), -1)
+        if block.shape[1] != self.dim:
+            raise ValueError(f"Expected dim {self.dim}, got {block.shape[1]}")
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        block = block / norms
+        new_ids = self._encode_ids(i for i, _ in items)
+
+        with self._writer_lock():
+            manifest = self._read_manifest()
+            start, generation = manifest["count"], manifest["generation"]
+
+            # A crashed writer may have left rows past `count`; overwrite them
+            for suffix, data in (("f32", block), ("ids", new_ids), ("live", np.ones(len(items), dtype=np.uint8))):
+                with open(self._path(generation, suffix), "ab") as f:
+                    f.truncate(start * data.itemsize * (self.dim if suffix == "f32" else 1))
+                    f.write(data.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            old = self._map(manifest, mode="r+") if start else None
+            manifest["count"] = start + len(items)
+            manifest["dim"] = self.dim
+            self._write_manifest(manifest)
+
+            if old is not None:
+                _, ids, live = old
+                live[self._rows(ids, live, [i for i, _ in items])] = 0
+                live.flush()
+                del old
+
+        self.compact_if_needed()
+        return len(items)
+
+    def delete(self, ids):
+        """Marks the ids' rows dead. Space is reclaimed by compact()."""
+        ids = list(ids)
+        with self._writer_lock():
+            manifest = self._read_manifest()
+            if not manifest["count"] or not ids:
+                return 0
+            _, row_ids, live = self._map(manifest, mode="r+")
+            rows = self._rows(row_ids, live, ids)
+            if len(rows):
+                live[rows] = 0
+                live.flush()
+            del row_ids, live
+        if len(rows):
+            self.compact_if_needed()
+        return len(rows)
+
+    def dead_ratio(self):
+        _, _, live = self.snapshot()
+        if live is None:
+            return 0.0
+        return 1.0 - np.count_nonzero(live) / len(live)
+
+    def compact_if_needed(self, max_dead_ratio=None):
+        """Compacts when superseded/deleted rows exceed `max_dead_ratio` (default VECTOR_STORE_MAX_DEAD_RATIO)."""
+        ratio = VECTOR_STORE_MAX_DEAD_RATIO if max_dead_ratio is None else max_dead_ratio
+        if self.dead_ratio() <= ratio:
+            return 0
+        return self.compact(max_dead_ratio=ratio)
+
+    def compact(self, max_dead_ratio=None):
+        """
+        Rewrites live rows into a new generation and swaps the manifest.
+        Readers holding the old mmaps keep a valid view until they refresh. The
+        previous generation's files stay until the next compaction, for readers
+        that read the old manifest but have not mapped them yet.
+        `max_dead_ratio` re-checks the threshold under the lock (another
+        process may have compacted first).
+        """
+        with self._writer_lock():
+            manifest = self._read_manifest()
+            old_generation = manifest["generation"]
+            new_generation = old_generation + 1
+            matrix, ids, live = self._map(manifest)
+
+            keep = np.flatnonzero(live) if live is not None else np.empty(0, dtype=np.int64)
+            if max_dead_ratio is not None and manifest["count"] and 1.0 - len(keep) / manifest["count"] <= max_dead_ratio:
+                return 0
+
+            with open(self._path(new_generation, "f32"), "wb") as f:
+                for i in range(0, len(keep), 4096):
+                    f.write(np.ascontiguousarray(matrix[keep[i:i + 4096]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            for suffix, data in (("ids", ids[keep] if ids is not None else np.empty(0, dtype=self.id_dtype)),
+                                 ("live", np.ones(len(keep), dtype=np.uint8))):
+                with open(self._path(new_generation, suffix), "wb") as f:
+                    f.write(data.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            del matrix, ids, live
+
+            self._write_manifest({"dim": manifest["dim"], "generation": new_generation, "count": len(keep)})
+            self._remove_generations_before(old_generation)
+
+        return manifest["count"] - len(keep)
+
+    def _remove_generations_before(self, generation):
+        prefix = os.path.join(self.base_dir, f"{self.name}.")
+        for suffix in _SUFFIXES:
+            for path in glob.glob(f"{glob.escape(prefix)}*.{suffix}"):
+                stem = path[len(prefix):-len(suffix) - 1]
+                if stem.isdigit() and int(stem) < generation:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+
+class _FileLock:
+    """Exclusive cross-process lock on a file (POSIX flock)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+def get_store(name, dim=768):
+    """Returns the process-wide VectorStore instance for `name`."""
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = VectorStore(name, dim=dim)
+        return _stores[name]
@@ -0,0 +1,36 @@
+import sys
+import os
+import argparse
+
+# Add parent directory to path so we can import logic
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic.graph_db import get_graph_manager, EMBEDDING_TARGETS
+from logic.embedding_backfill import run_backfill, EMBED_BACKFILL_BATCH_SIZE, EMBED_BACKFILL_CONCURRENCY
+from logic.sql_engine import init_db
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed graph nodes that are missing an embedding (resumable)")
+    parser.add_argument("--labels", nargs="+", choices=list(EMBEDDING_TARGETS), help="labels to backfill (default: all)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BACKFILL_BATCH_SIZE, help="texts per embedding request")
+    parser.add_argument("--concurrency", type=int, default=EMBED_BACKFILL_CONCURRENCY, help="embedding requests in flight")
+    parser.add_argument("--restart", action="store_true", help="ignore saved checkpoints and start from the first id")
+    args = parser.parse_args()
+
+    init_db()
+    gm = get_graph_manager()
+    if not gm.verify_connection():
+        print("❌ Error: Could not connect to Neo4j. Check .env")
+        return
+
+    print("🚀 Starting embedding backfill...")
+    results = run_backfill(gm, args.labels, args.batch_size, args.concurrency, restart=args.restart)
+
+    print("\n📊 Summary")
+    for r in results:
+        print(f"   {r['label']:<11} embedded={r['processed']:<6} failed={r['failed']:<4} "
+              f"no_text={r['skipped_no_text']:<4} {r['seconds']}s")
+    print("\n✅ Backfill complete. Re-run to retry failed nodes.")
+
+if __name__ == "__main__":
+    main()
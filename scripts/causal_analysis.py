@@ -1,66 +1,43 @@
-from logic.graph_db import GraphManager
-from logic.sql_engine import log_event
-import datetime
+import sys
+import os
+import argparse
 
-def analyze_stress_spending():
+# Add parent directory to path so we can import logic
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic.causal_engine import run_causal_analysis, get_causal_results, describe_results
+
+def analyze_stress_spending(user_id=None, restart=False):
     """
-    Analyzes the Knowledge Graph to find correlations between 'High Stress' events
-    and subsequent spending.
-    
+    Runs the incremental stress -> spending job (logic/causal_engine.py) and
+    returns a summary of the stored results for `user_id`.
+
     Definition of High Stress (MVP):
-    - Events containing: "Deadline", "Meeting", "Pitch", "Review", "Urgent"
-    
-    Definition of Correlation:
-    - Transaction occurs within 4 hours AFTER the event end time.
-    """
-    gm = GraphManager()
-    if not gm.verify_connection():
-        log_event("Causal Engine", "Skipping analysis: Neo4j not connected", "WARNING")
-        return "Neo4j Disconnected"
+    - Events containing CAUSAL_STRESS_KEYWORDS ("deadline", "meeting", "pitch", "urgent")
 
-    # Cypher Query: Find Stress Events and subsequent Transactions
-    query = """
-    MATCH (e:Event)
-    WHERE toLower(e.summary) CONTAINS 'deadline' 
-       OR toLower(e.summary) CONTAINS 'meeting' 
-       OR toLower(e.summary) CONTAINS 'pitch'
-       OR toLower(e.summary) CONTAINS 'urgent'
-    
-    // Find transactions within 4 hours (14400 seconds) after event
-    MATCH (t:Transaction)
-    WHERE datetime(t.date) >= datetime(e.end) 
-      AND datetime(t.date) <= datetime(e.end) + duration('PT4H')
-      
-    RETURN e.summary as Event, t.merchant as Merchant, t.amount as Amount, t.category as Category
+    Definition of Correlation:
+    - Transaction occurs within a lag window (CAUSAL_LAG_HOURS) AFTER the event end time.
     """
-    
     try:
-        results = gm.query(query)
-        
-        if not results:
-            log_event("Causal Engine", "Analysis complete. No correlations found.", "INFO")
-            return "No correlations found."
-            
-        # Aggregate findings
-        total_spent = 0
-        categories = {}
-        
-        for r in results:
-            amount = float(r['Amount'])
-            total_spent += amount
-            cat = r['Category']
-            categories[cat] = categories.get(cat, 0) + amount
-            
-        # Log Summary
-        top_cat = max(categories, key=categories.get) if categories else "None"
-        msg = f"Found correlation! Spent ${total_spent:.2f} after {len(results)} stressful events. Top Category: {top_cat}"
-        
-        log_event("Causal Engine", msg, "INFO", metadata={"details": results})
-        return msg
-        
+        run_causal_analysis(None if user_id is None else [user_id], restart=restart)
     except Exception as e:
-        log_event("Causal Engine", f"Analysis failed: {e}", "ERROR")
         return f"Error: {e}"
+    return describe_results(get_causal_results(user_id))
+
+def main():
+    from logic.sql_engine import init_db
+
+    parser = argparse.ArgumentParser(description="Incremental stress -> spending analysis")
+    parser.add_argument("--user", help="only this user (default: every user)")
+    parser.add_argument("--restart", action="store_true", help="drop stored matches and recompute from scratch")
+    args = parser.parse_args()
+
+    init_db()
+    stats = run_causal_analysis(None if args.user is None else [args.user], restart=args.restart)
+    for user, s in stats.items():
+        print(f"👤 {user or '(no user)'}: {s['new_matches']} new matches "
+              f"({s['events']} new stress events, {s['transactions']} new transactions)")
+        print(f"   {describe_results(get_causal_results(user))}")
 
 if __name__ == "__main__":
-    analyze_stress_spending()
+    main()
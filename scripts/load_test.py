@@ -0,0 +1,196 @@
+"""
+Load test for the chat pipeline and the curator.
+
+Run against the fake provider to measure our own overhead separately from the model:
+
+    LLM_PROVIDER=fake FAKE_LLM_LATENCY_MS=300 python scripts/load_test.py chat --scratch-db --requests 200 --concurrency 16
+    LLM_PROVIDER=fake python scripts/load_test.py curator --scratch-db --rounds 3
+
+Both targets write: the curator resets and re-categorizes every transaction and
+records merchant votes and vectors, chat writes telemetry. --scratch-db is
+therefore required. In-process runs work on a throwaway copy of the database,
+vector store and local graph in a temp directory, deleted afterwards.
+
+`chat` and `curator` run in-process (no auth needed). Add --url (and --token for
+/api/chat) to drive a running backend over HTTP instead; the backend must then
+be started with LLM_PROVIDER=fake and DB_NAME pointing at a scratch copy itself.
+
+The report splits wall time into LLM time (from llm_metrics, recorded by this
+process only in in-process mode) and everything else.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUERIES = [
+    "How much did I spend on dining last month?",
+    "Who was at the project review meeting?",
+    "Hello!",
+    "What is my total spending this week?",
+    "What happened with the Toronto trip?",
+    "Thanks, that helps.",
+]
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))], 1)
+
+def _post(url, body, token=None):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    req = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"), headers=headers, method="POST")
+    with urllib.request.urlopen(req, timeout=120) as res:
+        return json.loads(res.read() or b"{}")
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    try:
+        fn(*args)
+        return (time.perf_counter() - start) * 1000, None
+    except Exception as e:
+        return (time.perf_counter() - start) * 1000, type(e).__name__
+
+def make_scratch_copy():
+    """
+    Copies the database (and the vector store / local graph, when present) into a
+    temp directory and points DB_NAME, VECTOR_STORE_DIR and GRAPH_LOCAL_PATH at it.
+    Must run before any logic module is imported. Returns the directory.
+    """
+    scratch = tempfile.mkdtemp(prefix="contextos-loadtest-")
+    source_db = os.getenv("DB_NAME", "context_os.db")
+    scratch_db = os.path.join(scratch, "context_os.db")
+    if os.path.exists(source_db):
+        src, dst = sqlite3.connect(source_db), sqlite3.connect(scratch_db)
+        src.backup(dst)  # Consistent copy even while the backend is writing
+        src.close()
+        dst.close()
+    os.environ["DB_NAME"] = scratch_db
+
+    vectors = os.getenv("VECTOR_STORE_DIR", os.path.join("data", "vectors"))
+    if os.path.isdir(vectors):
+        shutil.copytree(vectors, os.path.join(scratch, "vectors"))
+    os.environ["VECTOR_STORE_DIR"] = os.path.join(scratch, "vectors")
+
+    graph = os.getenv("GRAPH_LOCAL_PATH", os.path.join("data", "graph.db"))
+    if os.path.exists(graph):
+        src, dst = sqlite3.connect(graph), sqlite3.connect(os.path.join(scratch, "graph.db"))
+        src.backup(dst)
+        src.close()
+        dst.close()
+    os.environ["GRAPH_LOCAL_PATH"] = os.path.join(scratch, "graph.db")
+
+    from logic.sql_engine import init_db
+    init_db()
+    return scratch
+
+def run_chat(args):
+    if args.url:
+        def one(i):
+            _post(f"{args.url}/api/chat", {"message": QUERIES[i % len(QUERIES)]}, args.token)
+    else:
+        from agent import Agent
+        agent = Agent()
+
+        def one(i):
+            payload = agent.process_input(QUERIES[i % len(QUERIES)], user_id=args.user_id, history=[])
+            if "Gemini Unavailable" in str(payload.get("content", "")):
+                raise RuntimeError(payload["content"])
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        return list(pool.map(lambda i: _timed(one, i), range(args.requests)))
+
+def run_curator(args):
+    if args.url:
+        def one(_):
+            _post(f"{args.url}/api/curator/reset", {})
+            _post(f"{args.url}/api/curator/auto", {})
+    else:
+        from logic.enrichment_agent import EnrichmentAgent
+        from logic.sql_engine import reset_enrichment_status
+        agent = EnrichmentAgent()
+
+        def one(_):
+            reset_enrichment_status()
+            agent.process_pending_items()
+
+    # Rounds are sequential: each one resets and re-curates the whole queue
+    return [_timed(one, i) for i in range(args.rounds)]
+
+def report(name, results, wall_s, since, in_process):
+    latencies = [ms for ms, err in results]
+    errors = {}
+    for _, err in results:
+        if err:
+            errors[err] = errors.get(err, 0) + 1
+
+    print(f"\n=== {name}: {len(results)} runs in {wall_s:.1f}s ({len(results) / wall_s:.1f}/s) ===")
+    print(f"latency ms  p50={_percentile(latencies, 50)}  p95={_percentile(latencies, 95)}  p99={_percentile(latencies, 99)}  max={round(max(latencies), 1) if latencies else None}")
+    print(f"errors      {errors or 'none'}")
+
+    if not in_process:
+        print("LLM breakdown: see GET /api/admin/llm-metrics on the backend")
+        return
+
+    from logic.telemetry import get_llm_metrics_summary
+    summary = get_llm_metrics_summary(hours=(time.time() - since) / 3600)
+    llm_ms = sum(g["total_ms"] for g in summary["by_call_site"])
+    total_ms = sum(latencies)
+    print(f"LLM calls   {summary['calls']}  ({llm_ms:.0f} ms of {total_ms:.0f} ms request time)")
+    if total_ms:
+        print(f"own overhead {total_ms - llm_ms:.0f} ms ({100 * (total_ms - llm_ms) / total_ms:.0f}%) "
+              "(LLM time is summed per call, so concurrent calls inside one request can push this below zero)")
+    for g in summary["by_call_site"]:
+        print(f"  {g['call_site']:<22} calls={g['calls']:<5} cache_hits={g['cache_hits']:<5} errors={g['errors']:<4} p50={g['p50_ms']} p95={g['p95_ms']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test chat / curator (use LLM_PROVIDER=fake for offline runs)")
+    parser.add_argument("target", choices=["chat", "curator"])
+    parser.add_argument("--requests", type=int, default=100, help="chat requests to send")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel chat requests")
+    parser.add_argument("--rounds", type=int, default=3, help="curator reset + auto rounds")
+    parser.add_argument("--user-id", default="loadtest@example.com")
+    parser.add_argument("--url", help="backend base URL, e.g. http://localhost:8000 (default: in-process)")
+    parser.add_argument("--token", help="Bearer token for /api/chat in HTTP mode")
+    parser.add_argument("--no-cache", action="store_true", help="disable the LLM response cache (in-process only)")
+    parser.add_argument("--scratch-db", action="store_true",
+                        help="required: run against a throwaway copy of the database (in-process), "
+                             "or confirm the backend at --url runs on one")
+    args = parser.parse_args()
+
+    if not args.scratch_db:
+        parser.error("--scratch-db is required: the load test overwrites transaction categories, "
+                     "merchant profiles and vectors")
+
+    if args.no_cache:
+        # Must be set before logic.llm_cache is imported
+        os.environ["LLM_CACHE_ENABLED"] = "false"
+
+    if not args.url and os.getenv("LLM_PROVIDER", "gemini").lower() != "fake":
+        print("Warning: LLM_PROVIDER is not 'fake'; this run will call (and bill) the real Gemini API.")
+
+    scratch = None if args.url else make_scratch_copy()
+    if scratch:
+        print(f"Using scratch copy in {scratch}")
+    try:
+        since = time.time()
+        start = time.perf_counter()
+        results = run_chat(args) if args.target == "chat" else run_curator(args)
+        report(args.target, results, time.perf_counter() - start, since, in_process=not args.url)
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import sys
+import os
+
+# Add parent directory to path so we can import logic
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic.graph_db import get_graph_manager, close_driver
+from logic.schema import create_constraints
+
+def main():
+    """
+    One-off migration from HAPPENED_ON_DAY edges (Transaction x Event per day)
+    to per-user Day buckets: (:Transaction)-[:ON]->(:Day)<-[:ON]-(:Event).
+    Safe to re-run.
+    """
+    print("🚀 Migrating temporal links to Day nodes...")
+
+    gm = get_graph_manager()
+    if not gm.verify_connection():
+        print("❌ Error: Could not connect to Neo4j. Check .env")
+        return
+
+    print("\n1️⃣  Ensuring Day constraints / indexes...")
+    create_constraints(gm)
+
+    print("\n2️⃣  Linking Transactions and Events to Day nodes...")
+    linked = gm.link_unlinked_days()
+    print(f"   Linked {linked} nodes.")
+
+    print("\n3️⃣  Deleting HAPPENED_ON_DAY edges in batches...")
+    deleted = gm.delete_legacy_day_edges()
+    print(f"   Deleted {deleted} edges.")
+
+    print("\n✅ Migration complete.")
+    close_driver()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import sys
+import os
+import argparse
+
+# Add parent directory to path so we can import logic
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic.graph_db import get_graph_manager
+from logic.graph_rebuild import run_rebuild, rebuild_status, RebuildError, GRAPH_REBUILD_CHUNK_SIZE, GRAPH_REBUILD_CONCURRENCY
+from logic.sql_engine import init_db
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the graph from SQLite (resumes an interrupted rebuild)")
+    parser.add_argument("--chunk-size", type=int, default=GRAPH_REBUILD_CHUNK_SIZE, help="rows per UNWIND write")
+    parser.add_argument("--concurrency", type=int, default=GRAPH_REBUILD_CONCURRENCY, help="parallel node writers")
+    parser.add_argument("--restart", action="store_true", help="ignore checkpoints and start from the first row")
+    parser.add_argument("--status", action="store_true", help="show checkpoints of an interrupted rebuild and exit")
+    args = parser.parse_args()
+
+    init_db()
+    if args.status:
+        for row in rebuild_status() or [{"phase": "(no rebuild in progress)"}]:
+            print(row)
+        return
+
+    gm = get_graph_manager()
+    print("🚀 Rebuilding graph from SQLite...")
+    try:
+        result = run_rebuild(gm, restart=args.restart, chunk_size=args.chunk_size, concurrency=args.concurrency)
+    except RebuildError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print("\n📊 Validation (SQLite vs graph)")
+    for v in result["validation"]:
+        print(f"   {'✅' if v['ok'] else '❌'} {v['check']:<18} sqlite={v['sqlite']:<8} graph={v['graph']}")
+    print("\n✅ Rebuild complete." if result["ok"] else "\n⚠️  Rebuild finished with missing rows; see above.")
+    print("   Embeddings: run scripts/backfill_embeddings.py")
+
+if __name__ == "__main__":
+    main()
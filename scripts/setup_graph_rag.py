@@ -4,12 +4,12 @@ import os
 # Add parent directory to path so we can import logic
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from logic.graph_db import GraphManager
+from logic.graph_db import get_graph_manager
 
 def main():
     print("🚀 Initializing Graph-RAG Setup...")
     
-    gm = GraphManager()
+    gm = get_graph_manager()
     if not gm.verify_connection():
         print("❌ Error: Could not connect to Neo4j. Check .env")
         return
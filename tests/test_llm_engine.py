@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("dotenv")
+
+from logic.llm_engine import extract_json
+
+
+def test_complete_object_after_prose():
+    assert extract_json('Sure! ```json\n{"a": [1, 2]}\n``` done') == {"a": [1, 2]}
+
+
+def test_truncated_inside_string_value():
+    assert extract_json('{"text": "hello wor') == {"text": "hello wor"}
+
+
+def test_truncated_inside_key_keeps_completed_items():
+    text = '{"items":[{"txn_id":"1","category":"Food"},{"txn_id":"2","cat'
+    assert extract_json(text) == {"items": [{"txn_id": "1", "category": "Food"}, {"txn_id": "2"}]}
+
+
+def test_truncated_after_colon():
+    assert extract_json('{"a": ') == {}
+
+
+def test_truncated_after_key_with_earlier_members():
+    assert extract_json('{"a": {"b": 1}, "c"') == {"a": {"b": 1}}
+
+
+def test_truncated_scalar_in_array():
+    assert extract_json('[1, 2, tru') == [1, 2]
+
+
+def test_no_json_raises():
+    with pytest.raises(ValueError):
+        extract_json("no json here")
@@ -22,6 +22,17 @@ def test_reasoning_engine():
     print("ReasoningEngine instantiated successfully.")
     assert engine.app is not None
     
+def test_reasoning_round_trip():
+    # Only runs offline against the fake provider (LLM_PROVIDER=fake)
+    if os.getenv("LLM_PROVIDER", "gemini").lower() != "fake":
+        print("Skipping round trip (set LLM_PROVIDER=fake to run it offline).")
+        return
+    print("--- Testing ReasoningEngine round trip (fake LLM) ---")
+    engine = ReasoningEngine()
+    result = engine.process_query("Hello!")
+    ResponseModel(**result)
+    print(f"Round trip OK: {result['text'][:60]}")
+
 def test_enrichment_agent():
     print("--- Testing EnrichmentAgent ---")
     agent = EnrichmentAgent()
@@ -37,6 +48,7 @@ def test_onboarding_agent():
 if __name__ == "__main__":
     try:
         test_reasoning_engine()
+        test_reasoning_round_trip()
         test_enrichment_agent()
         test_onboarding_agent()
         print("\n✅ All Agents Instantiated & Graphs Compiled Successfully.")